@@ -0,0 +1,97 @@
+# apps/business_intelligence/cache.py
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import F, Sum
+
+from apps.cuentas.cache import LRUCacheTTL
+from .models import DataMartVersion
+
+# Respuestas del dashboard ya calculadas, por worker.
+# La clave incluye la versión del DataMart, así que tras un ETL las entradas viejas
+# simplemente dejan de consultarse y salen por LRU/TTL.
+_cache_dashboard = LRUCacheTTL(
+    maxsize=getattr(settings, 'BI_DASHBOARD_CACHE_MAXSIZE', 256),
+    ttl=getattr(settings, 'BI_DASHBOARD_CACHE_TTL', 900),
+)
+
+# Filtros que realmente cambian el resultado (ver AnalyticsViewSet._aplicar_filtros)
+FILTROS_DASHBOARD = ('start_date', 'end_date', 'especialidad', 'medico', 'sexo_medico')
+# Filtros con icontains: 'Cardio' y 'cardio' dan el mismo resultado
+FILTROS_SIN_MAYUSCULAS = ('especialidad', 'medico')
+
+ALCANCE_GLOBAL = '*'
+
+
+def normalizar_filtros(query_params):
+    """Deja solo los filtros que afectan al dashboard, sin vacíos y en orden fijo."""
+    filtros = {}
+    for nombre in FILTROS_DASHBOARD:
+        valor = (query_params.get(nombre) or '').strip()
+        if not valor:
+            continue
+        filtros[nombre] = valor.lower() if nombre in FILTROS_SIN_MAYUSCULAS else valor
+
+    # El rango de fechas solo se aplica si vienen ambos extremos
+    if not ('start_date' in filtros and 'end_date' in filtros):
+        filtros.pop('start_date', None)
+        filtros.pop('end_date', None)
+    return filtros
+
+
+def version_datamart(alcance):
+    """
+    Versión actual de los datos visibles para el alcance: la del grupo, o la
+    suma de todas para superAdmin (cualquier incremento cambia la suma).
+    """
+    if alcance == ALCANCE_GLOBAL:
+        return DataMartVersion.objects.aggregate(total=Sum('version'))['total'] or 0
+    version = DataMartVersion.objects.filter(grupo_id=alcance).values_list('version', flat=True).first()
+    return version or 0
+
+
+def incrementar_version_datamart(grupo_ids):
+    """Lo llama el ETL para cada grupo cuyos hechos insertó o actualizó."""
+    grupo_ids = {g for g in grupo_ids if g is not None}
+    if not grupo_ids:
+        return
+    existentes = set(
+        DataMartVersion.objects.filter(grupo_id__in=grupo_ids).values_list('grupo_id', flat=True)
+    )
+    DataMartVersion.objects.filter(grupo_id__in=existentes).update(version=F('version') + 1)
+    DataMartVersion.objects.bulk_create(
+        [DataMartVersion(grupo_id=g, version=1) for g in grupo_ids - existentes],
+        ignore_conflicts=True,
+    )
+
+
+def clave_dashboard(alcance, filtros, version, fuente):
+    """Clave de cache y ETag: mismo alcance + filtros + versión => misma respuesta."""
+    contenido = json.dumps([alcance, filtros, version, fuente], sort_keys=True)
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+
+def etag_coincide(request, etag):
+    """Compara contra If-None-Match (admite lista de ETags, débiles y '*')."""
+    cabecera = request.headers.get('If-None-Match')
+    if not cabecera:
+        return False
+    candidatos = [e.strip() for e in cabecera.split(',')]
+    return '*' in candidatos or any(e.removeprefix('W/') == etag for e in candidatos)
+
+
+def obtener_respuesta(clave):
+    return _cache_dashboard.get(clave)
+
+
+def guardar_respuesta(clave, datos):
+    _cache_dashboard.set(clave, datos)
+
+
+def estadisticas():
+    return _cache_dashboard.stats()
+
+
+def limpiar():
+    _cache_dashboard.clear()
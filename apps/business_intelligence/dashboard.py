@@ -0,0 +1,188 @@
+from django.db import connections
+from django.db.models import Case, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, ExtractHour
+
+# ==========================================
+# FUENTES DEL DASHBOARD
+# ==========================================
+# Cada fuente dice cómo obtener, por fila, el conteo de citas, las métricas de
+# duración y las columnas demográficas. Así el mismo motor sirve sobre los
+# agregados del ETL (AggCitasDiario) o directamente sobre FactCitas.
+
+FUENTE_AGREGADOS = {
+    'conteo': F('total_citas'),
+    'duracion_total': F('duracion_total'),
+    'duracion_registros': F('duracion_registros'),
+    'grupo_etario': F('grupo_etario'),
+    'genero': F('genero_paciente'),
+    'hora': F('hora'),
+}
+
+FUENTE_HECHOS = {
+    'conteo': Value(1),
+    'duracion_total': Coalesce('duracion_minutos', 0),
+    'duracion_registros': Case(When(duracion_minutos__isnull=False, then=Value(1)), default=Value(0)),
+    'grupo_etario': F('paciente__grupo_etario'),
+    'genero': F('paciente__genero'),
+    'hora': Cast(ExtractHour('hora_inicio'), IntegerField()),
+}
+
+ES_REALIZADA = Q(estado__codigo_estado='REALIZADA')
+ES_CANCELACION = Q(estado__es_cancelacion=True)
+
+# Conjuntos de agrupación del dashboard (nombre -> columnas)
+CONJUNTOS = {
+    'tendencia': ('d_mes_nombre', 'd_mes'),
+    'medico': ('d_medico',),
+    'edad': ('d_edad',),
+    'sexo': ('d_sexo',),
+    'heatmap': ('d_dia_nombre', 'd_dia', 'd_hora'),
+    'especialidad': ('d_especialidad',),
+    'estado': ('d_estado',),
+}
+
+MEDIDAS = ('n', 'n_realizadas', 'n_canceladas', 'dur_total_realizadas', 'dur_registros_realizadas')
+
+
+def _filas_por_cita(queryset, fuente):
+    """Proyección fila a fila: dimensiones del dashboard + medidas condicionales."""
+    conteo = fuente['conteo']
+    return queryset.values(
+        d_mes_nombre=F('fecha_cita__nombre_mes'),
+        d_mes=F('fecha_cita__mes'),
+        d_medico=F('medico__nombre_completo'),
+        d_edad=fuente['grupo_etario'],
+        d_sexo=fuente['genero'],
+        d_dia_nombre=F('fecha_cita__nombre_dia'),
+        d_dia=F('fecha_cita__dia_semana'),
+        d_hora=fuente['hora'],
+        d_especialidad=F('especialidad__nombre_especialidad'),
+        d_estado=F('estado__descripcion_estado'),
+        n=conteo,
+        n_realizadas=Case(When(ES_REALIZADA, then=conteo), default=Value(0)),
+        n_canceladas=Case(When(ES_CANCELACION, then=conteo), default=Value(0)),
+        dur_total_realizadas=Case(When(ES_REALIZADA, then=fuente['duracion_total']), default=Value(0)),
+        dur_registros_realizadas=Case(When(ES_REALIZADA, then=fuente['duracion_registros']), default=Value(0)),
+    ).order_by()
+
+
+def calcular_kpis(queryset, fuente):
+    """Todos los KPIs del resumen en un solo escaneo con agregados condicionales."""
+    conteo = fuente['conteo']
+    datos = queryset.aggregate(
+        total=Sum(conteo),
+        realizadas=Sum(conteo, filter=ES_REALIZADA),
+        canceladas=Sum(conteo, filter=ES_CANCELACION),
+        dur_total=Cast(Sum(fuente['duracion_total'], filter=ES_REALIZADA), FloatField()),
+        dur_registros=Sum(fuente['duracion_registros'], filter=ES_REALIZADA),
+    )
+    total = datos['total'] or 0
+    canceladas = datos['canceladas'] or 0
+    duracion_avg = datos['dur_total'] / datos['dur_registros'] if datos['dur_registros'] else None
+    return {
+        "total_citas": total,
+        "realizadas": datos['realizadas'] or 0,
+        "canceladas": canceladas,
+        "tasa_cancelacion": round((canceladas / total) * 100, 1) if total > 0 else 0,
+        "duracion_promedio": round(duracion_avg, 1) if duracion_avg else 0,
+    }
+
+
+def _desglose_grouping_sets(queryset, fuente):
+    """PostgreSQL: todos los desgloses en una sola consulta con GROUPING SETS."""
+    sql_filas, params = _filas_por_cita(queryset, fuente).query.sql_with_params()
+
+    columnas = [c for cols in CONJUNTOS.values() for c in cols]
+    marcas = [f'GROUPING({cols[0]}) AS g_{nombre}' for nombre, cols in CONJUNTOS.items()]
+    sumas = [f'SUM({m}) AS {m}' for m in MEDIDAS]
+    sets = ', '.join('(' + ', '.join(cols) + ')' for cols in CONJUNTOS.values())
+    sql = (
+        f"SELECT {', '.join(columnas + marcas + sumas)} "
+        f"FROM ({sql_filas}) AS filas "
+        f"GROUP BY GROUPING SETS ({sets})"
+    )
+
+    resultado = {nombre: [] for nombre in CONJUNTOS}
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        nombres = [col[0] for col in cursor.description]
+        for valores in cursor.fetchall():
+            fila = dict(zip(nombres, valores))
+            for nombre in CONJUNTOS:
+                # GROUPING(col) = 0 indica que la fila pertenece a ese conjunto
+                if fila[f'g_{nombre}'] == 0:
+                    resultado[nombre].append(fila)
+                    break
+    return resultado
+
+
+def _desglose_por_conjunto(queryset, fuente):
+    """Otros motores: una consulta GROUP BY por conjunto, con las mismas medidas."""
+    filas = _filas_por_cita(queryset, fuente)
+    resultado = {}
+    for nombre, cols in CONJUNTOS.items():
+        resultado[nombre] = list(
+            filas.values(*cols).annotate(**{m: Sum(m) for m in MEDIDAS}).order_by()
+        )
+    return resultado
+
+
+def _ordenar(filas, clave, desc=False):
+    """Ordena como PostgreSQL: los NULL van al final en ASC y al inicio en DESC."""
+    return sorted(filas, key=lambda f: (f[clave] is None, f[clave] or 0), reverse=desc)
+
+
+def calcular_desglose(queryset, fuente):
+    if connections[queryset.db].vendor == 'postgresql':
+        conjuntos = _desglose_grouping_sets(queryset, fuente)
+    else:
+        conjuntos = _desglose_por_conjunto(queryset, fuente)
+
+    tendencia = _ordenar(
+        [{"fecha_cita__nombre_mes": f['d_mes_nombre'], "fecha_cita__mes": f['d_mes'], "total": f['n']}
+         for f in conjuntos['tendencia']],
+        'fecha_cita__mes',
+    )
+    top_medicos = _ordenar(
+        [{"medico__nombre_completo": f['d_medico'], "citas": f['n_realizadas']}
+         for f in conjuntos['medico'] if f['n_realizadas']],
+        'citas', desc=True,
+    )[:5]
+    dist_edad = _ordenar(
+        [{"paciente__grupo_etario": f['d_edad'], "total": f['n']} for f in conjuntos['edad']],
+        'total', desc=True,
+    )
+    dist_sexo = [{"paciente__genero": f['d_sexo'], "total": f['n']} for f in conjuntos['sexo']]
+    heatmap = sorted(
+        [{"fecha_cita__nombre_dia": f['d_dia_nombre'], "fecha_cita__dia_semana": f['d_dia'],
+          "hora": f['d_hora'], "cantidad": f['n']} for f in conjuntos['heatmap']],
+        key=lambda f: (f['fecha_cita__dia_semana'], f['hora'] is None, f['hora'] or 0),
+    )
+    duracion_especialidad = _ordenar(
+        [{"especialidad__nombre_especialidad": f['d_especialidad'],
+          "promedio_min": (float(f['dur_total_realizadas']) / f['dur_registros_realizadas']
+                           if f['dur_registros_realizadas'] else None)}
+         for f in conjuntos['especialidad'] if f['n_realizadas']],
+        'promedio_min', desc=True,
+    )
+    cancelaciones_por_motivo = _ordenar(
+        [{"estado__descripcion_estado": f['d_estado'], "total": f['n_canceladas']}
+         for f in conjuntos['estado'] if f['n_canceladas']],
+        'total', desc=True,
+    )
+    cancelaciones_por_especialidad = _ordenar(
+        [{"especialidad__nombre_especialidad": f['d_especialidad'], "total": f['n_canceladas']}
+         for f in conjuntos['especialidad'] if f['n_canceladas']],
+        'total', desc=True,
+    )[:5]
+
+    return {
+        "tendencia": tendencia,
+        "top_medicos": top_medicos,
+        "distribucion_edad": dist_edad,
+        "distribucion_sexo": dist_sexo,
+        "heatmap": heatmap,
+        "duracion_por_especialidad": duracion_especialidad,
+        "cancelaciones_por_motivo": cancelaciones_por_motivo,
+        "cancelaciones_por_especialidad": cancelaciones_por_especialidad,
+    }
@@ -1,193 +1,633 @@
-from django.db import transaction
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractHour
 from django.apps import apps
-from datetime import date, datetime
+from django.utils import timezone
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import django
 import locale
+import multiprocessing
 import sys
 import time
+import traceback
 
 # Imports locales
-from .models import DimTiempo, DimMedico, DimEspecialidad, DimPaciente, DimEstadoCita, FactCitas
+from .models import (
+    DimTiempo, DimMedico, DimEspecialidad, DimPaciente, DimEstadoCita, FactCitas, AggCitasDiario, EtlWatermark
+)
+from .cache import incrementar_version_datamart
 
-def run_etl():
-    start_time = time.time()
-    print("--- INICIO ETL (MODO TURBO FINAL) ---")
-    
-    # 1. OBTENER MODELOS
+
+def refrescar_agregados(claves_afectadas):
+    """
+    Recalcula AggCitasDiario solo para los pares (grupo_id, fecha_key) afectados.
+    Borra el resumen de esos días y lo vuelve a agregar desde FactCitas, así
+    también se corrigen hechos actualizados y no solo los insertados.
+    """
+    fechas_por_grupo = defaultdict(set)
+    for grupo_id, fecha_key in claves_afectadas:
+        fechas_por_grupo[grupo_id].add(fecha_key)
+
+    LOTE_FECHAS = 500
+    total_filas = 0
+    for grupo_id, fechas in fechas_por_grupo.items():
+        fechas = sorted(fechas)
+        for i in range(0, len(fechas), LOTE_FECHAS):
+            lote = fechas[i:i + LOTE_FECHAS]
+            AggCitasDiario.objects.filter(grupo_id=grupo_id, fecha_cita_id__in=lote).delete()
+
+            filas = (
+                FactCitas.objects
+                .filter(grupo_id=grupo_id, fecha_cita_id__in=lote)
+                .annotate(hora=ExtractHour('hora_inicio'))
+                .values(
+                    'fecha_cita_id', 'medico_id', 'especialidad_id', 'estado_id',
+                    'paciente__grupo_etario', 'paciente__genero', 'hora',
+                )
+                .annotate(
+                    total=Count('cita_key'),
+                    dur_total=Sum('duracion_minutos'),
+                    dur_registros=Count('duracion_minutos'),
+                )
+                .order_by()
+            )
+            AggCitasDiario.objects.bulk_create([
+                AggCitasDiario(
+                    grupo_id=grupo_id,
+                    fecha_cita_id=f['fecha_cita_id'],
+                    medico_id=f['medico_id'],
+                    especialidad_id=f['especialidad_id'],
+                    estado_id=f['estado_id'],
+                    grupo_etario=f['paciente__grupo_etario'],
+                    genero_paciente=f['paciente__genero'],
+                    hora=f['hora'],
+                    total_citas=f['total'],
+                    duracion_total=f['dur_total'] or 0,
+                    duracion_registros=f['dur_registros'],
+                )
+                for f in filas
+            ], batch_size=2000)
+            total_filas += len(filas)
+    return total_filas
+
+
+def reconstruir_agregados(grupo_id=None):
+    """Reconstruye todos los agregados (o los de un grupo) desde FactCitas."""
+    hechos = FactCitas.objects.all()
+    if grupo_id is not None:
+        hechos = hechos.filter(grupo_id=grupo_id)
+    claves = set(hechos.values_list('grupo_id', 'fecha_cita_id').distinct())
+    return refrescar_agregados(claves)
+
+
+
+
+# ==========================================
+# CARGA INCREMENTAL (MARCAS DE AGUA)
+# ==========================================
+# Cada fuente guarda en EtlWatermark, por clínica, la hora de inicio de la
+# última corrida y la siguiente solo lee lo modificado después (menos un margen,
+# para no perder transacciones que confirmaron tarde). Re-procesar una fila es
+# inocuo porque dimensiones y hechos se escriben con upserts.
+
+ESTADOS_CITA = [
+    ('REALIZADA', 'Cita Realizada', False, True),  # <--- CAMBIADO DE 'COMPLETADA' A 'REALIZADA'
+    ('CONFIRMADA', 'Confirmada', False, False),
+    ('EN_PROCESO', 'En Atención', False, True),
+    ('PENDIENTE', 'Pendiente', False, False),
+    ('CANCELADA', 'Cancelada', True, False),
+    ('NO_ASISTIO', 'No Asistió', True, False),
+]
+
+CAMPOS_HECHO = [
+    'grupo_id', 'fecha_cita', 'medico', 'paciente', 'especialidad', 'estado',
+    'hora_inicio', 'cantidad_citas', 'duracion_minutos', 'tiempo_anticipacion_dias',
+]
+
+FUENTES_WATERMARK = ['medicos', 'pacientes', 'citas', 'grupo_etario']
+
+# Marcas de agua guardadas antes de particionar por clínica
+GRUPO_GLOBAL = 0
+
+# Días de vida en los que cambia el grupo etario (ver _grupo_etario)
+UMBRALES_GRUPO_ETARIO = (13 * 365, 19 * 365, 61 * 365)
+
+BATCH_SIZE = 2000
+
+# Errores de fila que se guardan como muestra en el resumen de cada clínica
+MAX_MUESTRAS_ERROR = 20
+
+# Clave del advisory lock de PostgreSQL que evita dos ETL simultáneos
+LOCK_ETL = 724011
+
+
+class EtlCancelado(Exception):
+    pass
+
+
+class EtlEnCurso(Exception):
+    pass
+
+
+@contextmanager
+def _lock_etl():
+    """Lock de sesión durante toda la corrida (todas las particiones)."""
+    if connection.vendor != 'postgresql':
+        yield  # SQLite ya serializa las escrituras
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [LOCK_ETL])
+        if not cursor.fetchone()[0]:
+            raise EtlEnCurso("Ya hay un ETL en ejecución.")
     try:
-        CitaMedica = apps.get_model('citas_pagos', 'Cita_Medica') 
-        Medico = apps.get_model('doctores', 'Medico')
-        Especialidad = apps.get_model('doctores', 'Especialidad')
-        Paciente = apps.get_model('historiasDiagnosticos', 'Paciente')
-    except LookupError as e:
-        print(f"ERROR CRÍTICO DE NOMBRES: {e}")
-        raise e
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [LOCK_ETL])
+
+
+def _avanzar(progreso, cancelado, porcentaje, paso):
+    """Reporta avance y corta el ETL si se pidió cancelar."""
+    if cancelado is not None and cancelado():
+        raise EtlCancelado("ETL cancelado por el usuario.")
+    if progreso is not None:
+        progreso(porcentaje, paso)
+
 
-    # Configuración Idioma
+def _configurar_idioma():
     try:
         locale.setlocale(locale.LC_TIME, 'es_ES' if sys.platform == 'win32' else 'es_ES.UTF-8') 
     except: pass
 
-    # Usamos atomic para velocidad
-    with transaction.atomic():
-        
-        # --- PASO 1: TIEMPO ---
-        print("1. Procesando Tiempo...")
-        fechas_origen = set(CitaMedica.objects.values_list('fecha', flat=True))
-        fechas_destino = set(DimTiempo.objects.values_list('fecha', flat=True))
-        fechas_nuevas = fechas_origen - fechas_destino
-        
-        if fechas_nuevas:
-            objs_tiempo = []
-            for fecha in fechas_nuevas:
-                fecha_key = int(fecha.strftime('%Y%m%d'))
-                es_finde = fecha.weekday() >= 5
-                semestre = 1 if fecha.month <= 6 else 2
-                trimestre = (fecha.month - 1) // 3 + 1
-                objs_tiempo.append(DimTiempo(
-                    fecha_key=fecha_key, fecha=fecha, anio=fecha.year, semestre=semestre,
-                    trimestre=trimestre, mes=fecha.month, dia=fecha.day,
-                    nombre_mes=fecha.strftime('%B').capitalize(),
-                    dia_semana=fecha.weekday() + 1,
-                    nombre_dia=fecha.strftime('%A').capitalize(),
-                    es_fin_de_semana=es_finde
-                ))
-            DimTiempo.objects.bulk_create(objs_tiempo)
-        
-        mapa_tiempo = {d.fecha_key: d for d in DimTiempo.objects.all()}
-
-
-        # --- PASO 2: MÉDICOS ---
-        print("2. Procesando Médicos...")
-        medicos_origen = Medico.objects.select_related('usuario_ptr').all()
-        for m in medicos_origen:
-            DimMedico.objects.update_or_create(
-                id_medico_sistema=m.usuario_ptr_id,
-                defaults={
-                    'nombre_completo': m.usuario_ptr.nombre,
-                    'numero_colegiado': getattr(m, 'numero_colegiado', 'S/N'),
-                    'genero': getattr(m.usuario_ptr, 'sexo', 'X'),
-                    'fecha_registro': m.usuario_ptr.fecha_registro
-                }
-            )
-        mapa_medicos = {d.id_medico_sistema: d for d in DimMedico.objects.all()}
+
+def _modelos_origen():
+    try:
+        return {
+            'CitaMedica': apps.get_model('citas_pagos', 'Cita_Medica'),
+            'Medico': apps.get_model('doctores', 'Medico'),
+            'Especialidad': apps.get_model('doctores', 'Especialidad'),
+            'Paciente': apps.get_model('historiasDiagnosticos', 'Paciente'),
+            'Grupo': apps.get_model('cuentas', 'Grupo'),
+        }
+    except LookupError as e:
+        print(f"ERROR CRÍTICO DE NOMBRES: {e}")
+        raise e
 
 
-        # --- PASO 3: ESPECIALIDADES ---
-        print("3. Procesando Especialidades...")
-        for e in Especialidad.objects.all():
-            DimEspecialidad.objects.update_or_create(
-                id_especialidad_sistema=e.id, defaults={'nombre_especialidad': e.nombre}
-            )
-        mapa_especialidad = {d.id_especialidad_sistema: d for d in DimEspecialidad.objects.all()}
-        esp_general, _ = DimEspecialidad.objects.get_or_create(id_especialidad_sistema=9999, defaults={'nombre_especialidad':'General'})
-
-
-        # --- PASO 4: PACIENTES ---
-        print("4. Procesando Pacientes...")
-        for p in Paciente.objects.select_related('usuario').all():
-            edad = (date.today() - p.usuario.fecha_nacimiento).days // 365 if p.usuario.fecha_nacimiento else 0
-            grupo = 'Adulto'
-            if edad <= 12: grupo = 'Niño'
-            elif edad <= 18: grupo = 'Adolescente'
-            elif edad > 60: grupo = 'Senior'
-
-            DimPaciente.objects.update_or_create(
-                id_paciente_sistema=p.id,
-                defaults={
-                    'numero_historia_clinica': p.numero_historia_clinica,
-                    'nombre_completo': p.usuario.nombre,
-                    'genero': getattr(p.usuario, 'sexo', 'X'),
-                    'fecha_nacimiento': p.usuario.fecha_nacimiento or date(2000,1,1),
-                    'grupo_etario': grupo
-                }
-            )
-        mapa_pacientes = {d.id_paciente_sistema: d for d in DimPaciente.objects.all()}
-
-
-        # --- PASO 5: ESTADOS ---
-        print("5. Procesando Estados...")
-        estados = [
-            ('REALIZADA', 'Cita Realizada', False, True),  # <--- CAMBIADO DE 'COMPLETADA' A 'REALIZADA'
-            ('CONFIRMADA', 'Confirmada', False, False),
-            ('EN_PROCESO', 'En Atención', False, True),
-            ('PENDIENTE', 'Pendiente', False, False),
-            ('CANCELADA', 'Cancelada', True, False),
-            ('NO_ASISTIO', 'No Asistió', True, False),
-        ]
-        for cod, desc, es_cancel, es_asist in estados:
-            DimEstadoCita.objects.update_or_create(
-                codigo_estado=cod, defaults={'descripcion_estado': desc, 'es_cancelacion': es_cancel, 'es_asistencia': es_asist}
+def _leer_watermarks(grupo_id):
+    """Marcas de la clínica; si aún no tiene, se usan las globales (corridas anteriores)."""
+    marcas = {}
+    for fuente, grupo, valor in (
+        EtlWatermark.objects.filter(grupo_id__in=[grupo_id, GRUPO_GLOBAL])
+        .values_list('fuente', 'grupo_id', 'valor')
+    ):
+        if grupo == grupo_id or fuente not in marcas:
+            marcas[fuente] = valor
+    return marcas
+
+
+def _desde(marcas, fuente):
+    valor = marcas.get(fuente)
+    if valor is None:
+        return None
+    return valor - timedelta(seconds=getattr(settings, 'BI_ETL_MARGEN_WATERMARK', 300))
+
+
+def _guardar_watermarks(grupo_id, valor):
+    EtlWatermark.objects.bulk_create(
+        [EtlWatermark(fuente=fuente, grupo_id=grupo_id, valor=valor) for fuente in FUENTES_WATERMARK],
+        update_conflicts=True, unique_fields=['fuente', 'grupo_id'], update_fields=['valor', 'actualizado'],
+    )
+
+
+def _lotes(items, tamanio=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), tamanio):
+        yield items[i:i + tamanio]
+
+
+def _registrar_error(errores, id_cita, mensaje):
+    errores['total'] += 1
+    if len(errores['muestras']) < MAX_MUESTRAS_ERROR:
+        errores['muestras'].append({'id_cita': id_cita, 'error': mensaje})
+
+
+def _grupo_etario(fecha_nacimiento, hoy):
+    edad = (hoy - fecha_nacimiento).days // 365 if fecha_nacimiento else 0
+    if edad <= 12:
+        return 'Niño'
+    if edad <= 18:
+        return 'Adolescente'
+    if edad > 60:
+        return 'Senior'
+    return 'Adulto'
+
+
+def _q_cambio_grupo_etario(desde, hoy):
+    """Pacientes que cruzaron un umbral de edad entre la corrida anterior y hoy."""
+    filtro = Q()
+    for dias in UMBRALES_GRUPO_ETARIO:
+        filtro |= Q(
+            usuario__fecha_nacimiento__gt=desde - timedelta(days=dias),
+            usuario__fecha_nacimiento__lte=hoy - timedelta(days=dias),
+        )
+    return filtro
+
+
+def _cargar_tiempo(fechas):
+    # Ordenadas: varias particiones insertan a la vez y así no se cruzan los locks
+    DimTiempo.objects.bulk_create([
+        DimTiempo(
+            fecha_key=int(fecha.strftime('%Y%m%d')), fecha=fecha, anio=fecha.year,
+            semestre=1 if fecha.month <= 6 else 2,
+            trimestre=(fecha.month - 1) // 3 + 1, mes=fecha.month, dia=fecha.day,
+            nombre_mes=fecha.strftime('%B').capitalize(),
+            dia_semana=fecha.weekday() + 1,
+            nombre_dia=fecha.strftime('%A').capitalize(),
+            es_fin_de_semana=fecha.weekday() >= 5
+        )
+        for fecha in sorted(set(fechas))
+    ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def _upsert_medicos(medicos):
+    filas = medicos.values_list(
+        'usuario_ptr_id', 'nombre', 'numero_colegiado', 'sexo', 'fecha_registro'
+    ).order_by('usuario_ptr_id')
+    DimMedico.objects.bulk_create([
+        DimMedico(
+            id_medico_sistema=medico_id, nombre_completo=nombre,
+            numero_colegiado=colegiado, genero=sexo, fecha_registro=fecha_registro,
+        )
+        for medico_id, nombre, colegiado, sexo, fecha_registro in filas
+    ], batch_size=BATCH_SIZE, update_conflicts=True, unique_fields=['id_medico_sistema'],
+        update_fields=['nombre_completo', 'numero_colegiado', 'genero', 'fecha_registro'])
+    return len(filas)
+
+
+def _cargar_medicos(Medico, grupo_id, desde):
+    medicos = Medico.objects.filter(grupo_id=grupo_id)
+    if desde is not None:
+        # ultimo_login es auto_now: se actualiza en cada save() del usuario
+        medicos = medicos.filter(Q(fecha_registro__gt=desde) | Q(ultimo_login__gt=desde))
+    return _upsert_medicos(medicos)
+
+
+def _upsert_pacientes(pacientes, hoy, grupo_id):
+    """
+    Upsert de pacientes. Retorna (total, claves) donde claves son los
+    (grupo_id, fecha_key) de los hechos de la clínica cuyos pacientes cambiaron
+    de género o grupo etario, porque esos datos están copiados en los agregados.
+    """
+    filas = pacientes.values_list(
+        'id', 'numero_historia_clinica', 'usuario__nombre', 'usuario__sexo', 'usuario__fecha_nacimiento'
+    ).order_by('id')
+
+    claves_afectadas = set()
+    total = 0
+    for lote in _lotes(filas):
+        ids = [f[0] for f in lote]
+        previos = {
+            id_sistema: (genero, grupo)
+            for id_sistema, genero, grupo in DimPaciente.objects.filter(id_paciente_sistema__in=ids)
+            .values_list('id_paciente_sistema', 'genero', 'grupo_etario')
+        }
+
+        dims, cambiaron = [], []
+        for paciente_id, historia, nombre, sexo, fecha_nacimiento in lote:
+            grupo = _grupo_etario(fecha_nacimiento, hoy)
+            dims.append(DimPaciente(
+                id_paciente_sistema=paciente_id,
+                numero_historia_clinica=historia,
+                nombre_completo=nombre,
+                genero=sexo,
+                fecha_nacimiento=fecha_nacimiento or date(2000, 1, 1),
+                grupo_etario=grupo,
+            ))
+            if paciente_id in previos and previos[paciente_id] != (sexo, grupo):
+                cambiaron.append(paciente_id)
+
+        DimPaciente.objects.bulk_create(
+            dims, update_conflicts=True, unique_fields=['id_paciente_sistema'],
+            update_fields=['numero_historia_clinica', 'nombre_completo', 'genero', 'fecha_nacimiento', 'grupo_etario'],
+        )
+        if cambiaron:
+            claves_afectadas.update(
+                FactCitas.objects.filter(grupo_id=grupo_id, paciente__id_paciente_sistema__in=cambiaron)
+                .values_list('grupo_id', 'fecha_cita_id').distinct()
             )
-        mapa_estados = {d.codigo_estado: d for d in DimEstadoCita.objects.all()}
-        estado_default = mapa_estados.get('PENDIENTE')
-
-
-        # --- PASO 6: FACT CITAS ---
-        print("6. Procesando Tabla de Hechos (FACT)...")
-        
-        ids_existentes = set(FactCitas.objects.values_list('id_cita_sistema', flat=True))
-        
-        citas_queryset = CitaMedica.objects.exclude(id__in=ids_existentes).select_related(
-            'bloque_horario__medico', 'paciente', 'bloque_horario'
-        ).prefetch_related('bloque_horario__medico__especialidades')
-
-        nuevos_hechos = []
-        BATCH_SIZE = 2000 
-        total_citas = citas_queryset.count()
-        print(f"-> {total_citas} citas nuevas detectadas.")
-
-        # AQUÍ ESTABA EL ERROR: Agregamos chunk_size=2000
-        for i, c in enumerate(citas_queryset.iterator(chunk_size=2000), 1):
-            try:
-                fecha_key = int(c.fecha.strftime('%Y%m%d'))
-                obj_tiempo = mapa_tiempo.get(fecha_key)
-                
-                medico_id = c.bloque_horario.medico.usuario_ptr_id
-                obj_medico = mapa_medicos.get(medico_id)
-                
-                obj_paciente = mapa_pacientes.get(c.paciente.id)
-                
-                estado_code = c.estado_cita if c.estado_cita else 'PENDIENTE'
-                obj_estado = mapa_estados.get(estado_code, estado_default)
-
-                obj_especialidad = esp_general
-                esps = c.bloque_horario.medico.especialidades.all()
-                if esps:
-                    first_esp_id = esps[0].id
-                    obj_especialidad = mapa_especialidad.get(first_esp_id, esp_general)
-
-                duracion = 30
-                if c.hora_inicio and c.hora_fin:
-                    dummy = date.today()
-                    duracion = (datetime.combine(dummy, c.hora_fin) - datetime.combine(dummy, c.hora_inicio)).seconds // 60
-                
-                anticipacion = (c.fecha - c.fecha_creacion.date()).days if c.fecha_creacion else 0
-
-                if obj_tiempo and obj_medico and obj_paciente:
-                    nuevos_hechos.append(FactCitas(
-                        fecha_cita=obj_tiempo,
-                        medico=obj_medico,
-                        paciente=obj_paciente,
-                        especialidad=obj_especialidad,
-                        estado=obj_estado,
-                        id_cita_sistema=c.id,
-                        grupo_id=c.grupo_id,
-                        hora_inicio=c.hora_inicio,
-                        cantidad_citas=1,
-                        duracion_minutos=duracion,
-                        tiempo_anticipacion_dias=anticipacion
-                    ))
-
-                if len(nuevos_hechos) >= BATCH_SIZE:
-                    FactCitas.objects.bulk_create(nuevos_hechos)
-                    print(f"   Guardado lote de {BATCH_SIZE} registros... (Progreso: {i}/{total_citas})", end='\r')
-                    nuevos_hechos = [] 
-
-            except Exception as e:
+        total += len(lote)
+    return total, claves_afectadas
+
+
+def _cargar_pacientes(Paciente, grupo_id, desde, desde_edad, hoy):
+    pacientes = Paciente.objects.filter(usuario__grupo_id=grupo_id)
+    if desde is not None:
+        filtro = Q(fecha_modificacion__gt=desde) | Q(usuario__ultimo_login__gt=desde)
+        if desde_edad is not None:
+            filtro |= _q_cambio_grupo_etario(desde_edad, hoy)
+        pacientes = pacientes.filter(filtro)
+    return _upsert_pacientes(pacientes, hoy, grupo_id)
+
+
+def _cargar_especialidades(Especialidad):
+    """El catálogo es chico: se compara completo y solo se escribe lo distinto."""
+    destino = dict(DimEspecialidad.objects.values_list('id_especialidad_sistema', 'nombre_especialidad'))
+    cambios = [
+        DimEspecialidad(id_especialidad_sistema=esp_id, nombre_especialidad=nombre)
+        for esp_id, nombre in Especialidad.objects.values_list('id', 'nombre')
+        if destino.get(esp_id) != nombre
+    ]
+    if 9999 not in destino:
+        cambios.append(DimEspecialidad(id_especialidad_sistema=9999, nombre_especialidad='General'))
+    if cambios:
+        DimEspecialidad.objects.bulk_create(
+            cambios, update_conflicts=True, unique_fields=['id_especialidad_sistema'],
+            update_fields=['nombre_especialidad'],
+        )
+    return len(cambios)
+
+
+def _cargar_estados():
+    DimEstadoCita.objects.bulk_create(
+        [
+            DimEstadoCita(codigo_estado=cod, descripcion_estado=desc, es_cancelacion=es_cancel, es_asistencia=es_asist)
+            for cod, desc, es_cancel, es_asist in ESTADOS_CITA
+        ],
+        update_conflicts=True, unique_fields=['codigo_estado'],
+        update_fields=['descripcion_estado', 'es_cancelacion', 'es_asistencia'],
+    )
+
+
+def _mapa_dims(model, campo_id, campo_key, ids):
+    return dict(model.objects.filter(**{f'{campo_id}__in': ids}).values_list(campo_id, campo_key))
+
+
+def _sincronizar_hechos(citas, contexto, errores):
+    """
+    Upsert de un lote de citas en FactCitas (inserta las nuevas y actualiza las
+    que cambiaron de estado, fecha, horario, etc.). Retorna las claves
+    (grupo_id, fecha_key) afectadas, tanto las de antes como las de ahora.
+    """
+    modelos = contexto['modelos']
+    ids_medicos = {c.bloque_horario.medico_id for c in citas}
+    ids_pacientes = {c.paciente_id for c in citas}
+    mapa_medicos = _mapa_dims(DimMedico, 'id_medico_sistema', 'medico_key', ids_medicos)
+    mapa_pacientes = _mapa_dims(DimPaciente, 'id_paciente_sistema', 'paciente_key', ids_pacientes)
+
+    # Médicos/pacientes que aún no están en el DataMart (p.ej. usuarios sin
+    # grupo o de otra clínica): se cargan al vuelo
+    faltan_medicos = ids_medicos - mapa_medicos.keys()
+    if faltan_medicos:
+        _upsert_medicos(modelos['Medico'].objects.filter(usuario_ptr_id__in=faltan_medicos))
+        mapa_medicos.update(_mapa_dims(DimMedico, 'id_medico_sistema', 'medico_key', faltan_medicos))
+    faltan_pacientes = ids_pacientes - mapa_pacientes.keys()
+    if faltan_pacientes:
+        _upsert_pacientes(modelos['Paciente'].objects.filter(id__in=faltan_pacientes), contexto['hoy'], contexto['grupo_id'])
+        mapa_pacientes.update(_mapa_dims(DimPaciente, 'id_paciente_sistema', 'paciente_key', faltan_pacientes))
+
+    # Dónde estaban los hechos que ya existían (por si la cita cambió de fecha)
+    claves_afectadas = set(
+        FactCitas.objects.filter(id_cita_sistema__in=[c.id for c in citas]).values_list('grupo_id', 'fecha_cita_id')
+    )
+
+    mapa_estados = contexto['mapa_estados']
+    mapa_especialidad = contexto['mapa_especialidad']
+    estado_default = mapa_estados.get('PENDIENTE')
+    esp_general = mapa_especialidad.get(9999)
+    hechos = []
+    for c in citas:
+        try:
+            fecha_key = int(c.fecha.strftime('%Y%m%d'))
+            medico_key = mapa_medicos.get(c.bloque_horario.medico_id)
+            paciente_key = mapa_pacientes.get(c.paciente_id)
+            if not (medico_key and paciente_key):
+                _registrar_error(errores, c.id, "Médico o paciente inexistente en el sistema de origen.")
                 continue
 
-        if nuevos_hechos:
-            FactCitas.objects.bulk_create(nuevos_hechos)
-    
+            estado_code = c.estado_cita if c.estado_cita else 'PENDIENTE'
+            estado_key = mapa_estados.get(estado_code, estado_default)
+
+            especialidad_key = esp_general
+            esps = c.bloque_horario.medico.especialidades.all()
+            if esps:
+                especialidad_key = mapa_especialidad.get(esps[0].id, esp_general)
+
+            duracion = 30
+            if c.hora_inicio and c.hora_fin:
+                dummy = date.today()
+                duracion = (datetime.combine(dummy, c.hora_fin) - datetime.combine(dummy, c.hora_inicio)).seconds // 60
+
+            anticipacion = (c.fecha - c.fecha_creacion.date()).days if c.fecha_creacion else 0
+
+            hechos.append(FactCitas(
+                fecha_cita_id=fecha_key,
+                medico_id=medico_key,
+                paciente_id=paciente_key,
+                especialidad_id=especialidad_key,
+                estado_id=estado_key,
+                id_cita_sistema=c.id,
+                grupo_id=c.grupo_id,
+                hora_inicio=c.hora_inicio,
+                cantidad_citas=1,
+                duracion_minutos=duracion,
+                tiempo_anticipacion_dias=anticipacion
+            ))
+            claves_afectadas.add((c.grupo_id, fecha_key))
+        except Exception as e:
+            # Antes se descartaba en silencio; ahora queda en el resumen de la clínica
+            _registrar_error(errores, c.id, f"{type(e).__name__}: {e}")
+
+    if hechos:
+        FactCitas.objects.bulk_create(
+            hechos, update_conflicts=True, unique_fields=['id_cita_sistema'], update_fields=CAMPOS_HECHO,
+        )
+    return claves_afectadas, len(hechos)
+
+
+# ==========================================
+# PARTICIONES POR CLÍNICA
+# ==========================================
+
+def etl_particion(grupo_id, cancelado=None):
+    """
+    ETL de una clínica: su propia transacción y sus propias marcas de agua.
+    Si falla, solo se revierte esta clínica y el error queda en el resumen.
+    Es una función de módulo para poder ejecutarse en un proceso del pool.
+    """
+    _configurar_idioma()
+    t0 = time.time()
+    resumen = {
+        'grupo_id': grupo_id, 'ok': False, 'citas': 0, 'filas_agregados': 0,
+        'errores_filas': 0, 'muestras_errores': [], 'error': None, 'segundos': 0,
+    }
+    errores = {'total': 0, 'muestras': []}
+    modelos = _modelos_origen()
+    inicio = timezone.now()
+    hoy = timezone.localdate()
+
+    try:
+        with transaction.atomic():
+            marcas = _leer_watermarks(grupo_id)
+            desde_edad = timezone.localdate(marcas['grupo_etario']) if marcas.get('grupo_etario') else None
+
+            citas_cambiadas = modelos['CitaMedica'].objects.filter(grupo_id=grupo_id)
+            desde_citas = _desde(marcas, 'citas')
+            if desde_citas is not None:
+                citas_cambiadas = citas_cambiadas.filter(fecha_modificacion__gt=desde_citas)
+            claves_afectadas = set()  # (grupo_id, fecha_key) para refrescar los agregados
+
+            # Dimensiones propias de la clínica
+            _cargar_tiempo(citas_cambiadas.values_list('fecha', flat=True).distinct().order_by())
+            _cargar_medicos(modelos['Medico'], grupo_id, _desde(marcas, 'medicos'))
+            _, claves_pacientes = _cargar_pacientes(
+                modelos['Paciente'], grupo_id, _desde(marcas, 'pacientes'), desde_edad, hoy
+            )
+            claves_afectadas |= claves_pacientes
+
+            contexto = {
+                'grupo_id': grupo_id,
+                'hoy': hoy,
+                'modelos': modelos,
+                'mapa_especialidad': dict(DimEspecialidad.objects.values_list('id_especialidad_sistema', 'especialidad_key')),
+                'mapa_estados': dict(DimEstadoCita.objects.values_list('codigo_estado', 'estado_key')),
+            }
+
+            # Hechos
+            citas_queryset = citas_cambiadas.select_related(
+                'bloque_horario__medico'
+            ).prefetch_related('bloque_horario__medico__especialidades').order_by()
+            lote = []
+            for c in citas_queryset.iterator(chunk_size=BATCH_SIZE):
+                lote.append(c)
+                if len(lote) >= BATCH_SIZE:
+                    _avanzar(None, cancelado, 0, '')
+                    claves, n = _sincronizar_hechos(lote, contexto, errores)
+                    claves_afectadas |= claves
+                    resumen['citas'] += n
+                    lote = []
+            if lote:
+                claves, n = _sincronizar_hechos(lote, contexto, errores)
+                claves_afectadas |= claves
+                resumen['citas'] += n
+
+            # Agregados del dashboard
+            if not AggCitasDiario.objects.filter(grupo_id=grupo_id).exists():
+                # Primera vez (o tabla vaciada): se reconstruye la clínica desde los hechos
+                resumen['filas_agregados'] = reconstruir_agregados(grupo_id)
+                hay_cambios = resumen['filas_agregados'] > 0
+            else:
+                resumen['filas_agregados'] = refrescar_agregados(claves_afectadas)
+                hay_cambios = bool(claves_afectadas)
+
+            # Versión del DataMart: invalida el cache del dashboard de esta clínica
+            if hay_cambios:
+                incrementar_version_datamart([grupo_id])
+
+            _guardar_watermarks(grupo_id, inicio)
+        resumen['ok'] = True
+    except EtlCancelado:
+        raise
+    except Exception as e:
+        resumen['error'] = f"{type(e).__name__}: {e}"
+        print(f"Error ETL en clínica {grupo_id}: {e}")
+        traceback.print_exc()
+
+    resumen['errores_filas'] = errores['total']
+    resumen['muestras_errores'] = errores['muestras']
+    resumen['segundos'] = round(time.time() - t0, 2)
+    return resumen
+
+
+def _procesos_etl(procesos, particiones):
+    # SQLite no admite escrituras concurrentes: ahí siempre en serie
+    if connection.vendor != 'postgresql':
+        return 1
+    procesos = procesos or getattr(settings, 'BI_ETL_PROCESOS', 4)
+    return max(1, min(procesos, particiones))
+
+
+def _resumen_fallido(grupo_id, error):
+    return {
+        'grupo_id': grupo_id, 'ok': False, 'citas': 0, 'filas_agregados': 0,
+        'errores_filas': 0, 'muestras_errores': [], 'error': f"{type(error).__name__}: {error}", 'segundos': 0,
+    }
+
+
+def run_etl(grupo_id=None, progreso=None, cancelado=None, procesos=None):
+    """
+    Ejecuta el ETL de una clínica (grupo_id) o de todas. Cada clínica es una
+    partición independiente; en PostgreSQL se procesan en paralelo en un pool
+    de procesos (BI_ETL_PROCESOS).
+    progreso(porcentaje, paso): callback opcional de avance.
+    cancelado(): callback opcional; si retorna True se dejan de lanzar particiones
+    y se levanta EtlCancelado (las clínicas ya terminadas quedan confirmadas).
+    Retorna un resumen por clínica.
+    """
+    start_time = time.time()
+    print("--- INICIO ETL (INCREMENTAL POR CLÍNICA) ---")
+
+    modelos = _modelos_origen()
+    _configurar_idioma()
+
+    with _lock_etl():
+        # --- CATÁLOGOS COMPARTIDOS ---
+        print("1. Procesando Especialidades y Estados...")
+        _avanzar(progreso, cancelado, 5, "Catálogos")
+        with transaction.atomic():
+            _cargar_especialidades(modelos['Especialidad'])
+            _cargar_estados()
+
+        if grupo_id is not None:
+            grupos = [grupo_id]
+        else:
+            grupos = list(modelos['Grupo'].objects.order_by('pk').values_list('pk', flat=True))
+        procesos = _procesos_etl(procesos, len(grupos))
+        print(f"2. Procesando {len(grupos)} clínica(s) con {procesos} proceso(s)...")
+
+        resultados = []
+
+        def registrar(resultado, completadas):
+            resultados.append(resultado)
+            estado = "OK" if resultado['ok'] else f"ERROR ({resultado['error']})"
+            print(f"   Clínica {resultado['grupo_id']}: {estado} - {resultado['citas']} citas, "
+                  f"{resultado['errores_filas']} filas con error, {resultado['segundos']}s")
+            _avanzar(progreso, cancelado, 10 + 85 * completadas // max(len(grupos), 1),
+                     f"Clínicas {completadas}/{len(grupos)}")
+
+        if procesos <= 1:
+            for i, g in enumerate(grupos, 1):
+                registrar(etl_particion(g, cancelado=cancelado), i)
+        else:
+            # spawn: procesos limpios (sin conexiones ni hilos heredados del worker)
+            contexto = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto, initializer=django.setup) as pool:
+                futuros = {pool.submit(etl_particion, g): g for g in grupos}
+                try:
+                    for i, futuro in enumerate(as_completed(futuros), 1):
+                        try:
+                            resultado = futuro.result()
+                        except Exception as e:
+                            # El proceso murió (p.ej. BrokenProcessPool): se reporta la clínica
+                            resultado = _resumen_fallido(futuros[futuro], e)
+                        registrar(resultado, i)
+                except EtlCancelado:
+                    for futuro in futuros:
+                        futuro.cancel()
+                    raise
+
+    fallidas = [r['grupo_id'] for r in resultados if not r['ok']]
     total_time = time.time() - start_time
-    print(f"\n--- FIN ETL EXITOSO EN {total_time:.2f} SEGUNDOS ---")
\ No newline at end of file
+    if fallidas:
+        print(f"\n--- FIN ETL CON ERRORES EN {total_time:.2f} SEGUNDOS (clínicas con error: {fallidas}) ---")
+    else:
+        print(f"\n--- FIN ETL EXITOSO EN {total_time:.2f} SEGUNDOS ---")
+    return {
+        'particiones': sorted(resultados, key=lambda r: r['grupo_id']),
+        'fallidas': fallidas,
+        'segundos': round(total_time, 2),
+    }
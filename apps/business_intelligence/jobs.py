@@ -0,0 +1,127 @@
+# apps/business_intelligence/jobs.py
+import threading
+import traceback
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from .etl import EtlCancelado, EtlEnCurso, run_etl
+from .models import EtlJob
+
+
+def encolar_etl(grupo_id=None, solicitado_por=''):
+    """
+    Crea un trabajo de ETL pendiente. Si ya hay uno pendiente para el mismo
+    alcance se reutiliza: el ETL es incremental y una sola corrida basta.
+    Retorna (job, creado).
+    """
+    existente = EtlJob.objects.filter(grupo_id=grupo_id, estado='PENDIENTE').first()
+    if existente:
+        return existente, False
+    return EtlJob.objects.create(grupo_id=grupo_id, solicitado_por=solicitado_por), True
+
+
+def cancelar_job(job):
+    """Un pendiente se cancela de inmediato; uno en proceso se marca y el worker lo aborta."""
+    if job.estado == 'PENDIENTE':
+        actualizados = EtlJob.objects.filter(pk=job.pk, estado='PENDIENTE').update(
+            estado='CANCELADO', fecha_fin=timezone.now(), mensaje='Cancelado antes de iniciar.'
+        )
+        if actualizados:
+            return True
+        job.refresh_from_db()
+    if job.estado == 'EN_PROCESO':
+        EtlJob.objects.filter(pk=job.pk).update(cancelacion_solicitada=True)
+        return True
+    return False
+
+
+def marcar_huerfanos(minutos=10):
+    """Trabajos EN_PROCESO sin latido (el worker murió): se dan por fallidos."""
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return EtlJob.objects.filter(estado='EN_PROCESO', actualizado__lt=limite).update(
+        estado='FALLIDO', fecha_fin=timezone.now(), mensaje='Worker interrumpido (sin latido).'
+    )
+
+
+def tomar_siguiente_job():
+    """Reclama el pendiente más antiguo. Nunca corre un ETL si ya hay otro en proceso."""
+    if EtlJob.objects.filter(estado='EN_PROCESO').exists():
+        return None
+    for job_id in EtlJob.objects.filter(estado='PENDIENTE').order_by('fecha_creacion').values_list('pk', flat=True)[:10]:
+        # El UPDATE condicional hace de reclamo atómico entre varios workers
+        reclamado = EtlJob.objects.filter(pk=job_id, estado='PENDIENTE').update(
+            estado='EN_PROCESO', fecha_inicio=timezone.now(), progreso=0, paso='Iniciando'
+        )
+        if reclamado:
+            return EtlJob.objects.get(pk=job_id)
+    return None
+
+
+def ejecutar_job(job, intervalo_latido=1.0):
+    """
+    Corre el ETL en un hilo aparte. Este hilo (con su propia conexión, fuera de la
+    transacción del ETL) publica el progreso y revisa si pidieron cancelar.
+    """
+    avance = {'progreso': 0, 'paso': 'Iniciando'}
+    cancelar = threading.Event()
+    resultado = {}
+
+    def progreso(porcentaje, paso):
+        avance['progreso'], avance['paso'] = porcentaje, paso
+
+    def correr():
+        try:
+            resultado['resumen'] = run_etl(grupo_id=job.grupo_id, progreso=progreso, cancelado=cancelar.is_set)
+        except Exception as e:
+            resultado['error'] = e
+            resultado['traza'] = traceback.format_exc()
+        finally:
+            connection.close()
+
+    hilo = threading.Thread(target=correr, name=f'etl-job-{job.pk}', daemon=True)
+    hilo.start()
+    detenido = False
+    while hilo.is_alive():
+        try:
+            hilo.join(intervalo_latido)
+        except KeyboardInterrupt:
+            # Ctrl+C / SIGINT: se aborta el ETL (rollback) y se deja registrado
+            cancelar.set()
+            detenido = True
+            continue
+        EtlJob.objects.filter(pk=job.pk).update(
+            progreso=avance['progreso'], paso=avance['paso'], actualizado=timezone.now()
+        )
+        if EtlJob.objects.filter(pk=job.pk, cancelacion_solicitada=True).exists():
+            cancelar.set()
+
+    error = resultado.get('error')
+    resumen = resultado.get('resumen')
+    cambios = {'fecha_fin': timezone.now(), 'resultado': resumen}
+    if error is None and resumen['fallidas']:
+        # Cada clínica es independiente: las que terminaron bien quedan confirmadas
+        total = len(resumen['particiones'])
+        estado = 'FALLIDO' if len(resumen['fallidas']) == total else 'PARCIAL'
+        cambios.update(
+            estado=estado, progreso=100, paso='Finalizado',
+            mensaje=f"{len(resumen['fallidas'])} de {total} clínica(s) con error: {resumen['fallidas']}",
+        )
+    elif error is None:
+        cambios.update(estado='COMPLETADO', progreso=100, paso='Finalizado', mensaje='DataMart actualizado exitosamente.')
+    elif isinstance(error, EtlCancelado):
+        cambios.update(estado='CANCELADO', mensaje='Worker detenido.' if detenido else str(error))
+    elif isinstance(error, EtlEnCurso):
+        # Otro proceso tiene el lock: vuelve a la cola
+        cambios.update(estado='PENDIENTE', fecha_inicio=None, fecha_fin=None, progreso=0, paso='', mensaje=str(error))
+    else:
+        print(f"Error ETL (job #{job.pk}): {error}")
+        print(resultado['traza'])
+        cambios.update(estado='FALLIDO', mensaje=str(error))
+    EtlJob.objects.filter(pk=job.pk).update(**cambios)
+
+    if detenido:
+        raise KeyboardInterrupt
+    job.refresh_from_db()
+    return job
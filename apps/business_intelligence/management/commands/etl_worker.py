@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.business_intelligence.jobs import ejecutar_job, marcar_huerfanos, tomar_siguiente_job
+
+
+class Command(BaseCommand):
+    help = "Procesa los trabajos de ETL encolados desde la API (POST /analytics/run-etl/)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=5, help="Segundos entre revisiones de la cola.")
+        parser.add_argument('--una-vez', action='store_true', help="Procesa lo pendiente y termina.")
+        parser.add_argument(
+            '--minutos-huerfano', type=int, default=10,
+            help="Minutos sin latido para dar por muerto un trabajo EN_PROCESO.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Worker de ETL iniciado. Ctrl+C para detener.")
+        try:
+            while True:
+                huerfanos = marcar_huerfanos(options['minutos_huerfano'])
+                if huerfanos:
+                    self.stdout.write(self.style.WARNING(f"{huerfanos} trabajo(s) huérfano(s) marcados como FALLIDO."))
+
+                job = tomar_siguiente_job()
+                if job is None:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                self.stdout.write(f"Ejecutando ETL #{job.pk} (grupo: {job.grupo_id or 'todos'})...")
+                job = ejecutar_job(job)
+                estilo = self.style.SUCCESS if job.estado == 'COMPLETADO' else self.style.ERROR
+                self.stdout.write(estilo(f"ETL #{job.pk}: {job.estado}. {job.mensaje}"))
+        except KeyboardInterrupt:
+            self.stdout.write("Worker de ETL detenido.")
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_intelligence', '0002_factcitas_grupo_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggCitasDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grupo_id', models.IntegerField(db_index=True, help_text='ID de la Clínica (Tenant)')),
+                ('grupo_etario', models.CharField(max_length=20)),
+                ('genero_paciente', models.CharField(max_length=1, null=True)),
+                ('hora', models.IntegerField(null=True)),
+                ('total_citas', models.IntegerField(default=0)),
+                ('duracion_total', models.BigIntegerField(default=0)),
+                ('duracion_registros', models.IntegerField(default=0)),
+                ('especialidad', models.ForeignKey(db_column='especialidad_key', on_delete=django.db.models.deletion.CASCADE, to='business_intelligence.dimespecialidad')),
+                ('estado', models.ForeignKey(db_column='estado_key', on_delete=django.db.models.deletion.CASCADE, to='business_intelligence.dimestadocita')),
+                ('fecha_cita', models.ForeignKey(db_column='fecha_cita_key', on_delete=django.db.models.deletion.CASCADE, to='business_intelligence.dimtiempo')),
+                ('medico', models.ForeignKey(db_column='medico_key', on_delete=django.db.models.deletion.CASCADE, to='business_intelligence.dimmedico')),
+            ],
+            options={
+                'db_table': 'agg_citas_diario',
+                'indexes': [models.Index(fields=['grupo_id', 'fecha_cita'], name='agg_citas_d_grupo_i_c1e98a_idx')],
+            },
+        ),
+    ]
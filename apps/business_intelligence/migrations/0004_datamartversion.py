@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_intelligence', '0003_aggcitasdiario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataMartVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grupo_id', models.IntegerField(help_text='ID de la Clínica (Tenant)', unique=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'datamart_version',
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_intelligence', '0004_datamartversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EtlWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fuente', models.CharField(max_length=50, unique=True)),
+                ('valor', models.DateTimeField()),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'etl_watermark',
+            },
+        ),
+        migrations.AlterField(
+            model_name='dimespecialidad',
+            name='id_especialidad_sistema',
+            field=models.IntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='dimestadocita',
+            name='codigo_estado',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='dimmedico',
+            name='id_medico_sistema',
+            field=models.IntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='dimpaciente',
+            name='id_paciente_sistema',
+            field=models.IntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='factcitas',
+            name='id_cita_sistema',
+            field=models.BigIntegerField(unique=True),
+        ),
+    ]
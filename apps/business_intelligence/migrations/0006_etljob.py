@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_intelligence', '0005_etl_incremental'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EtlJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grupo_id', models.IntegerField(blank=True, db_index=True, help_text='Clínica que lo solicitó (NULL = todas)', null=True)),
+                ('solicitado_por', models.CharField(blank=True, max_length=254)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En Proceso'), ('COMPLETADO', 'Completado'), ('FALLIDO', 'Fallido'), ('CANCELADO', 'Cancelado')], db_index=True, default='PENDIENTE', max_length=20)),
+                ('progreso', models.PositiveSmallIntegerField(default=0, help_text='Porcentaje 0-100')),
+                ('paso', models.CharField(blank=True, max_length=100)),
+                ('mensaje', models.TextField(blank=True)),
+                ('cancelacion_solicitada', models.BooleanField(default=False)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True, help_text='Latido del worker mientras corre')),
+            ],
+            options={
+                'db_table': 'etl_job',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
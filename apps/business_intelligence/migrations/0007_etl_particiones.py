@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_intelligence', '0006_etljob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='etljob',
+            name='resultado',
+            field=models.JSONField(blank=True, help_text='Resumen por clínica de la corrida', null=True),
+        ),
+        migrations.AddField(
+            model_name='etlwatermark',
+            name='grupo_id',
+            field=models.IntegerField(default=0, help_text='ID de la Clínica (0 = marca global anterior a las particiones)'),
+        ),
+        migrations.AlterField(
+            model_name='etljob',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En Proceso'), ('COMPLETADO', 'Completado'), ('PARCIAL', 'Completado con errores'), ('FALLIDO', 'Fallido'), ('CANCELADO', 'Cancelado')], db_index=True, default='PENDIENTE', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='etlwatermark',
+            name='fuente',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='etlwatermark',
+            constraint=models.UniqueConstraint(fields=('fuente', 'grupo_id'), name='etl_watermark_fuente_grupo'),
+        ),
+    ]
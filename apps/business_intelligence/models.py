@@ -22,7 +22,7 @@ class DimTiempo(models.Model):
 
 class DimMedico(models.Model):
     medico_key = models.AutoField(primary_key=True)
-    id_medico_sistema = models.IntegerField()  # ID original
+    id_medico_sistema = models.IntegerField(unique=True)  # ID original
     nombre_completo = models.CharField(max_length=200)
     numero_colegiado = models.CharField(max_length=50)
     genero = models.CharField(max_length=1, null=True)
@@ -33,7 +33,7 @@ class DimMedico(models.Model):
 
 class DimEspecialidad(models.Model):
     especialidad_key = models.AutoField(primary_key=True)
-    id_especialidad_sistema = models.IntegerField()
+    id_especialidad_sistema = models.IntegerField(unique=True)
     nombre_especialidad = models.CharField(max_length=100)
 
     class Meta:
@@ -41,7 +41,7 @@ class DimEspecialidad(models.Model):
 
 class DimPaciente(models.Model):
     paciente_key = models.AutoField(primary_key=True)
-    id_paciente_sistema = models.IntegerField()
+    id_paciente_sistema = models.IntegerField(unique=True)
     numero_historia_clinica = models.CharField(max_length=50)
     nombre_completo = models.CharField(max_length=200)
     genero = models.CharField(max_length=1, null=True)
@@ -53,7 +53,7 @@ class DimPaciente(models.Model):
 
 class DimEstadoCita(models.Model):
     estado_key = models.AutoField(primary_key=True)
-    codigo_estado = models.CharField(max_length=50) # REALIZADA, CANCELADA...
+    codigo_estado = models.CharField(max_length=50, unique=True) # REALIZADA, CANCELADA...
     descripcion_estado = models.CharField(max_length=100)
     es_cancelacion = models.BooleanField(default=False)
     es_asistencia = models.BooleanField(default=False)
@@ -81,7 +81,7 @@ class FactCitas(models.Model):
     estado = models.ForeignKey(DimEstadoCita, on_delete=models.CASCADE, db_column='estado_key')
     
     # Degenerate Dimensions
-    id_cita_sistema = models.BigIntegerField()
+    id_cita_sistema = models.BigIntegerField(unique=True)
     hora_inicio = models.TimeField(null=True)
     
     # Métricas
@@ -94,4 +94,108 @@ class FactCitas(models.Model):
         # Opcional: Índice compuesto por si filtras mucho por grupo y fecha
         indexes = [
             models.Index(fields=['grupo_id', 'fecha_cita']),
-        ]
\ No newline at end of file
+        ]
+
+# ==========================================
+# AGREGADOS (ROLLUPS) PARA EL DASHBOARD
+# ==========================================
+
+class AggCitasDiario(models.Model):
+    """
+    Resumen de FactCitas por (grupo, fecha, médico, especialidad, estado,
+    grupo etario, género del paciente, hora). Lo mantiene el ETL y el dashboard
+    agrega sobre esta tabla en lugar de escanear la tabla de hechos.
+    """
+    grupo_id = models.IntegerField(db_index=True, help_text="ID de la Clínica (Tenant)")
+
+    fecha_cita = models.ForeignKey(DimTiempo, on_delete=models.CASCADE, db_column='fecha_cita_key')
+    medico = models.ForeignKey(DimMedico, on_delete=models.CASCADE, db_column='medico_key')
+    especialidad = models.ForeignKey(DimEspecialidad, on_delete=models.CASCADE, db_column='especialidad_key')
+    estado = models.ForeignKey(DimEstadoCita, on_delete=models.CASCADE, db_column='estado_key')
+    grupo_etario = models.CharField(max_length=20)
+    genero_paciente = models.CharField(max_length=1, null=True)
+    hora = models.IntegerField(null=True)
+
+    # Métricas aditivas (el promedio se obtiene como duracion_total / duracion_registros)
+    total_citas = models.IntegerField(default=0)
+    duracion_total = models.BigIntegerField(default=0)
+    duracion_registros = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'agg_citas_diario'
+        indexes = [
+            models.Index(fields=['grupo_id', 'fecha_cita']),
+        ]
+
+
+class DataMartVersion(models.Model):
+    """
+    Versión de los datos del DataMart por clínica. El ETL la incrementa cada vez
+    que inserta o actualiza hechos de ese grupo; el cache del dashboard la usa
+    para saber si una respuesta guardada sigue vigente.
+    """
+    grupo_id = models.IntegerField(unique=True, help_text="ID de la Clínica (Tenant)")
+    version = models.PositiveIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'datamart_version'
+
+
+class EtlWatermark(models.Model):
+    """
+    Marca de agua por fuente y clínica del ETL: hasta qué momento ya se
+    procesaron los cambios del sistema transaccional. La siguiente corrida
+    solo lee lo modificado después de esta marca.
+    """
+    fuente = models.CharField(max_length=50)
+    grupo_id = models.IntegerField(default=0, help_text="ID de la Clínica (0 = marca global anterior a las particiones)")
+    valor = models.DateTimeField()
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'etl_watermark'
+        constraints = [
+            models.UniqueConstraint(fields=['fuente', 'grupo_id'], name='etl_watermark_fuente_grupo'),
+        ]
+
+
+# ==========================================
+# TRABAJOS DEL ETL (SEGUNDO PLANO)
+# ==========================================
+
+class EtlJob(models.Model):
+    """
+    Ejecución del ETL solicitada desde la API. La procesa el comando
+    `python manage.py etl_worker`, fuera del ciclo request/response.
+    """
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En Proceso'),
+        ('COMPLETADO', 'Completado'),
+        ('PARCIAL', 'Completado con errores'),
+        ('FALLIDO', 'Fallido'),
+        ('CANCELADO', 'Cancelado'),
+    ]
+    ESTADOS_ACTIVOS = ('PENDIENTE', 'EN_PROCESO')
+
+    grupo_id = models.IntegerField(null=True, blank=True, db_index=True, help_text="Clínica que lo solicitó (NULL = todas)")
+    solicitado_por = models.CharField(max_length=254, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE', db_index=True)
+    progreso = models.PositiveSmallIntegerField(default=0, help_text="Porcentaje 0-100")
+    paso = models.CharField(max_length=100, blank=True)
+    mensaje = models.TextField(blank=True)
+    cancelacion_solicitada = models.BooleanField(default=False)
+    resultado = models.JSONField(null=True, blank=True, help_text="Resumen por clínica de la corrida")
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    actualizado = models.DateTimeField(auto_now=True, help_text="Latido del worker mientras corre")
+
+    class Meta:
+        db_table = 'etl_job'
+        ordering = ['-fecha_creacion']
+
+    def __str__(self):
+        return f"ETL #{self.pk} ({self.estado})"
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import FactCitas
+from .models import FactCitas, EtlJob
 
 class KPISerializer(serializers.Serializer):
     total_citas = serializers.IntegerField()
@@ -13,4 +13,13 @@ class RankingMedicoSerializer(serializers.Serializer):
 
 class TendenciaMensualSerializer(serializers.Serializer):
     mes = serializers.CharField()
-    total = serializers.IntegerField()
\ No newline at end of file
+    total = serializers.IntegerField()
+
+class EtlJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EtlJob
+        fields = [
+            'id', 'grupo_id', 'solicitado_por', 'estado', 'progreso', 'paso', 'mensaje',
+            'cancelacion_solicitada', 'resultado', 'fecha_creacion', 'fecha_inicio', 'fecha_fin',
+        ]
+        read_only_fields = fields
@@ -11,7 +11,8 @@ router.register('analytics', AnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
     # Esto genera automáticamente las URLs:
-    # /analytics/run-etl/ (POST)
+    # /analytics/run-etl/ (POST) -> 202 con job_id
+    # /analytics/etl-jobs/ (GET), /analytics/etl-jobs/<id>/ (GET), /analytics/etl-jobs/<id>/cancelar/ (POST)
     # /analytics/dashboard/ (GET)
     path('', include(router.urls)),
 ]
\ No newline at end of file
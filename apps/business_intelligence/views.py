@@ -2,223 +2,228 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
-from django.db.models import Count, Avg, Sum, F, Case, When, IntegerField
-from django.db.models.functions import ExtractHour, ExtractWeekDay
+from rest_framework.reverse import reverse
+from apps.cuentas.authentication import CachedTokenAuthentication
+from django.conf import settings
 import traceback 
 from django.apps import apps 
 from datetime import datetime
+from apps.cuentas.utils import get_usuario_perfil
 
 # Imports locales
-from .models import FactCitas
-from .etl import run_etl 
+from .models import FactCitas, AggCitasDiario, EtlJob
+from .jobs import cancelar_job, encolar_etl
+from .serializers import EtlJobSerializer
+from .dashboard import FUENTE_AGREGADOS, FUENTE_HECHOS, calcular_desglose, calcular_kpis
+from . import cache as cache_dashboard
 
 class AnalyticsViewSet(viewsets.ViewSet):
     """
     Motor de Inteligencia de Negocios 'Clinical Intelligence'.
     Soporta filtrado dinámico y agregaciones complejas.
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def _get_usuario_sistema(self, request):
         try:
-            Usuario = apps.get_model('cuentas', 'Usuario') 
-            return Usuario.objects.get(correo=request.user.email)
+            return get_usuario_perfil(request)
         except Exception:
             return None
 
-    def _aplicar_filtros(self, request, queryset):
+    def _es_administrador(self, request):
+        if request.user.is_superuser:
+            return True
+        usuario = self._get_usuario_sistema(request)
+        return bool(usuario and usuario.rol and usuario.rol.nombre in ['superAdmin', 'administrador'])
+
+    def _aplicar_filtros(self, filtros, queryset):
         """
-        Aplica filtros dinámicos basados en los QueryParams de la URL.
+        Aplica los filtros dinámicos ya normalizados (ver cache.normalizar_filtros),
+        así el resultado corresponde exactamente a la clave de cache.
         """
         # 1. Rango de Fechas
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
+        start_date = filtros.get('start_date')
+        end_date = filtros.get('end_date')
         if start_date and end_date:
             queryset = queryset.filter(fecha_cita__fecha__range=[start_date, end_date])
 
         # 2. Especialidad
-        especialidad = request.query_params.get('especialidad')
+        especialidad = filtros.get('especialidad')
         if especialidad:
             queryset = queryset.filter(especialidad__nombre_especialidad__icontains=especialidad)
 
         # 3. Médico (Nombre)
-        medico = request.query_params.get('medico')
+        medico = filtros.get('medico')
         if medico:
             queryset = queryset.filter(medico__nombre_completo__icontains=medico)
 
         # 4. Género del Médico
-        sexo_medico = request.query_params.get('sexo_medico')
+        sexo_medico = filtros.get('sexo_medico')
         if sexo_medico:
             queryset = queryset.filter(medico__genero=sexo_medico)
 
         return queryset
 
+    def _alcance_etl(self, request):
+        """Grupo al que se limitan los trabajos de ETL (None = todas las clínicas)."""
+        if request.user.is_superuser:
+            return None
+        usuario = self._get_usuario_sistema(request)
+        if usuario and usuario.rol and usuario.rol.nombre == 'superAdmin':
+            return None
+        return usuario.grupo_id if usuario else None
+
+    def _jobs_visibles(self, request):
+        alcance = self._alcance_etl(request)
+        jobs = EtlJob.objects.all()
+        if alcance is not None:
+            jobs = jobs.filter(grupo_id=alcance)
+        return jobs
+
     @action(detail=False, methods=['post'], url_path='run-etl')
     def ejecutar_etl(self, request):
-        usuario = self._get_usuario_sistema(request)
-        tiene_permiso = False
-        
-        if request.user.is_superuser:
-            tiene_permiso = True
-        
-        if usuario and usuario.rol:
-            if usuario.rol.nombre in ['superAdmin', 'administrador']:
-                tiene_permiso = True
-            
-        if not tiene_permiso:
+        if not self._es_administrador(request):
              return Response({"error": "No tienes permisos para ejecutar el ETL."}, status=status.HTTP_403_FORBIDDEN)
 
-        try:
-            run_etl()
-            return Response({"mensaje": "DataMart actualizado exitosamente."}, status=status.HTTP_200_OK)
-        except Exception as e:
-            print(f"Error ETL: {e}")
-            traceback.print_exc()
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # El ETL corre en el worker (python manage.py etl_worker), no en el request
+        usuario = self._get_usuario_sistema(request)
+        job, creado = encolar_etl(
+            grupo_id=self._alcance_etl(request),
+            solicitado_por=usuario.correo if usuario else request.user.email,
+        )
+        return Response({
+            "mensaje": "ETL encolado." if creado else "Ya hay un ETL pendiente; se reutiliza.",
+            "job_id": job.id,
+            "estado": job.estado,
+            "status_url": reverse('analytics-etl-job-detalle', kwargs={'job_id': job.id}, request=request),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path='etl-jobs')
+    def etl_jobs(self, request):
+        if not self._es_administrador(request):
+            return Response({"error": "No tienes permisos."}, status=status.HTTP_403_FORBIDDEN)
+        jobs = self._jobs_visibles(request)[:20]
+        return Response(EtlJobSerializer(jobs, many=True).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path=r'etl-jobs/(?P<job_id>\d+)')
+    def etl_job_detalle(self, request, job_id=None):
+        if not self._es_administrador(request):
+            return Response({"error": "No tienes permisos."}, status=status.HTTP_403_FORBIDDEN)
+        job = self._jobs_visibles(request).filter(pk=job_id).first()
+        if job is None:
+            return Response({"detail": "Trabajo no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(EtlJobSerializer(job).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path=r'etl-jobs/(?P<job_id>\d+)/cancelar')
+    def etl_job_cancelar(self, request, job_id=None):
+        if not self._es_administrador(request):
+            return Response({"error": "No tienes permisos."}, status=status.HTTP_403_FORBIDDEN)
+        job = self._jobs_visibles(request).filter(pk=job_id).first()
+        if job is None:
+            return Response({"detail": "Trabajo no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        if not cancelar_job(job):
+            return Response({"error": f"El trabajo ya terminó ({job.estado})."}, status=status.HTTP_409_CONFLICT)
+        job.refresh_from_db()
+        return Response(EtlJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path='dashboard-cache')
+    def dashboard_cache(self, request):
+        """Métricas del cache de respuestas del dashboard (de este worker)."""
+        if not self._es_administrador(request):
+            return Response({"error": "No tienes permisos."}, status=status.HTTP_403_FORBIDDEN)
+        return Response(cache_dashboard.estadisticas(), status=status.HTTP_200_OK)
+
+    def _calcular_dashboard(self, queryset, fuente):
+        # --- KPIs EN UN SOLO ESCANEO ---
+        kpis = calcular_kpis(queryset, fuente)
+
+        # Estructura de respuesta vacía si no hay datos
+        if kpis["total_citas"] == 0:
+            return {"kpis": {"total_citas": 0}, "mensaje": "No hay datos con estos filtros"}
+
+        # --- DESGLOSES (GROUPING SETS en PostgreSQL) ---
+        desglose = calcular_desglose(queryset, fuente)
+
+        return {
+            "resumen": {
+                "kpis": kpis,
+                "tendencia": desglose["tendencia"],
+                "top_medicos": desglose["top_medicos"]
+            },
+            "demografia": {
+                "distribucion_edad": desglose["distribucion_edad"],
+                "distribucion_sexo": desglose["distribucion_sexo"]
+            },
+            "operaciones": {
+                "heatmap": desglose["heatmap"],
+                "duracion_por_especialidad": desglose["duracion_por_especialidad"]
+            },
+            "fugas": {
+                "por_motivo": desglose["cancelaciones_por_motivo"],
+                "por_especialidad": desglose["cancelaciones_por_especialidad"]
+            }
+        }
 
     @action(detail=False, methods=['get'], url_path='dashboard')
     def dashboard_kpi(self, request):
         try:
             # --- 1. SEGURIDAD & MULTI-TENANCY ---
+            # Por defecto se lee de los agregados que mantiene el ETL (AggCitasDiario);
+            # el mismo motor puede trabajar directo sobre FactCitas.
+            if getattr(settings, 'BI_DASHBOARD_USAR_AGREGADOS', True):
+                modelo, fuente, nombre_fuente = AggCitasDiario, FUENTE_AGREGADOS, 'agregados'
+            else:
+                modelo, fuente, nombre_fuente = FactCitas, FUENTE_HECHOS, 'hechos'
+
             usuario = self._get_usuario_sistema(request)
-            base_queryset = FactCitas.objects.none() 
 
             if request.user.is_superuser:
-                base_queryset = FactCitas.objects.all()
+                alcance = cache_dashboard.ALCANCE_GLOBAL
             elif usuario:
                 if usuario.rol and usuario.rol.nombre == 'superAdmin':
-                    base_queryset = FactCitas.objects.all()
+                    alcance = cache_dashboard.ALCANCE_GLOBAL
                 elif usuario.grupo:
-                    base_queryset = FactCitas.objects.filter(grupo_id=usuario.grupo.id)
+                    alcance = usuario.grupo.id
                 else:
                     return Response({"detail": "Usuario sin clínica asignada."}, status=status.HTTP_403_FORBIDDEN)
             else:
                 return Response({"detail": "Perfil no encontrado."}, status=status.HTTP_403_FORBIDDEN)
 
-            # --- 2. APLICAR FILTROS GLOBALES ---
-            queryset = self._aplicar_filtros(request, base_queryset)
-            total_citas = queryset.count()
-
-            # Estructura de respuesta vacía si no hay datos
-            if total_citas == 0:
-                 return Response({"kpis": {"total_citas": 0}, "mensaje": "No hay datos con estos filtros"}, status=status.HTTP_200_OK)
-
-            # ==========================================================
-            # SECCIÓN 1: RESUMEN EJECUTIVO (KPIs Principales)
-            # ==========================================================
-            citas_realizadas = queryset.filter(estado__codigo_estado='REALIZADA').count()
-            citas_canceladas = queryset.filter(estado__es_cancelacion=True).count()
-            tasa_cancelacion = round((citas_canceladas / total_citas) * 100, 1) if total_citas > 0 else 0
-            
-            duracion_avg = queryset.filter(estado__codigo_estado='REALIZADA').aggregate(p=Avg('duracion_minutos'))['p']
-            duracion_prom = round(duracion_avg, 1) if duracion_avg else 0
-
-            tendencia = (
-                queryset
-                .values('fecha_cita__nombre_mes', 'fecha_cita__mes')
-                .annotate(total=Count('cita_key'))
-                .order_by('fecha_cita__mes')
-            )
-
-            top_medicos = (
-                queryset.filter(estado__codigo_estado='REALIZADA')
-                .values('medico__nombre_completo')
-                .annotate(citas=Count('cita_key'))
-                .order_by('-citas')[:5]
-            )
-
-            # ==========================================================
-            # SECCIÓN 2: DEMOGRAFÍA (Radiografía del Paciente)
-            # ==========================================================
-            # Distribución por Grupo Etario
-            dist_edad = (
-                queryset
-                .values('paciente__grupo_etario')
-                .annotate(total=Count('cita_key'))
-                .order_by('-total')
-            )
-
-            # Pirámide Poblacional (Sexo vs Edad)
-            # Esto cuenta cuántos Hombres y Mujeres hay
-            dist_sexo = (
-                queryset
-                .values('paciente__genero')
-                .annotate(total=Count('cita_key'))
-            )
-
-            # ==========================================================
-            # SECCIÓN 3: EFICIENCIA OPERATIVA (Heatmaps)
-            # ==========================================================
-            # Mapa de Calor: Día de la semana + Hora
-            # Nota: ExtractHour saca la hora del TimeField
-            heatmap_data = (
-                queryset
-                .annotate(hora=ExtractHour('hora_inicio'))
-                .values('fecha_cita__nombre_dia', 'fecha_cita__dia_semana', 'hora')
-                .annotate(cantidad=Count('cita_key'))
-                .order_by('fecha_cita__dia_semana', 'hora')
-            )
-
-            # Duración por Especialidad (Para ver cuál tarda más)
-            duracion_especialidad = (
-                queryset.filter(estado__codigo_estado='REALIZADA')
-                .values('especialidad__nombre_especialidad')
-                .annotate(promedio_min=Avg('duracion_minutos'))
-                .order_by('-promedio_min')
-            )
-
-            # ==========================================================
-            # SECCIÓN 4: ANÁLISIS DE FUGAS (Cancelaciones)
-            # ==========================================================
-            cancelaciones_queryset = queryset.filter(estado__es_cancelacion=True)
-            
-            cancelaciones_por_motivo = (
-                cancelaciones_queryset
-                .values('estado__descripcion_estado') # Ej: Cancelada, No Asistió
-                .annotate(total=Count('cita_key'))
-                .order_by('-total')
-            )
-
-            cancelaciones_por_especialidad = (
-                cancelaciones_queryset
-                .values('especialidad__nombre_especialidad')
-                .annotate(total=Count('cita_key'))
-                .order_by('-total')[:5]
-            )
+            # --- 2. CACHE POR (CLÍNICA, FILTROS, VERSIÓN DEL DATAMART) ---
+            filtros = cache_dashboard.normalizar_filtros(request.query_params)
+            version = cache_dashboard.version_datamart(alcance)
+            clave = cache_dashboard.clave_dashboard(alcance, filtros, version, nombre_fuente)
+            etag = f'"{clave}"'
+            cabeceras = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+            # El frontend ya tiene esta versión: no se calcula ni se envía nada
+            if cache_dashboard.etag_coincide(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=cabeceras)
+
+            datos = cache_dashboard.obtener_respuesta(clave)
+            if datos is None:
+                cabeceras["X-Cache"] = "MISS"
+                if alcance == cache_dashboard.ALCANCE_GLOBAL:
+                    base_queryset = modelo.objects.all()
+                else:
+                    base_queryset = modelo.objects.filter(grupo_id=alcance)
+
+                # --- 3. FILTROS GLOBALES + CÁLCULO ---
+                queryset = self._aplicar_filtros(filtros, base_queryset)
+                datos = self._calcular_dashboard(queryset, fuente)
+                cache_dashboard.guardar_respuesta(clave, datos)
+            else:
+                cabeceras["X-Cache"] = "HIT"
 
             # --- ARMADO DE LA RESPUESTA ---
-            response_data = {
-                "filtros_aplicados": request.query_params,
-                "resumen": {
-                    "kpis": {
-                        "total_citas": total_citas,
-                        "realizadas": citas_realizadas,
-                        "canceladas": citas_canceladas,
-                        "tasa_cancelacion": tasa_cancelacion,
-                        "duracion_promedio": duracion_prom
-                    },
-                    "tendencia": list(tendencia),
-                    "top_medicos": list(top_medicos)
-                },
-                "demografia": {
-                    "distribucion_edad": list(dist_edad),
-                    "distribucion_sexo": list(dist_sexo)
-                },
-                "operaciones": {
-                    "heatmap": list(heatmap_data),
-                    "duracion_por_especialidad": list(duracion_especialidad)
-                },
-                "fugas": {
-                    "por_motivo": list(cancelaciones_por_motivo),
-                    "por_especialidad": list(cancelaciones_por_especialidad)
-                }
-            }
-            
-            return Response(response_data, status=status.HTTP_200_OK)
+            # filtros_aplicados refleja los parámetros tal como llegaron, por eso no se cachea
+            if "resumen" in datos:
+                datos = {"filtros_aplicados": request.query_params, **datos}
+
+            return Response(datos, status=status.HTTP_200_OK, headers=cabeceras)
 
         except Exception as e:
             print("Error en Dashboard:", str(e))
             traceback.print_exc()
-            return Response({"detail": "Error interno", "error_tecnico": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({"detail": "Error interno", "error_tecnico": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
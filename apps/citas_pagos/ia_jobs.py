@@ -0,0 +1,99 @@
+# apps/citas_pagos/ia_jobs.py
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from .ia_services import clave_informe, generar_informe_cacheado, informe_en_cache
+from .models import InformeIAJob
+
+
+def encolar_informe(usuario, cita, notas_vagas, regenerar=False):
+    """
+    Crea el pedido de borrador para ia_worker. Retorna (job, creado):
+    - si el usuario ya pidió lo mismo (misma cita, notas y regenerar) y no terminó, se devuelve ese job;
+    - si el borrador ya está en el cache (compartido con ia_worker con IA_CACHE_ALIAS), el job nace COMPLETADO.
+    """
+    clave = clave_informe(cita.grupo_id, notas_vagas)
+    activos = InformeIAJob.objects.filter(
+        usuario=usuario, cita=cita, clave=clave, regenerar=regenerar, estado__in=InformeIAJob.ESTADOS_ACTIVOS
+    )
+    existente = activos.first()
+    if existente:
+        return existente, False
+
+    datos = dict(usuario=usuario, cita=cita, grupo_id=cita.grupo_id, notas_vagas=notas_vagas, regenerar=regenerar, clave=clave)
+    informe = None if regenerar else informe_en_cache(notas_vagas, cita.grupo_id)
+    if informe is not None:
+        ahora = timezone.now()
+        datos.update(estado='COMPLETADO', resultado=informe, fecha_inicio=ahora, fecha_fin=ahora)
+    try:
+        with transaction.atomic():
+            return InformeIAJob.objects.create(**datos), True
+    except IntegrityError:
+        # Otro pedido igual se creó entre la consulta y el insert (informe_ia_job_activo_unico)
+        existente = activos.first()
+        if existente is None:
+            raise
+        return existente, False
+
+
+def marcar_huerfanos(minutos=10):
+    """Pedidos EN_PROCESO hace demasiado (el worker murió): se dan por fallidos."""
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return InformeIAJob.objects.filter(estado='EN_PROCESO', fecha_inicio__lt=limite).update(
+        estado='FALLIDO', fecha_fin=timezone.now(), mensaje='Worker interrumpido.'
+    )
+
+
+def eliminar_antiguos(horas=24):
+    """Los borradores tienen datos clínicos: no se guardan más de lo necesario."""
+    limite = timezone.now() - timedelta(hours=horas)
+    eliminados, _ = InformeIAJob.objects.filter(
+        estado__in=('COMPLETADO', 'FALLIDO'), fecha_fin__lt=limite
+    ).delete()
+    return eliminados
+
+
+def tomar_siguiente_job(max_por_grupo):
+    """
+    Reclama el pendiente más antiguo de una clínica que no tenga ya
+    `max_por_grupo` pedidos EN_PROCESO (una clínica no acapara el cupo de las demás).
+    """
+    llenos = (
+        InformeIAJob.objects.filter(estado='EN_PROCESO')
+        .values('grupo_id').annotate(en_proceso=Count('id'))
+        .filter(en_proceso__gte=max_por_grupo).values_list('grupo_id', flat=True)
+    )
+    candidatos = (
+        InformeIAJob.objects.filter(estado='PENDIENTE').exclude(grupo_id__in=list(llenos))
+        .order_by('fecha_creacion').values_list('pk', flat=True)[:10]
+    )
+    for job_id in candidatos:
+        reclamado = InformeIAJob.objects.filter(pk=job_id, estado='PENDIENTE').update(
+            estado='EN_PROCESO', fecha_inicio=timezone.now()
+        )
+        if reclamado:
+            return InformeIAJob.objects.get(pk=job_id)
+    return None
+
+
+def ejecutar_job(job):
+    """Genera el borrador (pasa por el cache de la clínica) y guarda el resultado."""
+    try:
+        informe, _ = generar_informe_cacheado(job.notas_vagas, job.grupo_id, regenerar=job.regenerar)
+        InformeIAJob.objects.filter(pk=job.pk).update(
+            estado='COMPLETADO', resultado=informe, fecha_fin=timezone.now(), mensaje=''
+        )
+    except APIException as e:
+        InformeIAJob.objects.filter(pk=job.pk).update(estado='FALLIDO', fecha_fin=timezone.now(), mensaje=str(e.detail))
+    except Exception as e:
+        print(f"Error generando informe IA #{job.pk}: {e}")
+        traceback.print_exc()
+        InformeIAJob.objects.filter(pk=job.pk).update(estado='FALLIDO', fecha_fin=timezone.now(), mensaje=str(e))
+
+    job.refresh_from_db()
+    return job
@@ -1,8 +1,14 @@
 # en apps/citas/ia_services.py
-import requests
+import hashlib
+import json
+
 from django.conf import settings
+from django.core.cache import caches
 from rest_framework.exceptions import APIException
 
+from apps.cuentas.cache import LRUCacheTTL
+from .llm_client import CircuitoAbierto, ErrorLLM, obtener_cliente
+
 # --- ESTE ES EL PROMPT V5 (CORREGIDO Y SIN ASTERISCOS) ---
 PROMPT_V5 = """Eres un asistente de documentación clínica experto en oftalmología.
 Tu única función es tomar notas clínicas breves y reestructurarlas en un informe preliminar profesional, completo y bien redactado. El informe final NO debe contener asteriscos (*).
@@ -58,12 +64,82 @@ Impresión Diagnóstica:
 Plan:
 """
 
-def generar_informe_con_ia(notas_vagas: str) -> str:
+# Cambiar VERSION_PROMPT al editar el prompt: los borradores viejos dejan de pedirse
+VERSION_PROMPT = "V5"
+MODELO_IA = "meta-llama/llama-4-scout-17b-16e-instruct"
+TEMPERATURA_IA = 0.2
+MAX_TOKENS_IA = 1024
+
+# Borradores ya generados. Misma clínica + mismas notas => mismo borrador. Con
+# IA_CACHE_ALIAS se guardan en esa cache de Django (los ven todos los workers web
+# y ia_worker) y esta LRU del proceso queda solo como primer nivel, con TTL corto.
+_cache_informes = LRUCacheTTL(
+    maxsize=getattr(settings, 'IA_CACHE_MAXSIZE', 512),
+    ttl=getattr(settings, 'IA_CACHE_TTL', 3600),
+)
+
+_PREFIJO_SHARED = 'informe_ia:'
+
+
+def _normalizar_notas(notas_vagas):
+    # Espacios y saltos de línea no cambian el informe; mayúsculas sí (OD, PIO...)
+    return " ".join(notas_vagas.split())
+
+
+def clave_informe(grupo_id, notas_vagas):
+    contenido = json.dumps(
+        [VERSION_PROMPT, MODELO_IA, TEMPERATURA_IA, MAX_TOKENS_IA, grupo_id, _normalizar_notas(notas_vagas)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def _cache_compartido():
+    """Backend de cache de Django compartido entre procesos (opcional)."""
+    alias = getattr(settings, 'IA_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _leer_cache(clave):
+    informe = _cache_informes.get(clave)
+    compartido = _cache_compartido()
+    if informe is None and compartido is not None:
+        informe = compartido.get(_PREFIJO_SHARED + clave)
+        if informe is not None:
+            _cache_informes.set(clave, informe, ttl=getattr(settings, 'IA_CACHE_LOCAL_TTL', 60))
+    return informe
+
+
+def _guardar_cache(clave, informe):
+    compartido = _cache_compartido()
+    if compartido is None:
+        _cache_informes.set(clave, informe)
+        return
+    compartido.set(_PREFIJO_SHARED + clave, informe, getattr(settings, 'IA_CACHE_TTL', 3600))
+    _cache_informes.set(clave, informe, ttl=getattr(settings, 'IA_CACHE_LOCAL_TTL', 60))
+
+
+def generar_informe_cacheado(notas_vagas: str, grupo_id, regenerar=False):
     """
-    Llama a la API de Groq con las notas vagas y el prompt V5.
-    Devuelve el texto del informe generado.
-    Lanza una APIException si algo falla.
+    (informe, desde_cache). Repetir la misma nota en la misma clínica devuelve
+    el borrador guardado sin llamar a la API. regenerar=True ignora el cache y
+    reemplaza la entrada con el nuevo borrador.
     """
+    clave = clave_informe(grupo_id, notas_vagas)
+    if not regenerar:
+        informe = _leer_cache(clave)
+        if informe is not None:
+            return informe, True
+    informe = generar_informe_con_ia(notas_vagas)
+    _guardar_cache(clave, informe)
+    return informe, False
+
+
+def estadisticas_cache():
+    return _cache_informes.stats()
+
+
+def _verificar_api_key():
     try:
         API_KEY = settings.GROQ_API_KEY
         if not API_KEY or API_KEY == "gsk_TU_API_KEY_SECRETA_QUE_COPIASTE": # Asegúrate de que tu key real esté en settings.py
@@ -71,15 +147,10 @@ def generar_informe_con_ia(notas_vagas: str) -> str:
     except AttributeError as e:
         raise APIException(f"Error de configuración del servidor: {e}")
 
-    API_URL = "https://api.groq.com/openai/v1/chat/completions"
-
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-    }
 
-    payload = {
-        "model": "meta-llama/llama-4-scout-17b-16e-instruct",
+def _payload(notas_vagas):
+    return {
+        "model": MODELO_IA,
         "messages": [
             {
                 "role": "system",
@@ -90,33 +161,92 @@ def generar_informe_con_ia(notas_vagas: str) -> str:
                 "content": f"Notas del médico: {notas_vagas}"
             }
         ],
-        "temperature": 0.2,
-        "max_tokens": 1024,
+        "temperature": TEMPERATURA_IA,
+        "max_tokens": MAX_TOKENS_IA,
     }
 
-    try:
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=20)
-        response.raise_for_status()
 
-        data = response.json()
+class ErrorServicioIA(APIException):
+    """
+    Falla del proveedor de IA con el HTTP que le sirve al frontend: 503 (circuito
+    abierto o sin conexión), 429 (cuota del proveedor) o 502 (otra respuesta mala).
+    `wait` sale como Retry-After, igual que en Throttled de DRF.
+    """
+    status_code = 502
+    default_detail = "Error en el servicio de IA."
+
+    def __init__(self, detail=None, status_code=None, wait=None):
+        super().__init__(detail)
+        if status_code is not None:
+            self.status_code = status_code
+        self.wait = wait
+
+
+def _error_api(e):
+    """ErrorLLM del cliente -> ErrorServicioIA con el mensaje y el HTTP para el frontend."""
+    mensaje = f"{e}: {e.detalle}" if e.detalle is not None else str(e)
+    if isinstance(e, CircuitoAbierto) or e.status is None:
+        status_code = 503
+    elif e.status == 429:
+        status_code = 429
+    else:
+        status_code = 502
+    return ErrorServicioIA(mensaje, status_code=status_code, wait=e.retry_after)
+
+
+def generar_informe_con_ia(notas_vagas: str) -> str:
+    """
+    Llama a la API de Groq con las notas vagas y el prompt V5.
+    Devuelve el texto del informe generado.
+    Lanza una APIException si algo falla.
+    """
+    _verificar_api_key()
+
+    try:
+        # Cliente compartido del proceso: keep-alive, reintentos y circuit breaker
+        data = obtener_cliente().post_json(_payload(notas_vagas))
 
         if 'choices' in data and len(data['choices']) > 0 and 'message' in data['choices'][0] and 'content' in data['choices'][0]['message']:
             informe_generado = data['choices'][0]['message']['content']
             return informe_generado.strip() # .strip() para quitar espacios extra
         else:
-            raise APIException(f"La API de IA devolvió una respuesta inesperada: {data}")
-
-    except requests.exceptions.HTTPError as e:
-        error_detail = e.response.text
-        try:
-            # Intentar parsear el JSON si es posible para un mejor mensaje de error
-            error_json = e.response.json()
-            if 'error' in error_json and 'message' in error_json['error']:
-                 error_detail = error_json['error']['message']
-        except ValueError:
-            pass # Si no es JSON, usar el texto plano
-        raise APIException(f"Error en la API de IA ({e.response.status_code}): {error_detail}", code=e.response.status_code)
-    except requests.exceptions.RequestException as e:
-        raise APIException(f"Error de conexión con el servicio de IA: {e}", code=503)
+            raise ErrorServicioIA(f"La API de IA devolvió una respuesta inesperada: {data}")
+
+    except ErrorLLM as e:
+        raise _error_api(e)
+    except APIException:
+        raise
     except Exception as e:
-        raise APIException(f"Error interno al procesar la IA: {e}")
\ No newline at end of file
+        raise APIException(f"Error interno al procesar la IA: {e}")
+
+
+def informe_en_cache(notas_vagas: str, grupo_id):
+    """Borrador ya generado para estas notas en esta clínica, o None."""
+    return _leer_cache(clave_informe(grupo_id, notas_vagas))
+
+
+def generar_informe_stream(notas_vagas: str, grupo_id):
+    """
+    Generador con el informe en fragmentos a medida que el modelo los produce
+    (completion con stream). Quita los asteriscos en el camino, como pide el
+    prompt, y al terminar guarda el informe completo en el cache de la clínica.
+    Lanza APIException si algo falla (antes o durante el texto).
+    """
+    _verificar_api_key()
+
+    partes = []
+    try:
+        for fragmento in obtener_cliente().post_stream(_payload(notas_vagas)):
+            fragmento = fragmento.replace("*", "")
+            if not partes:
+                # Igual que .strip() en generar_informe_con_ia (el final se limpia al guardar)
+                fragmento = fragmento.lstrip()
+            if fragmento:
+                partes.append(fragmento)
+                yield fragmento
+    except ErrorLLM as e:
+        raise _error_api(e)
+
+    informe = "".join(partes).strip()
+    if informe:
+        _guardar_cache(clave_informe(grupo_id, notas_vagas), informe)
@@ -0,0 +1,371 @@
+# apps/citas_pagos/llm_client.py
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Respuestas del proveedor que vale la pena reintentar (saturado o caído un momento)
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# Con menos tiempo que esto dentro de tiempo_maximo no se empieza otro intento
+MIN_SEGUNDOS_INTENTO = 1.0
+
+
+class ErrorLLM(Exception):
+    """
+    Falla al llamar al proveedor. `status` es el HTTP de la respuesta (None si no
+    hubo) y `retry_after` los segundos que pidió esperar el proveedor (o el circuito).
+    """
+
+    def __init__(self, mensaje, status=None, detalle=None, retry_after=None):
+        super().__init__(mensaje)
+        self.status = status
+        self.detalle = detalle
+        self.retry_after = retry_after
+
+
+class CircuitoAbierto(ErrorLLM):
+    pass
+
+
+class SinCupo(ErrorLLM):
+    """El proceso ya tiene `max_simultaneas` llamadas en curso (no se toca la red)."""
+
+
+class _Llamada:
+    """
+    Una llamada que el circuito dejó pasar. Al salir del `with` queda registrada
+    como éxito o fallo (lo primero que se indique; si no se indicó nada, según
+    salga con o sin excepción), así la llamada de prueba nunca queda colgada.
+    """
+
+    def __init__(self, circuito):
+        self.circuito = circuito
+        self.resuelta = False
+
+    def exito(self):
+        if not self.resuelta:
+            self.resuelta = True
+            self.circuito.exito()
+
+    def fallo(self):
+        if not self.resuelta:
+            self.resuelta = True
+            self.circuito.fallo()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        # GeneratorExit: el cliente dejó de leer un stream, el proveedor sí respondía
+        if tipo is None or issubclass(tipo, GeneratorExit):
+            self.exito()
+        else:
+            self.fallo()
+        return False
+
+
+class CircuitBreaker:
+    """
+    Tras `umbral` llamadas fallidas seguidas se abre: durante `enfriamiento`
+    segundos las llamadas fallan de inmediato sin tocar la red. Luego deja pasar
+    una de prueba (semiabierto): si sale bien se cierra, si falla se vuelve a abrir.
+    """
+
+    def __init__(self, umbral=5, enfriamiento=30):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self.fallos = 0
+        self.abierto_hasta = None
+        self._probando = False
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if self.abierto_hasta is None:
+                return True
+            if time.monotonic() < self.abierto_hasta or self._probando:
+                return False
+            self._probando = True
+            return True
+
+    def llamada(self):
+        """Context manager para una llamada; lanza CircuitoAbierto si no se permite."""
+        if not self.permitir():
+            with self._lock:
+                espera = max(0.0, (self.abierto_hasta or 0) - time.monotonic())
+            raise CircuitoAbierto(
+                "El servicio de IA no está disponible en este momento; intente más tarde.",
+                status=503, retry_after=espera,
+            )
+        return _Llamada(self)
+
+    def exito(self):
+        with self._lock:
+            self.fallos = 0
+            self.abierto_hasta = None
+            self._probando = False
+
+    def fallo(self):
+        with self._lock:
+            self.fallos += 1
+            self._probando = False
+            if self.fallos >= self.umbral:
+                self.abierto_hasta = time.monotonic() + self.enfriamiento
+
+    def estado(self):
+        with self._lock:
+            if self.abierto_hasta is None:
+                estado = 'cerrado'
+            elif time.monotonic() < self.abierto_hasta:
+                estado = 'abierto'
+            else:
+                estado = 'semiabierto'
+            return {'estado': estado, 'fallos_seguidos': self.fallos}
+
+
+class TokenBucket:
+    """
+    Limita las llamadas al ritmo de la cuota del proveedor: `por_minuto` fichas
+    que se reponen de forma continua, con ráfagas de hasta `capacidad`.
+    """
+
+    def __init__(self, por_minuto, capacidad=None):
+        self.tasa = por_minuto / 60.0
+        self.capacidad = capacidad or max(1, por_minuto // 10)
+        self.fichas = float(self.capacidad)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reponer(self):
+        ahora = time.monotonic()
+        self.fichas = min(self.capacidad, self.fichas + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def tomar(self):
+        """Toma una ficha si hay; si no, devuelve los segundos que faltan para la próxima."""
+        with self._lock:
+            self._reponer()
+            if self.fichas >= 1:
+                self.fichas -= 1
+                return 0
+            return (1 - self.fichas) / self.tasa
+
+    def esperar(self):
+        while True:
+            espera = self.tomar()
+            if not espera:
+                return
+            time.sleep(espera)
+
+
+def _segundos_retry_after(valor):
+    """Retry-After en segundos ("7") o como fecha HTTP; None si no se entiende."""
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _mensaje_error(response):
+    """Mensaje de error del proveedor ({"error": {"message": ...}}) o el cuerpo tal cual."""
+    try:
+        datos = response.json()
+        return datos['error']['message']
+    except (ValueError, KeyError, TypeError):
+        return response.text
+
+
+class ClienteLLM:
+    """
+    Cliente HTTP para APIs tipo chat/completions. Reutiliza las conexiones
+    (requests.Session con keep-alive, una por proceso), reintenta 429/5xx y
+    errores de red con backoff exponencial con jitter (o lo que pida Retry-After)
+    y corta con un CircuitBreaker cuando el proveedor está caído. Con `limitador`
+    (un TokenBucket) cada intento HTTP espera su ficha de la cuota del proveedor;
+    con `max_simultaneas` las llamadas de más fallan de inmediato con SinCupo.
+    """
+
+    def __init__(self, url, api_key, timeout_conexion=5, timeout_lectura=20, reintentos=2,
+                 backoff_base=0.5, backoff_max=8, tiempo_maximo=25, pool_maxsize=10,
+                 circuito=None, limitador=None, max_simultaneas=None):
+        self.url = url
+        self.api_key = api_key
+        self.timeout_conexion = timeout_conexion
+        self.timeout_lectura = timeout_lectura
+        self.reintentos = reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.tiempo_maximo = tiempo_maximo
+        self.pool_maxsize = pool_maxsize
+        self.circuito = circuito or CircuitBreaker()
+        self.limitador = limitador
+        self.cupo = threading.BoundedSemaphore(max_simultaneas) if max_simultaneas else None
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _obtener_session(self):
+        # Tras un fork (gunicorn con preload_app) el hijo no debe usar los sockets del padre
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                session = requests.Session()
+                # Los reintentos los hace _enviar (Retry-After, jitter, circuito)
+                adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                session.mount('https://', adaptador)
+                session.mount('http://', adaptador)
+                session.headers.update({
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                })
+                self._session, self._pid = session, os.getpid()
+            return self._session
+
+    def _espera(self, intento, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        # Full jitter: los workers que fallaron juntos no reintentan juntos
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** intento))
+
+    def _timeout(self, restante):
+        """(conexión, lectura) recortados para que el intento no pase de `restante` segundos."""
+        conexion = min(self.timeout_conexion, restante)
+        return conexion, min(self.timeout_lectura, max(restante - conexion, MIN_SEGUNDOS_INTENTO / 2))
+
+    def _enviar(self, payload, llamada, stream=False):
+        """
+        POST con reintentos dentro de `llamada` (ver CircuitBreaker.llamada);
+        devuelve la respuesta 2xx (con stream=True el cuerpo aún no se leyó).
+        Lanza ErrorLLM si no se logró respuesta (los 4xx distintos de 429 no se
+        reintentan).
+        """
+        session = self._obtener_session()
+        limite = time.monotonic() + self.tiempo_maximo
+        intento = 0
+        while True:
+            retry_after = None
+            if self.limitador is not None:
+                self.limitador.esperar()
+            # Cada intento usa solo lo que queda del tiempo máximo (conexión + lectura)
+            timeout = self._timeout(max(limite - time.monotonic(), MIN_SEGUNDOS_INTENTO))
+            try:
+                response = session.post(self.url, json=payload, timeout=timeout, stream=stream)
+            except requests.exceptions.RequestException as e:
+                error = ErrorLLM(f"Error de conexión con el servicio de IA: {e}", status=None)
+            else:
+                if response.ok:
+                    return response
+                error = ErrorLLM(
+                    f"Error en la API de IA ({response.status_code})",
+                    status=response.status_code, detalle=_mensaje_error(response),
+                )
+                response.close()
+                if response.status_code not in ESTADOS_REINTENTABLES:
+                    # Error nuestro (key inválida, payload): el proveedor está bien
+                    llamada.exito()
+                    raise error
+                retry_after = _segundos_retry_after(response.headers.get('Retry-After'))
+                error.retry_after = retry_after
+
+            espera = self._espera(intento, retry_after)
+            if intento >= self.reintentos or time.monotonic() + espera + MIN_SEGUNDOS_INTENTO > limite:
+                # Sin reintentos o no queda tiempo para otro intento: no bloquear el worker
+                llamada.fallo()
+                raise error
+            print(f"[LLM] {error} {error.detalle or ''}; reintento {intento + 1}/{self.reintentos} en {espera:.2f}s.")
+            time.sleep(espera)
+            intento += 1
+
+    @contextmanager
+    def _ocupar_cupo(self):
+        if self.cupo is None:
+            yield
+            return
+        if not self.cupo.acquire(blocking=False):
+            raise SinCupo("Hay demasiadas solicitudes de IA en curso; intente en unos segundos.", status=429, retry_after=2)
+        try:
+            yield
+        finally:
+            self.cupo.release()
+
+    def post_json(self, payload):
+        """
+        POST del payload; devuelve el JSON de la respuesta. Lanza CircuitoAbierto
+        sin llamar si el proveedor viene fallando (otros errores: ver _enviar).
+        """
+        with self._ocupar_cupo(), self.circuito.llamada() as llamada:
+            response = self._enviar(payload, llamada)
+            try:
+                return response.json()
+            except ValueError:
+                raise ErrorLLM("La API de IA devolvió una respuesta que no es JSON.", status=response.status_code)
+
+    def post_stream(self, payload):
+        """
+        Generador con los fragmentos de texto (choices[0].delta.content) de una
+        respuesta con "stream": true (server-sent events). Solo se reintenta
+        antes de recibir la respuesta; un corte a mitad del texto lanza ErrorLLM.
+        """
+        # Cualquier salida del generador (fin, error, cliente que corta) cierra la llamada
+        with self._ocupar_cupo(), self.circuito.llamada() as llamada:
+            response = self._enviar({**payload, "stream": True}, llamada, stream=True)
+            # text/event-stream sin charset: requests asumiría ISO-8859-1
+            response.encoding = 'utf-8'
+            try:
+                for linea in response.iter_lines(decode_unicode=True):
+                    if not linea or not linea.startswith('data:'):
+                        continue
+                    datos = linea[5:].strip()
+                    if datos == '[DONE]':
+                        break
+                    try:
+                        delta = json.loads(datos)['choices'][0].get('delta', {})
+                    except (ValueError, KeyError, IndexError, TypeError):
+                        raise ErrorLLM("La API de IA devolvió un evento inesperado.", status=response.status_code, detalle=datos)
+                    if delta.get('content'):
+                        yield delta['content']
+            except requests.exceptions.RequestException as e:
+                raise ErrorLLM(f"Se cortó la respuesta del servicio de IA: {e}", status=None)
+            finally:
+                response.close()
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+
+def obtener_cliente():
+    """ClienteLLM del proceso para Groq, configurado desde settings (se crea en el primer uso)."""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            _cliente = ClienteLLM(
+                url=getattr(settings, 'GROQ_API_URL', "https://api.groq.com/openai/v1/chat/completions"),
+                api_key=settings.GROQ_API_KEY,
+                timeout_conexion=getattr(settings, 'LLM_TIMEOUT_CONEXION', 5),
+                timeout_lectura=getattr(settings, 'LLM_TIMEOUT_LECTURA', 20),
+                reintentos=getattr(settings, 'LLM_REINTENTOS', 2),
+                backoff_base=getattr(settings, 'LLM_BACKOFF_BASE', 0.5),
+                backoff_max=getattr(settings, 'LLM_BACKOFF_MAX', 8),
+                tiempo_maximo=getattr(settings, 'LLM_TIEMPO_MAXIMO', 25),
+                pool_maxsize=getattr(settings, 'LLM_POOL_MAXSIZE', 10),
+                max_simultaneas=getattr(settings, 'IA_WEB_SIMULTANEAS', 2),
+                circuito=CircuitBreaker(
+                    umbral=getattr(settings, 'LLM_CIRCUITO_UMBRAL', 5),
+                    enfriamiento=getattr(settings, 'LLM_CIRCUITO_ENFRIAMIENTO', 30),
+                ),
+            )
+        return _cliente
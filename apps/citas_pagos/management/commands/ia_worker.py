@@ -0,0 +1,83 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.citas_pagos.ia_jobs import ejecutar_job, eliminar_antiguos, marcar_huerfanos, tomar_siguiente_job
+from apps.citas_pagos.llm_client import TokenBucket, obtener_cliente
+
+
+def _ejecutar_en_hilo(job):
+    try:
+        return ejecutar_job(job)
+    finally:
+        # Cada hilo tiene su conexión: se cierra al terminar el pedido
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera los borradores de informe IA encolados desde la API "
+        "(POST /api/citas_pagos/citas/<id>/generar-reporte-ia-job/)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=1, help="Segundos entre revisiones de la cola.")
+        parser.add_argument('--una-vez', action='store_true', help="Procesa lo pendiente y termina.")
+        parser.add_argument(
+            '--concurrencia', type=int, default=getattr(settings, 'IA_JOBS_CONCURRENCIA', 4),
+            help="Llamadas simultáneas al proveedor (total).",
+        )
+        parser.add_argument(
+            '--por-clinica', type=int, default=getattr(settings, 'IA_JOBS_POR_CLINICA', 2),
+            help="Llamadas simultáneas por clínica.",
+        )
+        parser.add_argument(
+            '--por-minuto', type=int, default=getattr(settings, 'IA_JOBS_POR_MINUTO', 30),
+            help="Llamadas por minuto (cuota del proveedor).",
+        )
+        parser.add_argument('--minutos-huerfano', type=int, default=10)
+
+    def handle(self, *args, **options):
+        # Un solo proceso reparte el trabajo: los límites se cumplen sin coordinarse con otros.
+        # La cuota se cobra por llamada HTTP (reintentos incluidos); los borradores en cache no gastan.
+        # El tope de los workers web (IA_WEB_SIMULTANEAS) no aplica: aquí limita --concurrencia
+        cliente = obtener_cliente()
+        cliente.limitador = TokenBucket(options['por_minuto'])
+        cliente.cupo = None
+        activos = set()
+        self.stdout.write(
+            f"Worker de informes IA iniciado ({options['concurrencia']} simultáneos, "
+            f"{options['por_clinica']} por clínica, {options['por_minuto']}/min). Ctrl+C para detener."
+        )
+        with ThreadPoolExecutor(max_workers=options['concurrencia']) as pool:
+            try:
+                while True:
+                    huerfanos = marcar_huerfanos(options['minutos_huerfano'])
+                    if huerfanos:
+                        self.stdout.write(self.style.WARNING(f"{huerfanos} informe(s) huérfano(s) marcados como FALLIDO."))
+                    eliminar_antiguos(getattr(settings, 'IA_JOBS_RETENCION_HORAS', 24))
+
+                    while len(activos) < options['concurrencia']:
+                        job = tomar_siguiente_job(options['por_clinica'])
+                        if job is None:
+                            break
+                        self.stdout.write(f"Generando informe IA #{job.pk} (cita {job.cita_id}, clínica {job.grupo_id})...")
+                        activos.add(pool.submit(_ejecutar_en_hilo, job))
+
+                    if not activos:
+                        if options['una_vez']:
+                            break
+                        time.sleep(options['intervalo'])
+                        continue
+
+                    # Se vuelve a revisar la cola apenas se libera un cupo
+                    listos, activos = wait(activos, timeout=options['intervalo'], return_when=FIRST_COMPLETED)
+                    for futuro in listos:
+                        job = futuro.result()
+                        estilo = self.style.SUCCESS if job.estado == 'COMPLETADO' else self.style.ERROR
+                        self.stdout.write(estilo(f"Informe IA #{job.pk}: {job.estado}. {job.mensaje}"))
+            except KeyboardInterrupt:
+                self.stdout.write("Worker de informes IA detenido (esperando los pedidos en curso).")
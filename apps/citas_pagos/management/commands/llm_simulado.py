@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+# Con asteriscos a propósito: el modelo real a veces los pone aunque el prompt lo prohíba
+INFORME_SIMULADO = """Paciente: (simulado)
+Motivo de Consulta: {notas}
+
+**Impresión Diagnóstica:** Examen oftalmológico dentro de límites normales.
+
+**Plan:** Control en 12 meses."""
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    # HTTP/1.1: la conexión queda abierta entre llamadas (keep-alive)
+    protocol_version = "HTTP/1.1"
+
+    def _responder(self, estado, datos, cabeceras=None):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _responder_stream(self, numero, modelo, texto):
+        """Respuesta con "stream": true: un evento SSE por palabra, con Transfer-Encoding chunked."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        palabras = texto.split(" ")
+        eventos = [
+            {"id": f"simulado-{numero}", "object": "chat.completion.chunk", "model": modelo,
+             "choices": [{"index": 0, "delta": {"content": palabra if i == 0 else " " + palabra}}]}
+            for i, palabra in enumerate(palabras)
+        ]
+        for evento in eventos:
+            if self.server.latencia_token:
+                time.sleep(self.server.latencia_token)
+            self._chunk(f"data: {json.dumps(evento, ensure_ascii=False)}\n\n")
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, texto):
+        datos = texto.encode('utf-8')
+        self.wfile.write(f"{len(datos):x}\r\n".encode() + datos + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        servidor = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with servidor.lock:
+            servidor.llamadas += 1
+            numero = servidor.llamadas
+        if servidor.latencia:
+            time.sleep(servidor.latencia)
+
+        if servidor.caido or numero <= servidor.fallar:
+            cabeceras = {"Retry-After": str(servidor.retry_after)} if servidor.retry_after is not None else {}
+            self._responder(
+                servidor.estado_fallo,
+                {"error": {"message": f"Fallo simulado (llamada {numero})", "type": "simulado"}},
+                cabeceras,
+            )
+            return
+
+        notas = payload.get("messages", [{}])[-1].get("content", "")
+        if payload.get("stream"):
+            self._responder_stream(numero, payload.get("model"), INFORME_SIMULADO.format(notas=notas))
+            return
+        self._responder(200, {
+            "id": f"simulado-{numero}",
+            "object": "chat.completion",
+            "model": payload.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": INFORME_SIMULADO.format(notas=notas)},
+                "finish_reason": "stop",
+            }],
+        })
+
+    def log_message(self, formato, *args):
+        # El puerto del cliente muestra si reutiliza la conexión (keep-alive)
+        print(f"[LLM simulado] {self.client_address[1]} {formato % args}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Servidor local que imita la API chat/completions de Groq para pruebas: "
+        "GROQ_API_URL=http://127.0.0.1:<puerto>/openai/v1/chat/completions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puerto', type=int, default=8765)
+        parser.add_argument('--latencia', type=float, default=0, help="Segundos de espera por respuesta.")
+        parser.add_argument(
+            '--latencia-token', type=float, default=0.02,
+            help="Segundos entre fragmentos en las respuestas con stream.",
+        )
+        parser.add_argument('--fallar', type=int, default=0, help="Las primeras N llamadas fallan.")
+        parser.add_argument('--caido', action='store_true', help="Todas las llamadas fallan.")
+        parser.add_argument('--estado-fallo', type=int, default=503, help="HTTP de las llamadas que fallan (ej. 429).")
+        parser.add_argument('--retry-after', type=int, default=None, help="Cabecera Retry-After (segundos) en los fallos.")
+
+    def handle(self, *args, **options):
+        servidor = ThreadingHTTPServer(('127.0.0.1', options['puerto']), _Manejador)
+        servidor.daemon_threads = True
+        servidor.lock = threading.Lock()
+        servidor.llamadas = 0
+        servidor.latencia = options['latencia']
+        servidor.latencia_token = options['latencia_token']
+        servidor.fallar = options['fallar']
+        servidor.caido = options['caido']
+        servidor.estado_fallo = options['estado_fallo']
+        servidor.retry_after = options['retry_after']
+        self.stdout.write(f"LLM simulado en http://127.0.0.1:{options['puerto']}/openai/v1/chat/completions. Ctrl+C para detener.")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(f"LLM simulado detenido ({servidor.llamadas} llamadas).")
+        finally:
+            servidor.server_close()
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas_pagos', '0005_cita_medica_tipo'),
+        ('cuentas', '0003_usuario_token_reset_password'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InformeIAJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notas_vagas', models.TextField()),
+                ('regenerar', models.BooleanField(default=False)),
+                ('clave', models.CharField(db_index=True, help_text='Hash de clínica + notas + prompt (deduplicación)', max_length=64)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En Proceso'), ('COMPLETADO', 'Completado'), ('FALLIDO', 'Fallido')], db_index=True, default='PENDIENTE', max_length=20)),
+                ('resultado', models.TextField(blank=True)),
+                ('mensaje', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('cita', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='informe_ia_jobs', to='citas_pagos.cita_medica')),
+                ('grupo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='informe_ia_jobs', to='cuentas.grupo')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='informe_ia_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'informe_ia_job',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
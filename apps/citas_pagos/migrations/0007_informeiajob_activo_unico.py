@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas_pagos', '0006_informeiajob'),
+        ('cuentas', '0003_usuario_token_reset_password'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='informeiajob',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ('PENDIENTE', 'EN_PROCESO'))), fields=('usuario', 'cita', 'clave', 'regenerar'), name='informe_ia_job_activo_unico'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from apps.historiasDiagnosticos.models import Paciente
 from apps.doctores.models import Bloque_Horario
@@ -61,4 +62,48 @@ class Cita_Medica(models.Model):
         ]
     
     def __str__(self):
-        return f"Cita {self.id} - {self.paciente} - {self.fecha} {self.hora_inicio}"
\ No newline at end of file
+        return f"Cita {self.id} - {self.paciente} - {self.fecha} {self.hora_inicio}"
+
+
+class InformeIAJob(models.Model):
+    """
+    Borrador de informe IA pedido desde la API y generado en segundo plano por
+    `python manage.py ia_worker` (con límite de concurrencia global, por
+    clínica y de llamadas por minuto al proveedor).
+    """
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En Proceso'),
+        ('COMPLETADO', 'Completado'),
+        ('FALLIDO', 'Fallido'),
+    ]
+    ESTADOS_ACTIVOS = ('PENDIENTE', 'EN_PROCESO')
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='informe_ia_jobs')
+    cita = models.ForeignKey(Cita_Medica, on_delete=models.CASCADE, related_name='informe_ia_jobs')
+    grupo = models.ForeignKey(Grupo, on_delete=models.CASCADE, related_name='informe_ia_jobs')
+    notas_vagas = models.TextField()
+    regenerar = models.BooleanField(default=False)
+    clave = models.CharField(max_length=64, db_index=True, help_text="Hash de clínica + notas + prompt (deduplicación)")
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE', db_index=True)
+    resultado = models.TextField(blank=True)
+    mensaje = models.TextField(blank=True)
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'informe_ia_job'
+        ordering = ['-fecha_creacion']
+        constraints = [
+            # Dos clics seguidos no crean dos pedidos (dos llamadas pagas) para lo mismo
+            models.UniqueConstraint(
+                fields=['usuario', 'cita', 'clave', 'regenerar'],
+                condition=models.Q(estado__in=('PENDIENTE', 'EN_PROCESO')),
+                name='informe_ia_job_activo_unico',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Informe IA #{self.pk} cita {self.cita_id} ({self.estado})"
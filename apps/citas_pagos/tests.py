@@ -1,3 +1,222 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .ia_services import _error_api
+from .llm_client import CircuitBreaker, CircuitoAbierto, ClienteLLM, ErrorLLM, SinCupo
+from .views import CitaMedicaViewSet
+
+
+def _respuesta(status=200, lineas=(), datos=None):
+    response = mock.Mock(status_code=status, ok=200 <= status < 300, headers={})
+    response.iter_lines.return_value = iter(lineas)
+    response.json.return_value = datos if datos is not None else {}
+    return response
+
+
+def _evento(texto):
+    return "data: " + json.dumps({"choices": [{"delta": {"content": texto}}]})
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.reloj = mock.patch('apps.citas_pagos.llm_client.time.monotonic', return_value=1000.0)
+        self.monotonic = self.reloj.start()
+        self.addCleanup(self.reloj.stop)
+        self.circuito = CircuitBreaker(umbral=2, enfriamiento=30)
+
+    def _abrir_y_enfriar(self):
+        self.circuito.fallo()
+        self.circuito.fallo()
+        self.monotonic.return_value += 31
+
+    def test_se_abre_tras_el_umbral(self):
+        self.circuito.fallo()
+        self.assertTrue(self.circuito.permitir())
+        self.circuito.fallo()
+        self.assertFalse(self.circuito.permitir())
+        self.assertEqual(self.circuito.estado()['estado'], 'abierto')
+        with self.assertRaises(CircuitoAbierto):
+            self.circuito.llamada()
+
+    def test_semiabierto_deja_pasar_una_sola_prueba(self):
+        self._abrir_y_enfriar()
+        self.assertTrue(self.circuito.permitir())
+        self.assertFalse(self.circuito.permitir())
+        self.circuito.exito()
+        self.assertEqual(self.circuito.estado()['estado'], 'cerrado')
+        self.assertTrue(self.circuito.permitir())
+
+    def test_llamada_registra_fallo_con_cualquier_excepcion(self):
+        self._abrir_y_enfriar()
+        with self.assertRaises(RuntimeError):
+            with self.circuito.llamada():
+                raise RuntimeError("inesperado")
+        self.assertEqual(self.circuito.estado()['estado'], 'abierto')
+        self.monotonic.return_value += 31
+        self.assertTrue(self.circuito.permitir())
+
+    def test_llamada_resuelta_no_se_registra_dos_veces(self):
+        with self.assertRaises(ErrorLLM):
+            with self.circuito.llamada() as llamada:
+                llamada.exito()
+                raise ErrorLLM("400")
+        self.assertEqual(self.circuito.estado()['fallos_seguidos'], 0)
+
+
+class ClienteLLMTests(SimpleTestCase):
+
+    def setUp(self):
+        self.session = mock.Mock()
+        self.cliente = ClienteLLM(
+            'http://llm.test/chat', 'key', timeout_conexion=5, timeout_lectura=20, reintentos=2,
+            backoff_base=0, tiempo_maximo=10, circuito=CircuitBreaker(umbral=1, enfriamiento=30),
+        )
+        self.cliente._obtener_session = lambda: self.session
+
+    def test_stream(self):
+        self.session.post.return_value = _respuesta(lineas=[_evento("Hola"), "", _evento(" mundo"), "data: [DONE]"])
+        self.assertEqual("".join(self.cliente.post_stream({})), "Hola mundo")
+        self.assertEqual(self.cliente.circuito.estado()['estado'], 'cerrado')
+
+    def test_evento_inesperado_no_deja_colgada_la_prueba(self):
+        self.cliente.circuito.abierto_hasta = 0  # semiabierto: la próxima llamada es de prueba
+        self.cliente.circuito.fallos = 1
+        self.session.post.return_value = _respuesta(lineas=[_evento("Hola"), "data: {roto"])
+        with self.assertRaisesMessage(ErrorLLM, "evento inesperado"):
+            list(self.cliente.post_stream({}))
+        self.assertFalse(self.cliente.circuito._probando)
+        self.assertEqual(self.cliente.circuito.estado()['estado'], 'abierto')
+
+    def test_cliente_que_deja_de_leer_cuenta_como_exito(self):
+        self.cliente.circuito.abierto_hasta = 0
+        self.session.post.return_value = _respuesta(lineas=[_evento("Hola"), _evento(" mundo")])
+        fragmentos = self.cliente.post_stream({})
+        next(fragmentos)
+        fragmentos.close()
+        self.assertEqual(self.cliente.circuito.estado()['estado'], 'cerrado')
+
+    def test_error_4xx_no_abre_el_circuito(self):
+        self.session.post.return_value = _respuesta(status=401)
+        with self.assertRaises(ErrorLLM):
+            self.cliente.post_json({})
+        self.assertEqual(self.session.post.call_count, 1)
+        self.assertEqual(self.cliente.circuito.estado()['estado'], 'cerrado')
+
+    def test_timeout_de_cada_intento_respeta_el_tiempo_maximo(self):
+        self.session.post.side_effect = requests.exceptions.ReadTimeout("lento")
+        reloj = iter([100.0, 100.0, 104.0, 104.0, 109.5, 109.5])
+        with mock.patch('apps.citas_pagos.llm_client.time.monotonic', side_effect=lambda: next(reloj)), \
+                mock.patch('apps.citas_pagos.llm_client.time.sleep'):
+            with self.assertRaises(ErrorLLM):
+                self.cliente.post_json({})
+        timeouts = [llamada.kwargs['timeout'] for llamada in self.session.post.call_args_list]
+        # 10s en total: el primero usa los 5+5 que quedan, el segundo solo 6s, y no hay tercero
+        self.assertEqual(timeouts, [(5, 5.0), (5, 1.0)])
+
+    def test_limitador_cobra_cada_intento(self):
+        self.cliente.limitador = mock.Mock()
+        self.session.post.side_effect = [_respuesta(status=503), _respuesta(datos={"ok": True})]
+        with mock.patch('apps.citas_pagos.llm_client.time.sleep'):
+            self.assertEqual(self.cliente.post_json({}), {"ok": True})
+        self.assertEqual(self.cliente.limitador.esperar.call_count, 2)
+
+    def test_max_simultaneas_rechaza_sin_tocar_la_red(self):
+        cliente = ClienteLLM('http://llm.test/chat', 'key', max_simultaneas=1)
+        cliente._obtener_session = lambda: self.session
+        self.session.post.side_effect = lambda *args, **kwargs: _respuesta(lineas=[_evento("Hola"), _evento(" mundo")])
+        fragmentos = cliente.post_stream({})
+        next(fragmentos)
+        with self.assertRaises(SinCupo):
+            cliente.post_json({})
+        self.assertEqual(self.session.post.call_count, 1)
+        self.assertEqual(cliente.circuito.estado()['fallos_seguidos'], 0)
+        fragmentos.close()
+        cliente.post_json({})
+        self.assertEqual(self.session.post.call_count, 2)
+
+
+class ErrorApiTests(SimpleTestCase):
+
+    def test_codigos_http(self):
+        casos = [
+            (CircuitoAbierto("abierto", status=503, retry_after=12.5), 503, 12.5),
+            (ErrorLLM("sin conexión"), 503, None),
+            (ErrorLLM("cuota", status=429, detalle="rate limit", retry_after=7), 429, 7),
+            (SinCupo("en curso", status=429, retry_after=2), 429, 2),
+            (ErrorLLM("caído", status=503), 502, None),
+            (ErrorLLM("key inválida", status=401), 502, None),
+        ]
+        for error, status_code, wait in casos:
+            with self.subTest(error=str(error)):
+                excepcion = _error_api(error)
+                self.assertEqual(excepcion.status_code, status_code)
+                self.assertEqual(excepcion.wait, wait)
+
+    def test_circuito_abierto_informa_cuanto_falta(self):
+        circuito = CircuitBreaker(umbral=1, enfriamiento=30)
+        circuito.fallo()
+        with self.assertRaises(CircuitoAbierto) as contexto:
+            circuito.llamada()
+        self.assertAlmostEqual(contexto.exception.retry_after, 30, delta=1)
+
+
+@override_settings(GROQ_API_KEY='key')
+class GenerarReporteIAStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cliente = ClienteLLM('http://llm.test/chat', 'key', circuito=CircuitBreaker(umbral=1, enfriamiento=30))
+        self.cliente._obtener_session = mock.Mock()
+        self.cita = mock.Mock(id=1, grupo_id=1)
+        for objetivo, valor in (
+            ('apps.citas_pagos.ia_services.obtener_cliente', lambda: self.cliente),
+            ('apps.citas_pagos.views.CitaMedicaViewSet.get_object', lambda vista: self.cita),
+            ('apps.citas_pagos.views.informe_en_cache', lambda notas, grupo_id: None),
+            ('apps.citas_pagos.ia_services._guardar_cache', lambda clave, informe: None),
+            ('apps.citas_pagos.views.get_actor_usuario_from_request', lambda request: None),
+            ('apps.citas_pagos.views.log_action', lambda **kwargs: None),
+        ):
+            parche = mock.patch(objetivo, valor)
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def _post(self):
+        request = APIRequestFactory().post(
+            '/api/citas_pagos/citas/1/generar-reporte-ia-stream/',
+            {"notas_vagas": "PIO 14 AO"}, format='json', HTTP_ACCEPT='text/event-stream',
+        )
+        force_authenticate(request, user=User(username='medico'))
+        # Los kwargs de @action traen los renderers (text/event-stream)
+        vista = CitaMedicaViewSet.as_view(
+            {'post': 'generar_reporte_ia_stream'}, **CitaMedicaViewSet.generar_reporte_ia_stream.kwargs
+        )
+        return vista(request, pk=1)
+
+    def test_circuito_abierto_responde_503_sin_abrir_el_stream(self):
+        self.cliente.circuito.fallo()
+        response = self._post()
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.cliente._obtener_session.assert_not_called()
+
+    def test_stream_envia_fragmentos_y_fin(self):
+        self.cliente._obtener_session.return_value.post.return_value = _respuesta(
+            lineas=[_evento("**Plan:**"), _evento(" control"), "data: [DONE]"]
+        )
+        response = self._post()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        eventos = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            eventos,
+            'event: fragmento\ndata: {"texto": "Plan:"}\n\n'
+            'event: fragmento\ndata: {"texto": " control"}\n\n'
+            'event: fin\ndata: {"desde_cache": false}\n\n',
+        )
@@ -12,4 +12,5 @@ router.register('citas', CitaMedicaViewSet, basename='cita-medica')
 urlpatterns = [
     path('', include(router.urls)),
     path('create-payment-intent/', views.create_payment_intent, name='create-payment-intent'),
+    path('informes-ia/<int:job_id>/', views.informe_ia_job_detalle, name='informe-ia-job-detalle'),
 ]
\ No newline at end of file
@@ -1,16 +1,22 @@
+import itertools
+import json
+import math
 import stripe
 from datetime import datetime, timedelta
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.exceptions import ValidationError
-from apps.cuentas.utils import get_actor_usuario_from_request, log_action
-from apps.cuentas.models import Usuario, Grupo
+from apps.cuentas.utils import get_actor_usuario_from_request, get_usuario_perfil, log_action
+from apps.cuentas.models import Grupo
 from apps.doctores.models import Medico
 from rest_framework.response import Response
 from rest_framework.exceptions import APIException
 from rest_framework import generics
 from rest_framework import permissions
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from config import settings
 from .models import *
 from .serializers import *
@@ -18,7 +24,30 @@ from django.db.models import Q
 from apps.historiasDiagnosticos.models import Paciente
 
 # Importamos la función de nuestro servicio de IA
-from .ia_services import generar_informe_con_ia
+from .ia_services import generar_informe_cacheado, generar_informe_stream, informe_en_cache
+from .ia_jobs import encolar_informe
+
+
+def _evento_sse(evento, datos):
+    # data en JSON: los saltos de línea del informe no cortan el evento
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+def _respuesta_error_ia(e):
+    """APIException del servicio de IA -> Response con su HTTP (503, 429, 502...) y Retry-After si lo trae."""
+    wait = getattr(e, 'wait', None)
+    headers = {'Retry-After': str(math.ceil(wait))} if wait else None
+    return Response({"error": e.detail}, status=e.status_code, headers=headers)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Acepta 'Accept: text/event-stream'; las respuestas de error salen como evento 'error'."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return _evento_sse('error', data).encode('utf-8')
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 @api_view(['POST'])
@@ -48,13 +77,8 @@ class MultiTenantMixin:
     permission_classes = [permissions.IsAuthenticated]
 
     def get_user_grupo(self):
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.grupo
-            except Usuario.DoesNotExist:
-                pass
-        return None
+        usuario = get_usuario_perfil(self.request)
+        return usuario.grupo if usuario else None
 
     def get_user_medico(self):
         if hasattr(self.request, 'user') and self.request.user.is_authenticated:
@@ -70,15 +94,13 @@ class MultiTenantMixin:
         return False
 
     def get_user_paciente(self):
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
+        usuario = get_usuario_perfil(self.request)
+        if usuario:
             try:
                 from apps.historiasDiagnosticos.models import Paciente # Importación local
-                from apps.cuentas.models import Usuario # Importación local
 
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                paciente = Paciente.objects.get(usuario=usuario)
-                return paciente
-            except (Usuario.DoesNotExist, Paciente.DoesNotExist):
+                return Paciente.objects.get(usuario=usuario)
+            except Paciente.DoesNotExist:
                 pass
         return None
 
@@ -258,9 +280,12 @@ class CitaMedicaViewSet(MultiTenantMixin, viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # "regenerar": true ignora el borrador guardado para estas notas
+        regenerar = str(request.data.get('regenerar', '')).lower() in ('1', 'true')
+
         try:
-            # Llamamos al servicio de IA (que ahora usa PROMPT_V5)
-            reporte_generado = generar_informe_con_ia(notas_vagas)
+            # Llamamos al servicio de IA (que ahora usa PROMPT_V5); el cache es por clínica
+            reporte_generado, desde_cache = generar_informe_cacheado(notas_vagas, cita.grupo_id, regenerar=regenerar)
 
             # Ya NO guardamos aquí:
             # cita.reporte = reporte_generado
@@ -278,12 +303,123 @@ class CitaMedicaViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             # Devolvemos el reporte al frontend
             return Response(
                 {"reporte_generado": reporte_generado},
-                status=status.HTTP_200_OK
+                status=status.HTTP_200_OK,
+                headers={"X-Cache": "HIT" if desde_cache else "MISS"}
             )
 
         except APIException as e:
             # Si nuestro servicio lanzó un error, lo pasamos limpiamente a DRF
+            return _respuesta_error_ia(e)
+
+    @action(detail=True, methods=['post'], url_path='generar-reporte-ia-stream',
+            renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def generar_reporte_ia_stream(self, request, pk=None):
+        """
+        Igual que generar-reporte-ia, pero el reporte llega por server-sent events
+        a medida que el modelo lo escribe: eventos 'fragmento' ({"texto": ...}),
+        luego 'fin' ({"desde_cache": ...}) o 'error' ({"error": ...}).
+        """
+        cita = self.get_object()
+        notas_vagas = request.data.get('notas_vagas', '')
+        if not notas_vagas:
             return Response(
-                {"error": e.detail},
-                status=e.status_code
+                {"error": "No se proporcionaron 'notas_vagas' en el body."},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        regenerar = str(request.data.get('regenerar', '')).lower() in ('1', 'true')
+
+        informe = None if regenerar else informe_en_cache(notas_vagas, cita.grupo_id)
+        if informe is not None:
+            fragmentos = iter([informe])
+        else:
+            fragmentos = generar_informe_stream(notas_vagas, cita.grupo_id)
+            try:
+                # Se espera el primer fragmento aquí: los errores salen con su código HTTP
+                # antes del stream (503 circuito abierto o sin conexión, 429 cuota, 502...)
+                fragmentos = itertools.chain([next(fragmentos)], fragmentos)
+            except StopIteration:
+                fragmentos = iter([])
+            except APIException as e:
+                return _respuesta_error_ia(e)
+
+        actor = get_actor_usuario_from_request(self.request)
+        log_action(
+            request=self.request,
+            accion=f"Generó borrador de IA (sin guardar) para cita ID: {cita.id}",
+            objeto=f"Cita ID: {cita.id}",
+            usuario=actor
+        )
+
+        def eventos():
+            try:
+                for fragmento in fragmentos:
+                    yield _evento_sse('fragmento', {"texto": fragmento})
+            except APIException as e:
+                yield _evento_sse('error', {"error": e.detail})
+                return
+            except Exception as e:
+                # Los headers 200 ya salieron: el error solo puede llegar como evento
+                print(f"Error en el stream de IA de la cita {cita.id}: {e}")
+                yield _evento_sse('error', {"error": f"Error interno al procesar la IA: {e}"})
+                return
+            yield _evento_sse('fin', {"desde_cache": informe is not None})
+
+        response = StreamingHttpResponse(eventos(), content_type='text/event-stream; charset=utf-8')
+        response['Cache-Control'] = 'no-cache'
+        # Evita que nginx acumule los eventos antes de enviarlos
+        response['X-Accel-Buffering'] = 'no'
+        response['X-Cache'] = 'HIT' if informe is not None else 'MISS'
+        return response
+
+    @action(detail=True, methods=['post'], url_path='generar-reporte-ia-job')
+    def generar_reporte_ia_job(self, request, pk=None):
+        """
+        Encola el borrador para ia_worker y responde de inmediato (202) con el
+        job; el frontend consulta status_url hasta que esté COMPLETADO o FALLIDO.
+        """
+        cita = self.get_object()
+        notas_vagas = request.data.get('notas_vagas', '')
+        if not notas_vagas:
+            return Response(
+                {"error": "No se proporcionaron 'notas_vagas' en el body."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        regenerar = str(request.data.get('regenerar', '')).lower() in ('1', 'true')
+
+        job, creado = encolar_informe(request.user, cita, notas_vagas, regenerar=regenerar)
+        if creado:
+            actor = get_actor_usuario_from_request(self.request)
+            log_action(
+                request=self.request,
+                accion=f"Generó borrador de IA (sin guardar) para cita ID: {cita.id}",
+                objeto=f"Cita ID: {cita.id}",
+                usuario=actor
+            )
+
+        datos = _informe_ia_job_a_dict(request, job)
+        datos["reutilizado"] = not creado
+        return Response(datos, status=status.HTTP_202_ACCEPTED)
+
+
+def _informe_ia_job_a_dict(request, job):
+    datos = {
+        "job_id": job.id,
+        "cita_id": job.cita_id,
+        "estado": job.estado,
+        "mensaje": job.mensaje,
+        "fecha_creacion": job.fecha_creacion.isoformat(),
+        "fecha_fin": job.fecha_fin.isoformat() if job.fecha_fin else None,
+        "status_url": request.build_absolute_uri(reverse('informe-ia-job-detalle', args=[job.id])),
+    }
+    if job.estado == 'COMPLETADO':
+        datos["reporte_generado"] = job.resultado
+    return datos
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def informe_ia_job_detalle(request, job_id):
+    job = InformeIAJob.objects.filter(pk=job_id, usuario=request.user).first()
+    if job is None:
+        return Response({"error": "Pedido no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(_informe_ia_job_a_dict(request, job), status=status.HTTP_200_OK)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AcountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.cuentas'
+
+    def ready(self):
+        # Registra la invalidación de la cache de tokens
+        from . import signals
@@ -0,0 +1,177 @@
+# apps/cuentas/authentication.py
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import LRUCacheTTL
+
+# Cache en memoria de cada worker (TTL corto, ver AUTH_TOKEN_CACHE_TTL). Solo se usa
+# sin AUTH_TOKEN_CACHE_ALIAS: las señales de logout/suspensión solo la limpian en el
+# worker que atendió el cambio, los demás lo ven recién cuando vence el TTL.
+_cache_local = LRUCacheTTL(
+    maxsize=getattr(settings, 'AUTH_TOKEN_CACHE_MAXSIZE', 2048),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 2),
+)
+
+_PREFIJO_SHARED = 'auth_token:'
+
+
+def _cache_compartido():
+    """Backend de cache de Django compartido entre workers (opcional)."""
+    alias = getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _usar_cache_local():
+    # Con cache compartida solo se usa esa: un logout o una suspensión la limpian
+    # para todos los workers a la vez. TTL 0 desactiva la cache local.
+    return _cache_compartido() is None and getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 2) > 0
+
+
+def _cargar_info_token(key):
+    """Consulta la BD y arma la info cacheable del token (usuario auth + perfil)."""
+    from .models import Usuario
+
+    try:
+        token = Token.objects.select_related('user').get(key=key)
+    except Token.DoesNotExist:
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+    user = token.user
+    info = {
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'is_active': user.is_active,
+            'is_staff': user.is_staff,
+            'is_superuser': user.is_superuser,
+        },
+        'usuario': None,
+        'rol': None,
+        'grupo': None,
+        'suscripcion_activa': False,
+    }
+
+    perfil = (
+        Usuario.objects
+        .select_related('rol', 'grupo', 'grupo__suscripcion_info')
+        .filter(correo=user.email)
+        .first()
+    )
+    if perfil:
+        info['usuario'] = {
+            'id': perfil.id,
+            'nombre': perfil.nombre,
+            'correo': perfil.correo,
+            'estado': perfil.estado,
+            'grupo_id': perfil.grupo_id,
+            'rol_id': perfil.rol_id,
+        }
+        if perfil.rol:
+            info['rol'] = {'id': perfil.rol.id, 'nombre': perfil.rol.nombre}
+        if perfil.grupo:
+            info['grupo'] = {
+                'id': perfil.grupo.id,
+                'nombre': perfil.grupo.nombre,
+                'estado': perfil.grupo.estado,
+            }
+            suscripcion = getattr(perfil.grupo, 'suscripcion_info', None)
+            info['suscripcion_activa'] = bool(suscripcion and suscripcion.esta_activa)
+    return info
+
+
+def _instancia_parcial(model, datos):
+    """
+    Reconstruye una instancia sin tocar la BD. Los campos no cacheados quedan
+    diferidos (se cargan solo si alguien los lee) y save() solo escribe los cargados.
+    """
+    campos = [f.attname for f in model._meta.concrete_fields if f.attname in datos]
+    return model.from_db('default', campos, [datos[c] for c in campos])
+
+
+def _perfil_desde_info(info):
+    from .models import Usuario, Rol, Grupo
+
+    if not info['usuario']:
+        return None
+    perfil = _instancia_parcial(Usuario, info['usuario'])
+    perfil.rol = _instancia_parcial(Rol, info['rol']) if info['rol'] else None
+    perfil.grupo = _instancia_parcial(Grupo, info['grupo']) if info['grupo'] else None
+    return perfil
+
+
+def obtener_info_token(key):
+    compartido = _cache_compartido()
+    if compartido is not None:
+        info = compartido.get(_PREFIJO_SHARED + key)
+        if info is None:
+            info = _cargar_info_token(key)
+            compartido.set(
+                _PREFIJO_SHARED + key, info,
+                getattr(settings, 'AUTH_TOKEN_CACHE_SHARED_TTL', 300),
+            )
+        return info
+
+    if not _usar_cache_local():
+        return _cargar_info_token(key)
+    info = _cache_local.get(key)
+    if info is None:
+        info = _cargar_info_token(key)
+        _cache_local.set(key, info)
+    return info
+
+
+def invalidar_tokens(keys):
+    keys = list(keys)
+    for key in keys:
+        _cache_local.delete(key)
+    compartido = _cache_compartido()
+    if compartido is not None and keys:
+        compartido.delete_many([_PREFIJO_SHARED + k for k in keys])
+
+
+def invalidar_tokens_usuario(correo):
+    """Invalida el token cacheado del usuario (cambio de rol, grupo o estado)."""
+    _cache_local.delete_where(lambda info: info['user']['email'] == correo)
+    if _cache_compartido() is not None:
+        invalidar_tokens(Token.objects.filter(user__email=correo).values_list('key', flat=True))
+
+
+def invalidar_tokens_grupo(grupo_id):
+    """Invalida los tokens cacheados de todos los usuarios de un grupo (suspender/activar)."""
+    from .models import Usuario
+
+    _cache_local.delete_where(lambda info: info['grupo'] and info['grupo']['id'] == grupo_id)
+    if _cache_compartido() is not None:
+        correos = Usuario.objects.filter(grupo_id=grupo_id).values('correo')
+        invalidar_tokens(Token.objects.filter(user__email__in=correos).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication con cache token -> (usuario auth, perfil, rol, grupo, suscripción).
+    En un acierto no se consulta la BD: el User y el perfil Usuario se reconstruyen
+    desde la cache y el perfil queda listo para get_usuario_perfil().
+    """
+
+    def authenticate(self, request):
+        resultado = super().authenticate(request)
+        if resultado is not None:
+            http_request = getattr(request, '_request', request)
+            http_request._usuario_perfil = _perfil_desde_info(self._info)
+            http_request.token_info = self._info
+        return resultado
+
+    def authenticate_credentials(self, key):
+        info = obtener_info_token(key)
+        if not info['user']['is_active']:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        self._info = info
+        user = _instancia_parcial(User, info['user'])
+        return (user, Token(key=key, user_id=user.id))
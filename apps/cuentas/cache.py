@@ -0,0 +1,93 @@
+# apps/cuentas/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCacheTTL:
+    """
+    Cache LRU en memoria del proceso con expiración por TTL (thread-safe).
+    Cuando se llena, descarta la entrada usada hace más tiempo.
+    Lleva contadores de aciertos/fallos para exponer métricas.
+
+    Con maxbytes y peso (función valor -> bytes) además limita el tamaño total.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, maxbytes=None, peso=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self._peso = peso or (lambda valor: 0)
+        self._bytes = 0
+        self._datos = OrderedDict()  # key -> (expira_en, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _quitar(self, key):
+        _, valor = self._datos.pop(key)
+        self._bytes -= self._peso(valor)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._datos.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expira_en, valor = item
+            if expira_en is not None and expira_en <= time.monotonic():
+                self._quitar(key)
+                self.misses += 1
+                return default
+            self._datos.move_to_end(key)
+            self.hits += 1
+            return valor
+
+    def set(self, key, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expira_en = time.monotonic() + ttl if ttl else None
+        peso = self._peso(valor)
+        with self._lock:
+            if key in self._datos:
+                self._quitar(key)
+            if self.maxbytes and peso > self.maxbytes:
+                # No entra: no vale la pena vaciar todo el cache por ella
+                return
+            self._datos[key] = (expira_en, valor)
+            self._bytes += peso
+            while len(self._datos) > self.maxsize or (self.maxbytes and self._bytes > self.maxbytes):
+                self._quitar(next(iter(self._datos)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._datos:
+                self._quitar(key)
+
+    def delete_where(self, predicado):
+        """Elimina las entradas cuyo valor cumple el predicado. Retorna cuántas borró."""
+        with self._lock:
+            claves = [k for k, (_, valor) in self._datos.items() if predicado(valor)]
+            for k in claves:
+                self._quitar(k)
+            return len(claves)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._datos)
+
+    def stats(self):
+        total = self.hits + self.misses
+        datos = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self._datos),
+            "maxsize": self.maxsize,
+        }
+        if self.maxbytes:
+            datos.update(bytes=self._bytes, maxbytes=self.maxbytes)
+        return datos
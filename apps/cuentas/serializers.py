@@ -3,6 +3,7 @@ from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.db import transaction
 from .models import *
+from .utils import get_usuario_perfil
 
 class GrupoSerializer(serializers.ModelSerializer):
     admin_nombre = serializers.CharField(write_only=True, required=True)
@@ -93,12 +94,9 @@ class PagoSerializer(serializers.ModelSerializer):
         # Auto-asignar grupo del usuario actual si no se especifica
         request = self.context.get('request')
         if request and request.user:
-            try:
-                usuario_perfil = Usuario.objects.get(correo=request.user.email)
-                if usuario_perfil.grupo and 'grupo' not in validated_data:
-                    validated_data['grupo'] = usuario_perfil.grupo
-            except Usuario.DoesNotExist:
-                pass
+            usuario_perfil = get_usuario_perfil(request)
+            if usuario_perfil and usuario_perfil.grupo and 'grupo' not in validated_data:
+                validated_data['grupo'] = usuario_perfil.grupo
         
         return super().create(validated_data)
 
@@ -125,18 +123,15 @@ class UsuarioSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         # Solo valida grupo si hay usuario autenticado
         if request and hasattr(request.user, 'email') and request.user.is_authenticated:
-            try:
-                usuario_creador = Usuario.objects.get(correo=request.user.email)
-                # Si no es super admin, debe usar su mismo grupo
-                if usuario_creador.rol.nombre != 'superAdmin':
-                    if 'grupo' in data and data['grupo'] != usuario_creador.grupo:
-                        raise serializers.ValidationError({
-                            'grupo': 'No puedes registrar usuarios en otros grupos'
-                        })
-                    # Forzar el grupo del creador
-                    data['grupo'] = usuario_creador.grupo
-            except Usuario.DoesNotExist:
-                pass
+            usuario_creador = get_usuario_perfil(request)
+            # Si no es super admin, debe usar su mismo grupo
+            if usuario_creador and usuario_creador.rol.nombre != 'superAdmin':
+                if 'grupo' in data and data['grupo'] != usuario_creador.grupo:
+                    raise serializers.ValidationError({
+                        'grupo': 'No puedes registrar usuarios en otros grupos'
+                    })
+                # Forzar el grupo del creador
+                data['grupo'] = usuario_creador.grupo
         # Si no hay usuario autenticado, no valida grupo
         return data
     
@@ -144,14 +139,12 @@ class UsuarioSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         # Solo asigna grupo si hay usuario autenticado
         if request and hasattr(request.user, 'email') and request.user.is_authenticated:
-            try:
-                usuario_creador = Usuario.objects.get(correo=request.user.email)
-                if (usuario_creador.rol.nombre != 'superAdmin' and 
-                    usuario_creador.grupo and 
-                    'grupo' not in validated_data):
-                    validated_data['grupo'] = usuario_creador.grupo
-            except Usuario.DoesNotExist:
-                pass
+            usuario_creador = get_usuario_perfil(request)
+            if (usuario_creador and
+                usuario_creador.rol.nombre != 'superAdmin' and 
+                usuario_creador.grupo and 
+                'grupo' not in validated_data):
+                validated_data['grupo'] = usuario_creador.grupo
         
         password = validated_data.pop('password', None)
         if password:
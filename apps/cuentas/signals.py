@@ -0,0 +1,31 @@
+# apps/cuentas/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidar_tokens, invalidar_tokens_grupo, invalidar_tokens_usuario
+from .models import Grupo, Usuario
+
+
+@receiver(post_delete, sender=Token)
+def token_eliminado(sender, instance, **kwargs):
+    # logout y cualquier borrado de tokens
+    invalidar_tokens([instance.key])
+
+
+@receiver(post_save, sender=Grupo)
+def grupo_guardado(sender, instance, **kwargs):
+    # suspender/activar y cambios de estado por pagos
+    invalidar_tokens_grupo(instance.id)
+
+
+@receiver(post_save, sender='suscripciones.Suscripcion')
+def suscripcion_guardada(sender, instance, **kwargs):
+    invalidar_tokens_grupo(instance.grupo_id)
+
+
+@receiver(post_save)
+def usuario_guardado(sender, instance, **kwargs):
+    # Incluye subclases de Usuario (Medico): cambio de rol, grupo o estado
+    if issubclass(sender, Usuario):
+        invalidar_tokens_usuario(instance.correo)
@@ -1,15 +1,37 @@
+_PERFIL_NO_RESUELTO = object()
+
+
+def get_usuario_perfil(request):
+    """
+    Devuelve el perfil Usuario (con rol y grupo precargados) del usuario autenticado.
+    Se resuelve una sola vez por request y se guarda en el HttpRequest subyacente,
+    así mixins, bitácora y reportes comparten la misma consulta.
+    Retorna None si no hay usuario autenticado o no tiene perfil.
+    """
+    # Con DRF el request es un wrapper; el cache vive en el HttpRequest original
+    http_request = getattr(request, '_request', request)
+    perfil = getattr(http_request, '_usuario_perfil', _PERFIL_NO_RESUELTO)
+    if perfil is not _PERFIL_NO_RESUELTO:
+        return perfil
+
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        # No se cachea: la autenticación por token puede ocurrir más tarde
+        return None
+
+    from .models import Usuario
+    perfil = Usuario.objects.select_related('rol', 'grupo').filter(correo=user.email).first()
+    http_request._usuario_perfil = perfil
+    return perfil
+
+
 def get_actor_usuario_from_request(request):
     """
     Intenta obtener el usuario actor desde el request.
     Retorna None si no se puede obtener.
     """
     try:
-        # Si tienes autenticación por token
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            # Buscar el Usuario correspondiente por email
-            from .models import Usuario
-            return Usuario.objects.filter(correo=request.user.email).first()
-        return None
+        return get_usuario_perfil(request)
     except:
         return None
 
@@ -31,15 +53,10 @@ def log_action(request, accion, objeto=None, usuario=None):
         if usuario and hasattr(usuario, 'grupo') and usuario.grupo:
             grupo = usuario.grupo
         else:
-            # Si no hay usuario (login, anon, etc.), intentar tomar el grupo del request
-            # Por ejemplo, si usas MultiTenantMixin, podrías agregar:
-            if hasattr(request, 'user') and request.user.is_authenticated:
-                from .models import Usuario
-                try:
-                    perfil = Usuario.objects.get(correo=request.user.email)
-                    grupo = perfil.grupo
-                except Usuario.DoesNotExist:
-                    pass
+            # Si no hay usuario (login, anon, etc.), intentar tomar el grupo del perfil del request
+            perfil = get_usuario_perfil(request)
+            if perfil:
+                grupo = perfil.grupo
 
         Bitacora.objects.create(
             usuario=usuario,
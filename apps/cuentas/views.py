@@ -4,7 +4,7 @@ from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework import generics
 from rest_framework import permissions
-from .utils import get_actor_usuario_from_request, log_action
+from .utils import get_actor_usuario_from_request, get_usuario_perfil, log_action
 from .models import *
 from .serializers import *
 from rest_framework.authtoken.models import Token
@@ -25,22 +25,14 @@ class MultiTenantMixin:
     
     def get_user_grupo(self):
         """Obtiene el grupo del usuario actual"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.grupo
-            except Usuario.DoesNotExist:
-                pass
-        return None
+        usuario = get_usuario_perfil(self.request)
+        return usuario.grupo if usuario else None
     
     def is_super_admin(self):
         """Verifica si el usuario actual es super admin"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.rol and usuario.rol.nombre == 'superAdmin'  # Cambiar aquí también
-            except Usuario.DoesNotExist:
-                pass
+        usuario = get_usuario_perfil(self.request)
+        if usuario:
+            return usuario.rol and usuario.rol.nombre == 'superAdmin'  # Cambiar aquí también
         return False
     
     def filter_by_grupo(self, queryset):
@@ -80,22 +72,14 @@ class GrupoViewSet(viewsets.ModelViewSet):
             return Grupo.objects.none()
     
     def is_super_admin(self):
-        if not self.request.user.is_authenticated:
-            return False
-        try:
-            usuario = Usuario.objects.get(correo=self.request.user.email)
-            return usuario.rol and usuario.rol.nombre == 'superAdmin'
-        except Usuario.DoesNotExist:
+        usuario = get_usuario_perfil(self.request)
+        if not usuario:
             return False
+        return usuario.rol and usuario.rol.nombre == 'superAdmin'
     
     def get_user_grupo(self):
-        if not self.request.user.is_authenticated:
-            return None
-        try:
-            usuario = Usuario.objects.get(correo=self.request.user.email)
-            return usuario.grupo
-        except Usuario.DoesNotExist:
-            return None
+        usuario = get_usuario_perfil(self.request)
+        return usuario.grupo if usuario else None
     
     def perform_create(self, serializer):
         grupo = serializer.save()
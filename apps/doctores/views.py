@@ -4,7 +4,7 @@ from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework import generics
 from rest_framework import permissions
-from apps.cuentas.utils import get_actor_usuario_from_request, log_action
+from apps.cuentas.utils import get_actor_usuario_from_request, get_usuario_perfil, log_action
 from django.db.models import Q
 from apps.citas_pagos.models import Cita_Medica
 #lo coloco coemntado para colocar la importacion directo en la funcion
@@ -23,22 +23,14 @@ class MultiTenantMixin:
     
     def get_user_grupo(self):
         """Obtiene el grupo del usuario actual"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.grupo
-            except Usuario.DoesNotExist:
-                pass
-        return None
+        usuario = get_usuario_perfil(self.request)
+        return usuario.grupo if usuario else None
     
     def is_super_admin(self):
         """Verifica si el usuario actual es super admin"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.rol and usuario.rol.nombre == 'superAdmin'
-            except Usuario.DoesNotExist:
-                pass
+        usuario = get_usuario_perfil(self.request)
+        if usuario:
+            return usuario.rol and usuario.rol.nombre == 'superAdmin'
         return False
     
     def filter_by_grupo(self, queryset):
@@ -98,8 +90,9 @@ class MedicoViewSet(MultiTenantMixin, viewsets.ModelViewSet):
     def perform_create(self, serializer):
         # Asignar automáticamente el grupo del usuario que crea
         try:
-            usuario = Usuario.objects.get(correo=self.request.user.email)
-       
+            usuario = get_usuario_perfil(self.request)
+            if usuario is None:
+                raise Usuario.DoesNotExist
             
             # ASIGNAR ROL MÉDICO AUTOMÁTICAMENTE
             try:
@@ -379,11 +372,7 @@ class BloqueHorarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             return Response({'error': 'Médico no encontrado'}, status=status.HTTP_404_NOT_FOUND)
         
         # Verificar que el paciente pueda ver médicos de su clínica
-        usuario_actual = None
-        try:
-            usuario_actual = Usuario.objects.get(correo=self.request.user.email)
-        except Usuario.DoesNotExist:
-            pass
+        usuario_actual = get_usuario_perfil(self.request)
         
         # Si el usuario es paciente, verificar que el médico sea de su misma clínica
         if usuario_actual and usuario_actual.rol and usuario_actual.rol.nombre == 'paciente':
@@ -5,8 +5,8 @@ from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from .models import *
 from .serializers import *
-from apps.cuentas.models import Usuario,Rol
-from apps.cuentas.utils import get_actor_usuario_from_request, log_action
+from apps.cuentas.models import Rol
+from apps.cuentas.utils import get_actor_usuario_from_request, get_usuario_perfil, log_action
 from django.contrib.auth.models import User
 from apps.citas_pagos.serializers import CitaMedicaDetalleSerializer
 from apps.citas_pagos.models import Cita_Medica
@@ -23,22 +23,14 @@ class MultiTenantMixin:
     
     def get_user_grupo(self):
         """Obtiene el grupo del usuario actual"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.grupo
-            except Usuario.DoesNotExist:
-                pass
-        return None
+        usuario = get_usuario_perfil(self.request)
+        return usuario.grupo if usuario else None
     
     def is_super_admin(self):
         """Verifica si el usuario actual es super admin"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.rol and usuario.rol.nombre == 'superAdmin'
-            except Usuario.DoesNotExist:
-                pass
+        usuario = get_usuario_perfil(self.request)
+        if usuario:
+            return usuario.rol and usuario.rol.nombre == 'superAdmin'
         return False
     
     def filter_by_grupo(self, queryset):
@@ -69,7 +61,7 @@ class PatologiasOViewSet(MultiTenantMixin, viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         # Asignar automáticamente el grupo del usuario que crea
-        usuario = Usuario.objects.get(correo=self.request.user.email)
+        usuario = get_usuario_perfil(self.request)
         patologia = serializer.save(grupo=usuario.grupo)
         
         # Log de la acción
@@ -147,7 +139,7 @@ class TratamientoMedicacionViewSet(MultiTenantMixin, viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         # Asignar automáticamente el grupo del usuario que crea
-        usuario = Usuario.objects.get(correo=self.request.user.email)
+        usuario = get_usuario_perfil(self.request)
         tratamiento = serializer.save(grupo=usuario.grupo)
         
         # Log de la acción
@@ -313,7 +305,7 @@ class ResultadoExamenesViewSet(MultiTenantMixin, viewsets.ModelViewSet):
                 print('DEBUG perform_create: archivo_url generado:', archivo_url)
             else:
                 print('DEBUG perform_create: No se recibió archivo')
-            usuario = Usuario.objects.get(correo=self.request.user.email)
+            usuario = get_usuario_perfil(self.request)
             resultado = serializer.save(grupo=usuario.grupo, archivo_url=archivo_url)
             print('DEBUG perform_create: resultado.archivo_url guardado:', resultado.archivo_url)
 
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ReportesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.reportes'
+
+    def ready(self):
+        # Registra la invalidación del cache de reportes
+        from . import signals
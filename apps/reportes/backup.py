@@ -0,0 +1,346 @@
+# apps/reportes/backup.py
+import io
+import json
+import os
+import zipfile
+from datetime import date, datetime
+
+from django.apps import apps
+from django.db import connection
+
+# Tamaño aproximado de cada pedazo que se entrega al cliente
+TAMANIO_BLOQUE = 64 * 1024
+CHUNK_FILAS = 2000
+
+
+class _SalidaZip(io.RawIOBase):
+    """
+    Destino de solo escritura para zipfile: acumula lo escrito hasta que el
+    generador lo entrega. No es 'seekable', así zipfile escribe en modo streaming
+    (descriptores de datos al final de cada archivo) y nunca vuelve atrás.
+    """
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def vaciar(self):
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+
+def valor_sql(value):
+    """Formatea un valor Python como literal SQL para un INSERT."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return f"'{value.isoformat()}'"
+    # Escapar comillas simples
+    escaped = str(value).replace("'", "''")
+    return f"'{escaped}'"
+
+
+def _lineas_modelo(model):
+    """INSERTs de un modelo, leídos con cursor por bloques (memoria constante)."""
+    table_name = model._meta.db_table
+    yield f"-- Backup de {model._meta.label}\n"
+    yield f"-- Tabla: {table_name}\n\n"
+
+    fields = model._meta.fields
+    columns_str = ", ".join(f.column for f in fields)
+    filas = model.objects.values_list(*[f.attname for f in fields]).iterator(chunk_size=CHUNK_FILAS)
+    for row in filas:
+        values_str = ", ".join(valor_sql(v) for v in row)
+        yield f"INSERT INTO {table_name} ({columns_str}) VALUES ({values_str});\n"
+    yield "\n"
+
+
+def _lineas_esquema():
+    yield "-- Esquema de la base de datos\n\n"
+    with connection.cursor() as cur:
+        cur.execute("""
+            SELECT table_name
+            FROM information_schema.tables
+            WHERE table_schema='public' AND table_type='BASE TABLE'
+            ORDER BY table_name
+        """)
+        tables = [row[0] for row in cur.fetchall()]
+
+        for table in tables:
+            cur.execute("""
+                SELECT column_name, data_type, character_maximum_length,
+                is_nullable, column_default
+                FROM information_schema.columns
+                WHERE table_name = %s AND table_schema='public'
+                ORDER BY ordinal_position
+            """, [table])
+
+            yield f"-- Tabla: {table}\n"
+            for col_name, dtype, max_len, nullable, default in cur.fetchall():
+                len_str = f"({max_len})" if max_len else ""
+                null_str = "NULL" if nullable == "YES" else "NOT NULL"
+                def_str = f" DEFAULT {default}" if default else ""
+                yield f"--   {col_name}: {dtype}{len_str} {null_str}{def_str}\n"
+            yield "\n"
+
+
+def _escribir(zf, salida, nombre, lineas):
+    """Escribe un archivo del zip a partir de un iterable de texto y va entregando bytes."""
+    pendiente = []
+    tamanio = 0
+    with zf.open(nombre, "w", force_zip64=True) as destino:
+        for linea in lineas:
+            pendiente.append(linea)
+            tamanio += len(linea)
+            if tamanio >= TAMANIO_BLOQUE:
+                destino.write("".join(pendiente).encode("utf-8"))
+                pendiente, tamanio = [], 0
+                datos = salida.vaciar()
+                if datos:
+                    yield datos
+        if pendiente:
+            destino.write("".join(pendiente).encode("utf-8"))
+    datos = salida.vaciar()
+    if datos:
+        yield datos
+
+
+def generar_backup_sql_zip(ts):
+    """
+    Generador del backup completo en ZIP: un .sql con INSERTs por modelo, el
+    esquema y los metadatos. Entrega el ZIP por pedazos para usarlo con
+    StreamingHttpResponse.
+    """
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        # 1) Datos de cada modelo en SQL (1 archivo por modelo)
+        for model in apps.get_models():
+            yield from _escribir(zf, salida, f"{model._meta.label}.sql", _lineas_modelo(model))
+
+        # 2) Esquema completo
+        yield from _escribir(zf, salida, "schema.sql", _lineas_esquema())
+
+        # 3) Metadatos
+        meta = {
+            "generated_at": ts,
+            "db_name": os.getenv("DB_NAME"),
+            "db_user": os.getenv("DB_USER"),
+            "db_host": os.getenv("DB_HOST"),
+            "db_port": os.getenv("DB_PORT"),
+            "engine": "postgresql (via Django ORM)",
+            "format": "SQL INSERT statements"
+        }
+        yield from _escribir(zf, salida, "metadata.json", [json.dumps(meta, indent=2)])
+    # Directorio central del ZIP
+    datos = salida.vaciar()
+    if datos:
+        yield datos
+
+
+# ==========================================
+# BACKUP / RESTORE CON COPY (PostgreSQL)
+# ==========================================
+# En lugar de formatear cada fila como INSERT en Python, se usa COPY ... TO STDOUT
+# y COPY ... FROM STDIN a través de la API de copy de psycopg. Puede limitarse a
+# las filas de una clínica (grupo_id). Ver los comandos backup_copy y restore_copy.
+
+FORMATOS_COPY = ('binary', 'csv')
+TAMANIO_LECTURA_COPY = 1024 * 1024
+
+
+class ErrorBackup(Exception):
+    pass
+
+
+def _ruta_grupo(model, profundidad=4):
+    """
+    Lookup del ORM que lleva del modelo a su clínica (p.ej. 'grupo',
+    'usuario__grupo', 'grupo_id'), o None si el modelo no pertenece a ninguna.
+    """
+    Grupo = apps.get_model('cuentas', 'Grupo')
+    if model is Grupo:
+        return 'pk'
+    # Tablas del DataMart: grupo_id entero, sin FK
+    if any(f.attname == 'grupo_id' and not f.is_relation for f in model._meta.concrete_fields):
+        return 'grupo_id'
+
+    pendientes = [(model, '')]
+    visitados = {model}
+    for _ in range(profundidad):
+        siguientes = []
+        for actual, prefijo in pendientes:
+            for f in actual._meta.concrete_fields:
+                if not (f.many_to_one or f.one_to_one):
+                    continue
+                ruta = f"{prefijo}{f.name}"
+                if f.related_model is Grupo:
+                    return ruta
+                if f.related_model not in visitados:
+                    visitados.add(f.related_model)
+                    siguientes.append((f.related_model, f"{ruta}__"))
+        pendientes = siguientes
+    return None
+
+
+def _ordenar_por_dependencias(modelos):
+    """Padres antes que hijos (las FK de Django son diferidas, pero así es más claro)."""
+    restantes = list(modelos)
+    ordenados = []
+    while restantes:
+        listos = [
+            m for m in restantes
+            if not any(
+                f.related_model in restantes and f.related_model is not m
+                for f in m._meta.local_concrete_fields if f.is_relation
+            )
+        ]
+        if not listos:  # ciclo: se agrega el resto tal cual
+            listos = restantes[:]
+        ordenados.extend(listos)
+        restantes = [m for m in restantes if m not in listos]
+    return ordenados
+
+
+def _modelos_backup(grupo_id=None):
+    """[(modelo, ruta_grupo)] a respaldar: todos, o solo los que pertenecen a una clínica."""
+    modelos = [
+        m for m in apps.get_models(include_auto_created=True)
+        if m._meta.managed and not m._meta.proxy
+    ]
+    seleccion = []
+    for model in _ordenar_por_dependencias(modelos):
+        ruta = _ruta_grupo(model)
+        if grupo_id is not None and ruta is None:
+            continue
+        seleccion.append((model, ruta))
+    return seleccion
+
+
+def _queryset_backup(model, ruta, grupo_id):
+    qs = model._base_manager.order_by()
+    if grupo_id is not None:
+        qs = qs.filter(**{ruta: grupo_id})
+    return qs
+
+
+def _verificar_postgresql():
+    if connection.vendor != 'postgresql':
+        raise ErrorBackup("El backup con COPY requiere PostgreSQL.")
+
+
+def exportar_copy(destino, grupo_id=None, formato='binary'):
+    """
+    Escribe en `destino` (ruta o archivo binario) un ZIP con un archivo COPY por
+    tabla y un manifest.json. Retorna el manifiesto.
+    """
+    _verificar_postgresql()
+    if formato not in FORMATOS_COPY:
+        raise ErrorBackup(f"Formato no soportado: {formato}")
+
+    manifiesto = {
+        "generated_at": datetime.now().isoformat(),
+        "formato": formato,
+        "grupo_id": grupo_id,
+        "tablas": [],
+    }
+    opcion = "FORMAT binary" if formato == 'binary' else "FORMAT csv"
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        with connection.cursor() as cursor:
+            for model, ruta in _modelos_backup(grupo_id):
+                campos = model._meta.local_concrete_fields
+                sql, params = (
+                    _queryset_backup(model, ruta, grupo_id)
+                    .values_list(*[f.attname for f in campos])
+                    .query.sql_with_params()
+                )
+                archivo = f"{model._meta.db_table}.copy"
+                with zf.open(archivo, "w", force_zip64=True) as salida, connection.wrap_database_errors:
+                    with cursor.cursor.copy(f"COPY ({sql}) TO STDOUT ({opcion})", params) as copy:
+                        for bloque in copy:
+                            salida.write(bloque)
+                manifiesto["tablas"].append({
+                    "modelo": model._meta.label,
+                    "tabla": model._meta.db_table,
+                    "columnas": [f.column for f in campos],
+                    "ruta_grupo": ruta,
+                    "archivo": archivo,
+                    "filas": cursor.cursor.rowcount,
+                })
+        zf.writestr("manifest.json", json.dumps(manifiesto, indent=2))
+    return manifiesto
+
+
+def _modelo_por_label(label):
+    app_label, model_name = label.split('.')
+    return apps.get_model(app_label, model_name)
+
+
+def _borrar_existentes(cursor, manifiesto):
+    """Borra (hijos primero) las filas que el backup va a reemplazar."""
+    grupo_id = manifiesto["grupo_id"]
+    for tabla in reversed(manifiesto["tablas"]):
+        model = _modelo_por_label(tabla["modelo"])
+        quote = connection.ops.quote_name
+        if grupo_id is None:
+            cursor.execute(f"DELETE FROM {quote(tabla['tabla'])}")
+            continue
+        sql, params = (
+            _queryset_backup(model, tabla["ruta_grupo"], grupo_id)
+            .values_list(model._meta.pk.attname)
+            .query.sql_with_params()
+        )
+        cursor.execute(
+            f"DELETE FROM {quote(tabla['tabla'])} WHERE {quote(model._meta.pk.column)} IN ({sql})",
+            params,
+        )
+
+
+def restaurar_copy(origen, reemplazar=False):
+    """
+    Carga un ZIP generado por exportar_copy en una sola transacción. Con
+    reemplazar=True primero borra las filas existentes del mismo alcance
+    (toda la base o la clínica). Retorna el manifiesto.
+    """
+    _verificar_postgresql()
+    from django.core.management.color import no_style
+    from django.db import transaction
+
+    with zipfile.ZipFile(origen) as zf:
+        manifiesto = json.loads(zf.read("manifest.json"))
+        opcion = "FORMAT binary" if manifiesto["formato"] == 'binary' else "FORMAT csv"
+        quote = connection.ops.quote_name
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            if reemplazar:
+                _borrar_existentes(cursor, manifiesto)
+
+            for tabla in manifiesto["tablas"]:
+                columnas = ", ".join(quote(c) for c in tabla["columnas"])
+                # wrap_database_errors: los errores de psycopg salen como IntegrityError, etc.
+                with zf.open(tabla["archivo"]) as entrada, connection.wrap_database_errors:
+                    with cursor.cursor.copy(f"COPY {quote(tabla['tabla'])} ({columnas}) FROM STDIN ({opcion})") as copy:
+                        while bloque := entrada.read(TAMANIO_LECTURA_COPY):
+                            copy.write(bloque)
+
+            # Las secuencias de los id deben quedar por encima de lo restaurado
+            modelos = [_modelo_por_label(t["modelo"]) for t in manifiesto["tablas"]]
+            for sql in connection.ops.sequence_reset_sql(no_style(), modelos):
+                cursor.execute(sql)
+    return manifiesto
@@ -0,0 +1,140 @@
+# apps/reportes/cache.py
+import hashlib
+import json
+from datetime import date
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.http import FileResponse, HttpResponse
+
+from apps.cuentas.cache import LRUCacheTTL
+from apps.cuentas.utils import get_usuario_perfil
+from .models import ReporteDataVersion
+
+# Archivos ya generados (PDF/Excel), por worker. La clave incluye la versión de los
+# datos de la clínica: tras un cambio, las entradas viejas dejan de pedirse y salen por LRU/TTL.
+_cache_reportes = LRUCacheTTL(
+    maxsize=getattr(settings, 'REPORTES_CACHE_MAXSIZE', 64),
+    ttl=getattr(settings, 'REPORTES_CACHE_TTL', 3600),
+    maxbytes=getattr(settings, 'REPORTES_CACHE_MAX_BYTES', 128 * 1024 * 1024),
+    peso=lambda artefacto: len(artefacto['contenido']),
+)
+
+# Archivos más grandes que esto no se guardan (se envían tal cual)
+MAX_BYTES_ARTEFACTO = getattr(settings, 'REPORTES_CACHE_MAX_ARTEFACTO', 16 * 1024 * 1024)
+
+ALCANCE_GLOBAL = '*'
+PARAMETROS_REPORTE = ('fecha_inicio', 'fecha_fin')
+
+
+def version_reportes(alcance):
+    """Versión de la clínica, o la suma de todas para superAdmin (cualquier incremento la cambia)."""
+    if alcance == ALCANCE_GLOBAL:
+        return ReporteDataVersion.objects.aggregate(total=Sum('version'))['total'] or 0
+    version = ReporteDataVersion.objects.filter(grupo_id=alcance).values_list('version', flat=True).first()
+    return version or 0
+
+
+def incrementar_version_reportes(grupo_id):
+    """Lo llaman las señales de Cita_Medica, Paciente y Usuario."""
+    if grupo_id is None:
+        return
+    actualizados = ReporteDataVersion.objects.filter(grupo_id=grupo_id).update(version=F('version') + 1)
+    if not actualizados:
+        ReporteDataVersion.objects.bulk_create([ReporteDataVersion(grupo_id=grupo_id, version=1)], ignore_conflicts=True)
+
+
+def clave_reporte(tipo, alcance, parametros, version, usuario_id=None):
+    """Mismo tipo + clínica + fechas + versión de datos => mismo archivo."""
+    contenido = json.dumps([tipo, alcance, parametros, version, usuario_id], sort_keys=True)
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+
+def _alcance(perfil):
+    if perfil.rol and perfil.rol.nombre == 'superAdmin':
+        return ALCANCE_GLOBAL
+    return perfil.grupo_id
+
+
+def _parametros(request):
+    parametros = {n: (request.query_params.get(n) or '').strip() for n in PARAMETROS_REPORTE}
+    # Sin fechas, las vistas usan rangos relativos a hoy: el día entra en la clave
+    if not all(parametros.values()):
+        parametros['hoy'] = date.today().isoformat()
+    return parametros
+
+
+def _artefacto(response):
+    """Contenido de una respuesta exitosa, o None si es demasiado grande para guardarla."""
+    if isinstance(response, FileResponse):
+        archivo = response.file_to_stream
+        tamanio = archivo.seek(0, 2)
+        archivo.seek(0)
+        if tamanio > MAX_BYTES_ARTEFACTO:
+            return None
+        contenido = archivo.read()
+        response.close()
+    elif response.streaming:
+        return None
+    else:
+        contenido = response.content
+        if len(contenido) > MAX_BYTES_ARTEFACTO:
+            return None
+    return {
+        'contenido': contenido,
+        'content_type': response['Content-Type'],
+        'disposicion': response.get('Content-Disposition', ''),
+    }
+
+
+def _respuesta(artefacto, estado_cache):
+    response = HttpResponse(artefacto['contenido'], content_type=artefacto['content_type'])
+    if artefacto['disposicion']:
+        response['Content-Disposition'] = artefacto['disposicion']
+    response['Content-Length'] = str(len(artefacto['contenido']))
+    response['X-Cache'] = estado_cache
+    return response
+
+
+def cache_reporte(tipo, por_usuario=False):
+    """
+    Decorador para las vistas de reportes (debajo de @api_view). Reutiliza el
+    archivo generado mientras no cambien los datos de la clínica.
+    por_usuario=True para los reportes que muestran quién los generó.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            perfil = get_usuario_perfil(request)
+            alcance = _alcance(perfil) if perfil else None
+            if alcance is None:
+                # Sin perfil o sin clínica: la vista responde el error/vacío que corresponda
+                return vista(request, *args, **kwargs)
+
+            clave = clave_reporte(
+                tipo, alcance, _parametros(request), version_reportes(alcance),
+                usuario_id=perfil.pk if por_usuario else None,
+            )
+            artefacto = _cache_reportes.get(clave)
+            if artefacto is not None:
+                return _respuesta(artefacto, 'HIT')
+
+            response = vista(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            artefacto = _artefacto(response)
+            if artefacto is None:
+                return response
+            _cache_reportes.set(clave, artefacto)
+            return _respuesta(artefacto, 'MISS')
+        return envoltura
+    return decorador
+
+
+def estadisticas():
+    return _cache_reportes.stats()
+
+
+def limpiar():
+    _cache_reportes.clear()
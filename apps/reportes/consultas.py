@@ -0,0 +1,149 @@
+# apps/reportes/consultas.py
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from apps.citas_pagos.models import Cita_Medica
+from apps.cuentas.models import Bitacora, Usuario
+from apps.cuentas.utils import get_usuario_perfil
+from apps.historiasDiagnosticos.models import Paciente
+
+# Filas leídas por viaje al servidor (cursor del lado del servidor en PostgreSQL)
+CHUNK_FILAS = 2000
+
+# Datos que usan los reportes. Por recurso: queryset base, campo del grupo (tenant),
+# campo de fecha para los filtros y las columnas disponibles (nombre -> ruta en values_list).
+RECURSOS = {
+    'citas': {
+        'queryset': lambda: Cita_Medica.objects.all(),
+        'grupo': 'grupo_id',
+        'fecha': 'fecha',
+        'columnas': {
+            'id': 'id',
+            'fecha': 'fecha',
+            'hora_inicio': 'hora_inicio',
+            'hora_fin': 'hora_fin',
+            'paciente': 'paciente__usuario__nombre',
+            'medico': 'bloque_horario__medico__nombre',
+            'estado': 'estado_cita',
+            'tipo': 'tipo',
+            'notas': 'notas',
+            'grupo_id': 'grupo_id',
+        },
+    },
+    'pacientes': {
+        'queryset': lambda: Paciente.objects.all(),
+        'grupo': 'usuario__grupo_id',
+        'fecha': 'usuario__fecha_registro__date',
+        'columnas': {
+            'id': 'id',
+            'numero_historia_clinica': 'numero_historia_clinica',
+            'nombre': 'usuario__nombre',
+            'correo': 'usuario__correo',
+            'telefono': 'usuario__telefono',
+            'fecha_registro': 'usuario__fecha_registro',
+            'grupo_id': 'usuario__grupo_id',
+        },
+    },
+    'medicos': {
+        'queryset': lambda: Usuario.objects.filter(rol__nombre='medico'),
+        'grupo': 'grupo_id',
+        'fecha': 'fecha_registro__date',
+        'columnas': {
+            'id': 'id',
+            'nombre': 'nombre',
+            'correo': 'correo',
+            'telefono': 'telefono',
+            'fecha_registro': 'fecha_registro',
+            'grupo_id': 'grupo_id',
+        },
+    },
+    'bitacora': {
+        'queryset': lambda: Bitacora.objects.all(),
+        'grupo': 'grupo_id',
+        'fecha': 'timestamp__date',
+        'columnas': {
+            'id': 'id',
+            'timestamp': 'timestamp',
+            'usuario': 'usuario__nombre',
+            'accion': 'accion',
+            'objeto': 'objeto',
+            'ip': 'ip',
+            'grupo_id': 'grupo_id',
+        },
+    },
+}
+
+
+class PerfilNoEncontrado(Exception):
+    pass
+
+
+def perfil_reporte(request):
+    """Perfil (con rol y grupo) de quien pide el reporte; PerfilNoEncontrado si no tiene."""
+    perfil = get_usuario_perfil(request)
+    if perfil is None:
+        raise PerfilNoEncontrado(f"Perfil de usuario no encontrado para {request.user.email}.")
+    return perfil
+
+
+def es_super_admin(perfil):
+    return bool(perfil.rol and perfil.rol.nombre == 'superAdmin')
+
+
+def rango_fechas(request, dias_por_defecto=None, inicio_por_defecto=None):
+    """
+    (fecha_inicio, fecha_fin) de los parámetros AAAA-MM-DD. Sin parámetros:
+    los últimos `dias_por_defecto` días hasta hoy, desde `inicio_por_defecto`,
+    o (None, None). Lanza ValueError si alguna fecha es inválida.
+    """
+    fecha_inicio = fecha_fin = None
+    if dias_por_defecto or inicio_por_defecto:
+        fecha_fin = datetime.now().date()
+        fecha_inicio = inicio_por_defecto or fecha_fin - timedelta(days=dias_por_defecto - 1)
+
+    fecha_inicio_str = request.query_params.get('fecha_inicio', None)
+    fecha_fin_str = request.query_params.get('fecha_fin', None)
+    if fecha_inicio_str:
+        fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d').date()
+    if fecha_fin_str:
+        fecha_fin = datetime.strptime(fecha_fin_str, '%Y-%m-%d').date()
+    return fecha_inicio, fecha_fin
+
+
+def consulta_reporte(perfil, recurso, fecha_inicio=None, fecha_fin=None):
+    """
+    QuerySet del recurso con el alcance del perfil (superAdmin: todo; si no, su
+    grupo; sin grupo: vacío) y el rango de fechas (cada extremo es opcional).
+    """
+    definicion = RECURSOS[recurso]
+    qs = definicion['queryset']()
+    if not es_super_admin(perfil):
+        if not perfil.grupo_id:
+            return qs.none()
+        qs = qs.filter(**{definicion['grupo']: perfil.grupo_id})
+    if fecha_inicio:
+        qs = qs.filter(**{f"{definicion['fecha']}__gte": fecha_inicio})
+    if fecha_fin:
+        qs = qs.filter(**{f"{definicion['fecha']}__lte": fecha_fin})
+    return qs
+
+
+@lru_cache(maxsize=None)
+def _tipo_fila(recurso, columnas):
+    return namedtuple(f"Fila_{recurso}", columnas)
+
+
+def filas_reporte(qs, recurso, columnas, orden=('id',), limite=None):
+    """
+    Iterador de tuplas con nombre (fila.paciente, fila.fecha...) leídas con
+    values_list: solo se piden las columnas que el reporte muestra y no se
+    instancia ningún modelo. Sin `limite` se lee por bloques de CHUNK_FILAS.
+    """
+    columnas = tuple(columnas)
+    rutas = [RECURSOS[recurso]['columnas'][nombre] for nombre in columnas]
+    Fila = _tipo_fila(recurso, columnas)
+    qs = qs.order_by(*orden).values_list(*rutas)
+    if limite is not None:
+        return map(Fila._make, qs[:limite])
+    return map(Fila._make, qs.iterator(chunk_size=CHUNK_FILAS))
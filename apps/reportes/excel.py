@@ -0,0 +1,117 @@
+# apps/reportes/excel.py
+import tempfile
+from datetime import date, datetime, time
+from itertools import chain, islice
+
+from django.http import FileResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+from openpyxl.utils import get_column_letter
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Filas que se miran para estimar el ancho de las columnas
+MUESTRA_ANCHO = 200
+ANCHO_MAXIMO = 60
+
+
+def _estilos():
+    """
+    Estilos con nombre: se registran una vez por libro y cada celda solo guarda
+    una referencia, en lugar de crear Font/Fill/formato por celda.
+    """
+    encabezado = NamedStyle(name='encabezado')
+    encabezado.font = Font(bold=True, color="FFFFFF")
+    encabezado.fill = PatternFill(start_color="004A99", end_color="004A99", fill_type="solid")
+    encabezado.alignment = Alignment(horizontal="center", vertical="center")
+
+    fecha = NamedStyle(name='fecha', number_format='YYYY-MM-DD')
+    hora = NamedStyle(name='hora', number_format='hh:mm')
+    fecha_hora = NamedStyle(name='fecha_hora', number_format='YYYY-MM-DD hh:mm')
+    return [encabezado, fecha, hora, fecha_hora]
+
+
+def _texto_ancho(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d %H:%M')
+    if isinstance(valor, time):
+        return valor.strftime('%H:%M')
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _anchos(encabezados, muestra):
+    anchos = [len(str(h)) for h in encabezados]
+    for fila in muestra:
+        for i, valor in enumerate(fila):
+            anchos[i] = max(anchos[i], len(_texto_ancho(valor)))
+    return [min(a + 2, ANCHO_MAXIMO) for a in anchos]
+
+
+def escribir_excel(destino, titulo_hoja, columnas, filas):
+    """
+    Escribe un .xlsx en modo write-only (memoria constante sin importar la
+    cantidad de filas).
+
+    columnas: lista de (encabezado, estilo) donde estilo es None o el nombre de
+    un estilo de _estilos() ('fecha', 'hora', 'fecha_hora').
+    filas: iterable de tuplas en el mismo orden que las columnas.
+    """
+    wb = Workbook(write_only=True)
+    for estilo in _estilos():
+        wb.add_named_style(estilo)
+    ws = wb.create_sheet(titulo_hoja)
+
+    encabezados = [c[0] for c in columnas]
+    estilos = [c[1] for c in columnas]
+
+    # En write-only los anchos deben fijarse antes de la primera fila
+    filas = iter(filas)
+    muestra = list(islice(filas, MUESTRA_ANCHO))
+    for i, ancho in enumerate(_anchos(encabezados, muestra), 1):
+        ws.column_dimensions[get_column_letter(i)].width = ancho
+
+    fila_encabezado = []
+    for titulo in encabezados:
+        celda = WriteOnlyCell(ws, value=titulo)
+        celda.style = 'encabezado'
+        fila_encabezado.append(celda)
+    ws.append(fila_encabezado)
+
+    # Solo las columnas con formato necesitan WriteOnlyCell; el resto va como valor plano
+    con_estilo = [(i, e) for i, e in enumerate(estilos) if e]
+    for fila in chain(muestra, filas):
+        if con_estilo:
+            fila = list(fila)
+            for i, estilo in con_estilo:
+                if fila[i] is not None:
+                    celda = WriteOnlyCell(ws, value=fila[i])
+                    celda.style = estilo
+                    fila[i] = celda
+        ws.append(fila)
+
+    wb.save(destino)
+
+
+def respuesta_excel(nombre_archivo, titulo_hoja, columnas, filas):
+    """
+    Genera el Excel en un archivo temporal y lo devuelve con FileResponse, que
+    lo envía por bloques y lo cierra (y borra) al terminar.
+    """
+    archivo = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        escribir_excel(archivo, titulo_hoja, columnas, filas)
+        archivo.seek(0)
+    except Exception:
+        archivo.close()
+        raise
+    return FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=nombre_archivo,
+        content_type=CONTENT_TYPE_XLSX,
+    )
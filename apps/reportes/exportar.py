@@ -0,0 +1,92 @@
+# apps/reportes/exportar.py
+import csv
+import io
+import zlib
+from datetime import date, datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# Filas por trozo de la respuesta (mismo tamaño que los bloques leídos del cursor)
+CHUNK_EXPORTACION = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def _texto(valor):
+    """Fechas en ISO 8601 (datetime en hora local), el resto tal cual."""
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.localtime(valor)
+        return valor.isoformat()
+    if isinstance(valor, (date, time)):
+        return valor.isoformat()
+    return valor
+
+
+def _lineas_csv(columnas, filas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columnas)
+    # El encabezado sale de inmediato, antes de ejecutar la consulta
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    pendientes = 0
+    for fila in filas:
+        writer.writerow([_texto(v) for v in fila])
+        pendientes += 1
+        if pendientes >= CHUNK_EXPORTACION:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+    if pendientes:
+        yield buffer.getvalue()
+
+
+def _lineas_ndjson(columnas, filas):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    bloque = []
+    for fila in filas:
+        bloque.append(encoder.encode(dict(zip(columnas, (_texto(v) for v in fila)))))
+        if len(bloque) >= CHUNK_EXPORTACION:
+            yield '\n'.join(bloque) + '\n'
+            bloque = []
+    if bloque:
+        yield '\n'.join(bloque) + '\n'
+
+
+def _gzip(bloques):
+    # wbits=31: formato gzip. Z_SYNC_FLUSH por bloque para que el cliente reciba datos sin esperar al final
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloque in bloques:
+        datos = compresor.compress(bloque) + compresor.flush(zlib.Z_SYNC_FLUSH)
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+
+def respuesta_exportacion(nombre_archivo, formato, columnas, filas, comprimir=False):
+    """
+    StreamingHttpResponse con las filas en CSV o NDJSON (una línea JSON por fila).
+    `filas` debe ser un iterador (values_list(...).iterator()) para que la
+    memoria no dependa del tamaño de la exportación.
+    """
+    generador = _lineas_csv if formato == 'csv' else _lineas_ndjson
+    bloques = (texto.encode('utf-8') for texto in generador(columnas, filas))
+    nombre_archivo = f"{nombre_archivo}.{formato}"
+    if comprimir:
+        response = StreamingHttpResponse(_gzip(bloques), content_type='application/gzip')
+        nombre_archivo += '.gz'
+    else:
+        response = StreamingHttpResponse(bloques, content_type=CONTENT_TYPES[formato])
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    # Evita que un proxy (nginx) acumule la respuesta completa antes de enviarla
+    response['X-Accel-Buffering'] = 'no'
+    return response
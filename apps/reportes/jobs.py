@@ -0,0 +1,157 @@
+# apps/reportes/jobs.py
+import hashlib
+import json
+import tempfile
+import traceback
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+
+from .models import ReporteJob
+
+# Tipo de reporte -> vista síncrona que lo genera (la misma que usa el GET directo)
+VISTAS_REPORTE = {
+    'pacientes_pdf': 'generar_reporte_pacientes_pdf',
+    'medicos_pdf': 'generar_reporte_medicos_pdf',
+    'citas_pdf': 'generar_reporte_citas_pdf',
+    'citas_excel': 'generar_reporte_citas_excel',
+    'pacientes_excel': 'generar_reporte_pacientes_excel',
+}
+PARAMETROS_REPORTE = ('fecha_inicio', 'fecha_fin')
+
+
+class ParametrosInvalidos(ValueError):
+    pass
+
+
+def normalizar_parametros(datos):
+    """Solo los parámetros que usan las vistas, sin vacíos y validados (AAAA-MM-DD)."""
+    parametros = {}
+    for nombre in PARAMETROS_REPORTE:
+        valor = str(datos.get(nombre) or '').strip()
+        if not valor:
+            continue
+        try:
+            datetime.strptime(valor, '%Y-%m-%d')
+        except ValueError:
+            raise ParametrosInvalidos(f"Formato de fecha inválido en '{nombre}'. Use AAAA-MM-DD.")
+        parametros[nombre] = valor
+    return parametros
+
+
+def clave_reporte(usuario_id, tipo, parametros):
+    # El usuario entra en la clave: el alcance (grupo/rol) y el encabezado dependen de él
+    contenido = json.dumps([usuario_id, tipo, parametros], sort_keys=True)
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+
+def encolar_reporte(usuario, tipo, parametros):
+    """
+    Crea un reporte pendiente. Si el mismo usuario ya pidió el mismo reporte y
+    todavía no terminó, se devuelve ese. Retorna (job, creado).
+    """
+    clave = clave_reporte(usuario.pk, tipo, parametros)
+    existente = ReporteJob.objects.filter(clave=clave, estado__in=ReporteJob.ESTADOS_ACTIVOS).first()
+    if existente:
+        return existente, False
+    job = ReporteJob.objects.create(usuario=usuario, tipo=tipo, parametros=parametros, clave=clave)
+    return job, True
+
+
+def marcar_huerfanos(minutos=30):
+    """Reportes EN_PROCESO hace demasiado (el worker murió): se dan por fallidos."""
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return ReporteJob.objects.filter(estado='EN_PROCESO', fecha_inicio__lt=limite).update(
+        estado='FALLIDO', fecha_fin=timezone.now(), mensaje='Worker interrumpido.'
+    )
+
+
+def expirar_artefactos():
+    """Borra del storage los archivos vencidos. Retorna cuántos expiraron."""
+    expirados = 0
+    for job in ReporteJob.objects.filter(estado='COMPLETADO', expira__lt=timezone.now()):
+        if job.archivo:
+            job.archivo.delete(save=False)
+        job.estado = 'EXPIRADO'
+        job.save(update_fields=['estado', 'archivo'])
+        expirados += 1
+    return expirados
+
+
+def tomar_siguiente_job():
+    """Reclama el pendiente más antiguo (UPDATE condicional: seguro con varios workers)."""
+    for job_id in ReporteJob.objects.filter(estado='PENDIENTE').order_by('fecha_creacion').values_list('pk', flat=True)[:10]:
+        reclamado = ReporteJob.objects.filter(pk=job_id, estado='PENDIENTE').update(
+            estado='EN_PROCESO', fecha_inicio=timezone.now()
+        )
+        if reclamado:
+            return ReporteJob.objects.get(pk=job_id)
+    return None
+
+
+def _request_para(job):
+    """
+    Request GET equivalente al que habría hecho el usuario. DRF lo autentica con
+    _force_auth_user, así la vista aplica exactamente el mismo alcance (grupo/rol).
+    """
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = f'/api/reportes/jobs/{job.pk}/'
+    request.META['SERVER_NAME'] = 'reportes-worker'
+    request.META['SERVER_PORT'] = '80'
+    request.GET = QueryDict(mutable=True)
+    request.GET.update(job.parametros)
+    request._force_auth_user = job.usuario
+    return request
+
+
+def _nombre_archivo(response, job):
+    disposicion = response.get('Content-Disposition', '')
+    if 'filename="' in disposicion:
+        return disposicion.split('filename="', 1)[1].split('"', 1)[0]
+    return f"reporte_{job.tipo}_{job.pk}"
+
+
+def ejecutar_job(job):
+    """Genera el reporte con su vista y guarda el archivo en el storage."""
+    from . import views
+
+    vista = getattr(views, VISTAS_REPORTE[job.tipo])
+    try:
+        response = vista(_request_para(job))
+        if response.status_code != 200:
+            contenido = b'' if response.streaming else response.content
+            mensaje = contenido.decode('utf-8', 'replace')[:500] or f"HTTP {response.status_code}"
+            ReporteJob.objects.filter(pk=job.pk).update(estado='FALLIDO', fecha_fin=timezone.now(), mensaje=mensaje)
+        else:
+            nombre = _nombre_archivo(response, job)
+            with tempfile.TemporaryFile() as temporal:
+                if response.streaming:
+                    for bloque in response.streaming_content:
+                        temporal.write(bloque)
+                else:
+                    temporal.write(response.content)
+                response.close()
+                temporal.seek(0)
+                job.archivo.save(nombre, File(temporal), save=False)
+
+            ReporteJob.objects.filter(pk=job.pk).update(
+                estado='COMPLETADO',
+                archivo=job.archivo.name,
+                nombre_archivo=nombre,
+                content_type=response.get('Content-Type', 'application/octet-stream'),
+                tamanio=job.archivo.size,
+                fecha_fin=timezone.now(),
+                expira=timezone.now() + timedelta(seconds=getattr(settings, 'REPORTES_ARTEFACTO_TTL', 86400)),
+                mensaje='',
+            )
+    except Exception as e:
+        print(f"Error generando reporte #{job.pk}: {e}")
+        traceback.print_exc()
+        ReporteJob.objects.filter(pk=job.pk).update(estado='FALLIDO', fecha_fin=timezone.now(), mensaje=str(e))
+
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.reportes.backup import FORMATOS_COPY, ErrorBackup, exportar_copy
+
+
+class Command(BaseCommand):
+    help = "Backup de la base (o de una clínica) con COPY de PostgreSQL en un ZIP."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salida', required=True, help="Ruta del ZIP a generar.")
+        parser.add_argument('--grupo', type=int, default=None, help="Solo las filas de esta clínica (grupo_id).")
+        parser.add_argument('--formato', choices=FORMATOS_COPY, default='binary')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        try:
+            manifiesto = exportar_copy(options['salida'], grupo_id=options['grupo'], formato=options['formato'])
+        except ErrorBackup as e:
+            raise CommandError(str(e))
+
+        filas = sum(t['filas'] for t in manifiesto['tablas'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Backup generado en {options['salida']}: {len(manifiesto['tablas'])} tablas, "
+            f"{filas} filas en {time.monotonic() - inicio:.2f}s."
+        ))
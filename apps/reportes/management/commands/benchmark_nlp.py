@@ -0,0 +1,180 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Se ejecuta en un proceso nuevo para medir desde cero (sin nada ya importado)
+SCRIPT_ARRANQUE = r'''
+import json, os, sys, time
+inicio = time.perf_counter()
+import django
+django.setup()
+import apps.reportes.views
+from apps.reportes import nlp_service
+fin_import = time.perf_counter()
+rss_import = int(open('/proc/self/statm').read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+# Frase fuera de la tabla de comandos frecuentes: obliga a cargar spaCy
+r = nlp_service.procesar_comando_voz("necesito el reporte de pacientes de ayer")
+fin_primero = time.perf_counter()
+rss_modelo = int(open('/proc/self/statm').read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+# Sin redirigir stdout: se mide también lo que el servicio imprima (gunicorn lo paga)
+def latencia(texto, n=1000):
+    t = time.perf_counter()
+    for _ in range(n):
+        nlp_service.procesar_comando_voz(texto)
+    return (time.perf_counter() - t) / n
+
+print(json.dumps({
+    "import": fin_import - inicio, "rss_import": rss_import,
+    "primer_comando": fin_primero - fin_import, "rss_modelo": rss_modelo,
+    "frecuente": latencia("reporte de pacientes de ayer"),
+    "spacy": latencia("necesito el listado de médicos del último mes por favor"),
+    "modelo": nlp_service.nlp is not None, "respuesta": r,
+}))
+'''
+
+# Simula gunicorn: un master que (opcionalmente) precarga y N workers creados con fork
+SCRIPT_WORKERS = r'''
+import gc, json, os, sys
+import django
+django.setup()
+from apps.reportes import nlp_service
+
+def memoria():
+    datos = {}
+    for linea in open('/proc/self/smaps_rollup'):
+        partes = linea.split()
+        if partes[0] in ('Pss:', 'Private_Clean:', 'Private_Dirty:'):
+            datos[partes[0][:-1]] = int(partes[1]) * 1024
+    return {"uss": datos['Private_Clean'] + datos['Private_Dirty'], "pss": datos['Pss']}
+
+precarga, workers = sys.argv[1] == '1', int(sys.argv[2])
+if precarga:
+    nlp_service.precargar()
+    gc.freeze()
+
+# Tres barreras: todos procesan un comando, luego todos miden (con los demás vivos
+# para que las páginas compartidas se repartan entre todos), luego todos salen
+listo_r, listo_w = os.pipe()
+medir_r, medir_w = os.pipe()
+datos_r, datos_w = os.pipe()
+salir_r, salir_w = os.pipe()
+hijos = []
+for _ in range(workers):
+    pid = os.fork()
+    if pid == 0:
+        nlp_service.procesar_comando_voz("quiero el reporte de citas del último mes")
+        os.write(listo_w, b"x")
+        os.close(medir_w)
+        os.read(medir_r, 1)
+        os.write(datos_w, (json.dumps(memoria()) + "\n").encode())
+        os.close(salir_w)
+        os.read(salir_r, 1)
+        os._exit(0)
+    hijos.append(pid)
+for fd in (listo_w, medir_r, datos_w, salir_r):
+    os.close(fd)
+recibidos = 0
+while recibidos < workers:
+    recibidos += len(os.read(listo_r, workers))
+os.close(medir_w)
+datos = os.fdopen(datos_r)
+medidas = [json.loads(datos.readline()) for _ in range(workers)]
+os.close(salir_w)
+for pid in hijos:
+    os.waitpid(pid, 0)
+print(json.dumps(medidas))
+'''
+
+
+def _mb(n):
+    return f"{n / 1024 / 1024:.1f} MB"
+
+
+def _memoria_proceso(pid):
+    datos = {}
+    with open(f'/proc/{pid}/smaps_rollup') as archivo:
+        for linea in archivo:
+            partes = linea.split()
+            if partes[0] in ('Private_Clean:', 'Private_Dirty:'):
+                datos[partes[0][:-1]] = int(partes[1]) * 1024
+    return datos['Private_Clean'] + datos['Private_Dirty']
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el costo de arranque del servicio NLP (import de las vistas, primer comando) "
+        "y la memoria de N workers con y sin precarga del modelo en el master, o con el "
+        "modelo en un servicio aparte (nlp_worker)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+
+    def _ejecutar(self, script, *args, env=None):
+        resultado = subprocess.run(
+            [sys.executable, '-c', script, *args],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=600,
+            env=env,
+        )
+        if resultado.returncode != 0:
+            raise CommandError(resultado.stderr[-2000:])
+        return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            raise CommandError("Este benchmark necesita Linux (/proc/self/smaps_rollup).")
+
+        arranque = self._ejecutar(SCRIPT_ARRANQUE)
+        self.stdout.write(f"Modelo '{getattr(settings, 'NLP_MODELO', 'es_core_news_sm')}' disponible: {arranque['modelo']}")
+        self.stdout.write(
+            f"Importar vistas:   {arranque['import']:.2f}s, RSS {_mb(arranque['rss_import'])} (sin cargar spaCy)"
+        )
+        self.stdout.write(
+            f"Primer comando:    {arranque['primer_comando']:.2f}s (carga perezosa), RSS {_mb(arranque['rss_modelo'])}"
+        )
+        self.stdout.write(f"Comando frecuente: {arranque['frecuente'] * 1000:.3f}ms (tabla, sin spaCy)")
+        self.stdout.write(f"Otro comando:      {arranque['spacy'] * 1000:.3f}ms (tokenizador + Matcher)")
+
+        workers = options['workers']
+        for precarga, nombre in ((False, 'carga en cada worker'), (True, 'precarga en el master')):
+            medidas = self._ejecutar(SCRIPT_WORKERS, '1' if precarga else '0', str(workers))
+            self._reportar_workers(workers, nombre, medidas)
+        self._medir_servicio(workers)
+
+    def _reportar_workers(self, workers, nombre, medidas, extra=""):
+        uss = sum(m['uss'] for m in medidas)
+        pss = sum(m['pss'] for m in medidas)
+        self.stdout.write(
+            f"{workers} workers, {nombre:<22}: memoria privada (USS) {_mb(uss)}, proporcional (PSS) {_mb(pss)}{extra}"
+        )
+
+    def _medir_servicio(self, workers):
+        """Mismos workers sin precarga, pero con NLP_SOCKET apuntando a un nlp_worker."""
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'nlp.sock')
+            env = {**os.environ, 'NLP_SOCKET': ruta, 'NLP_SOCKET_FALLBACK_LOCAL': 'False'}
+            servicio = subprocess.Popen(
+                [sys.executable, 'manage.py', 'nlp_worker', '--socket', ruta],
+                cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+            )
+            try:
+                limite = time.monotonic() + 120
+                while not os.path.exists(ruta):
+                    if servicio.poll() is not None or time.monotonic() > limite:
+                        raise CommandError(f"nlp_worker no arrancó: {servicio.stderr.read()[-2000:]}")
+                    time.sleep(0.1)
+                medidas = self._ejecutar(SCRIPT_WORKERS, '0', str(workers), env=env)
+                uss_servicio = _memoria_proceso(servicio.pid)
+            finally:
+                servicio.terminate()
+                servicio.wait(timeout=30)
+        self._reportar_workers(
+            workers, 'servicio nlp_worker', medidas, extra=f" + servicio {_mb(uss_servicio)}"
+        )
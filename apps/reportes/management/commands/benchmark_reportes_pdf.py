@@ -0,0 +1,80 @@
+import io
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.reportes.pdf import renderizar_tabla_pdf
+
+COLUMNAS = [("Fecha", 80), ("Hora", 60), ("Paciente", 200), ("Estado", 100), ("ID Cita", 50)]
+ESTADOS = ['Pendiente', 'Confirmada', 'Completada', 'Cancelada', 'No Asistió']
+
+
+def _filas(n):
+    inicio = date(2025, 1, 1)
+    for i in range(n):
+        yield (
+            (inicio + timedelta(days=i % 365)).isoformat(),
+            f"{8 + i % 10:02d}:{(i * 15) % 60:02d}",
+            f"Paciente de prueba número {i % 997}",
+            ESTADOS[i % len(ESTADOS)],
+            i,
+        )
+
+
+def _platypus(destino, filas):
+    """La forma anterior: un Paragraph por celda y una sola Table en SimpleDocTemplate."""
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    normal_center = ParagraphStyle('normal_center', parent=styles['Normal'], alignment=TA_CENTER)
+    data = [[Paragraph(f"<b>{t}</b>", normal_center) for t, _ in COLUMNAS]]
+    data += [[Paragraph(str(v), normal_center) for v in fila] for fila in filas]
+    table = Table(data, colWidths=[a for _, a in COLUMNAS], repeatRows=1)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#8AD0E8")),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#E6F7FF")),
+    ]))
+    SimpleDocTemplate(destino, pagesize=letter, topMargin=72, bottomMargin=72).build([table])
+
+
+class Command(BaseCommand):
+    help = "Mide el tiempo de renderizado de los reportes PDF tabulares (segundos por 10k filas)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=10000)
+        parser.add_argument('--repeticiones', type=int, default=3)
+        parser.add_argument('--procesos', type=int, default=1, help="Procesos para el renderizado en paralelo.")
+        parser.add_argument('--platypus', action='store_true', help="Compara también con la tabla de Platypus (lento).")
+
+    def _medir(self, nombre, renderizar, filas, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            destino = io.BytesIO()
+            inicio = time.perf_counter()
+            renderizar(destino, _filas(filas))
+            tiempos.append(time.perf_counter() - inicio)
+        mejor = min(tiempos)
+        self.stdout.write(
+            f"{nombre:<12} {filas} filas: {mejor:.2f}s (mejor de {repeticiones}), "
+            f"{mejor * 10000 / filas:.2f}s por 10k filas, {destino.tell() / 1024:.0f} KB"
+        )
+
+    def handle(self, *args, **options):
+        filas, repeticiones = options['filas'], options['repeticiones']
+        self._medir('canvas', lambda destino, datos: renderizar_tabla_pdf(
+            destino, "Benchmark", "benchmark", f"Este reporte detalla <b>{filas} cita(s)</b>.",
+            COLUMNAS, datos, "#8AD0E8", "Sin datos.",
+        ), filas, repeticiones)
+        if options['procesos'] > 1:
+            self._medir(f"canvas x{options['procesos']}", lambda destino, datos: renderizar_tabla_pdf(
+                destino, "Benchmark", "benchmark", f"Este reporte detalla <b>{filas} cita(s)</b>.",
+                COLUMNAS, datos, "#8AD0E8", "Sin datos.", procesos=options['procesos'],
+            ), filas, repeticiones)
+        if options['platypus']:
+            self._medir('platypus', _platypus, filas, repeticiones)
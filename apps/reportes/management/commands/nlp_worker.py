@@ -0,0 +1,42 @@
+import gc
+import signal
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.reportes import nlp_service
+from apps.reportes.nlp_remoto import ServidorNLP
+
+
+class Command(BaseCommand):
+    help = (
+        "Servicio NLP compartido: carga el modelo spaCy una sola vez y atiende los "
+        "comandos de voz de todos los workers web por un socket Unix (NLP_SOCKET)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket', default=getattr(settings, 'NLP_SOCKET', None),
+            help="Ruta del socket Unix (por defecto NLP_SOCKET).",
+        )
+
+    def handle(self, *args, **options):
+        ruta = options['socket']
+        if not ruta:
+            raise CommandError("Indique --socket o configure NLP_SOCKET.")
+        if not nlp_service.precargar():
+            raise CommandError("No se pudo cargar el modelo NLP.")
+        gc.freeze()
+
+        # remoto=False: este proceso siempre usa su propio modelo
+        servidor = ServidorNLP(ruta, lambda textos: nlp_service.interpretar_comandos(textos, remoto=False))
+        # systemd/supervisor detienen con SIGTERM: se sale por el finally y se borra el socket
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        self.stdout.write(f"Servicio NLP escuchando en {ruta}. Ctrl+C para detener.")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Servicio NLP detenido.")
+        finally:
+            servidor.server_close()
@@ -0,0 +1,49 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.reportes.jobs import ejecutar_job, expirar_artefactos, marcar_huerfanos, tomar_siguiente_job
+
+
+class Command(BaseCommand):
+    help = "Genera los reportes PDF/Excel encolados desde la API (POST /api/reportes/jobs/)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=2, help="Segundos entre revisiones de la cola.")
+        parser.add_argument('--una-vez', action='store_true', help="Procesa lo pendiente y termina.")
+        parser.add_argument(
+            '--minutos-huerfano', type=int, default=30,
+            help="Minutos EN_PROCESO tras los cuales un reporte se da por fallido.",
+        )
+        parser.add_argument(
+            '--nice', type=int, default=10,
+            help="Baja la prioridad de CPU del worker para no competir con los workers web (0 = sin cambio).",
+        )
+
+    def handle(self, *args, **options):
+        if options['nice'] and hasattr(os, 'nice'):
+            os.nice(options['nice'])
+        self.stdout.write("Worker de reportes iniciado. Ctrl+C para detener.")
+        try:
+            while True:
+                huerfanos = marcar_huerfanos(options['minutos_huerfano'])
+                if huerfanos:
+                    self.stdout.write(self.style.WARNING(f"{huerfanos} reporte(s) huérfano(s) marcados como FALLIDO."))
+                expirados = expirar_artefactos()
+                if expirados:
+                    self.stdout.write(f"{expirados} archivo(s) de reporte expirado(s) eliminados.")
+
+                job = tomar_siguiente_job()
+                if job is None:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                self.stdout.write(f"Generando reporte #{job.pk} ({job.tipo})...")
+                job = ejecutar_job(job)
+                estilo = self.style.SUCCESS if job.estado == 'COMPLETADO' else self.style.ERROR
+                self.stdout.write(estilo(f"Reporte #{job.pk}: {job.estado}. {job.mensaje or job.nombre_archivo}"))
+        except KeyboardInterrupt:
+            self.stdout.write("Worker de reportes detenido.")
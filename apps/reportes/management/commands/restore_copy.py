@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from apps.reportes.backup import ErrorBackup, restaurar_copy
+
+
+class Command(BaseCommand):
+    help = "Restaura un ZIP generado por backup_copy (en una sola transacción)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="ZIP generado por backup_copy.")
+        parser.add_argument(
+            '--reemplazar', action='store_true',
+            help="Borra antes las filas existentes del mismo alcance (toda la base o la clínica del backup).",
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        try:
+            manifiesto = restaurar_copy(options['archivo'], reemplazar=options['reemplazar'])
+        except ErrorBackup as e:
+            raise CommandError(str(e))
+        except IntegrityError as e:
+            raise CommandError(f"No se restauró nada (rollback). ¿Faltó --reemplazar? {e}")
+
+        alcance = f"clínica {manifiesto['grupo_id']}" if manifiesto['grupo_id'] is not None else "toda la base"
+        filas = sum(t['filas'] for t in manifiesto['tablas'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Restaurado ({alcance}): {len(manifiesto['tablas'])} tablas, "
+            f"{filas} filas en {time.monotonic() - inicio:.2f}s."
+        ))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:08
+
+import apps.reportes.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReporteJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('pacientes_pdf', 'Listado de pacientes (PDF)'), ('medicos_pdf', 'Listado de médicos (PDF)'), ('citas_pdf', 'Reporte de citas (PDF)'), ('citas_excel', 'Reporte de citas (Excel)'), ('pacientes_excel', 'Pacientes nuevos (Excel)')], max_length=30)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('clave', models.CharField(db_index=True, help_text='Hash de usuario + tipo + parámetros (deduplicación)', max_length=40)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En Proceso'), ('COMPLETADO', 'Completado'), ('FALLIDO', 'Fallido'), ('EXPIRADO', 'Expirado')], db_index=True, default='PENDIENTE', max_length=20)),
+                ('mensaje', models.TextField(blank=True)),
+                ('archivo', models.FileField(blank=True, upload_to=apps.reportes.models.ruta_reporte)),
+                ('nombre_archivo', models.CharField(blank=True, max_length=255)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('tamanio', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('expira', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reporte_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'reporte_job',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
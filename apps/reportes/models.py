@@ -1,3 +1,69 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+def ruta_reporte(instance, filename):
+    # Carpeta aleatoria: el nombre del archivo (clínica, fechas) no debe ser adivinable
+    return f"reportes/{uuid.uuid4().hex}/{filename}"
+
+
+class ReporteJob(models.Model):
+    """
+    Reporte (PDF/Excel) solicitado desde la API. Lo genera el comando
+    `python manage.py reportes_worker` y queda guardado en el storage hasta que expira.
+    """
+    TIPOS = [
+        ('pacientes_pdf', 'Listado de pacientes (PDF)'),
+        ('medicos_pdf', 'Listado de médicos (PDF)'),
+        ('citas_pdf', 'Reporte de citas (PDF)'),
+        ('citas_excel', 'Reporte de citas (Excel)'),
+        ('pacientes_excel', 'Pacientes nuevos (Excel)'),
+    ]
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En Proceso'),
+        ('COMPLETADO', 'Completado'),
+        ('FALLIDO', 'Fallido'),
+        ('EXPIRADO', 'Expirado'),
+    ]
+    ESTADOS_ACTIVOS = ('PENDIENTE', 'EN_PROCESO')
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reporte_jobs')
+    tipo = models.CharField(max_length=30, choices=TIPOS)
+    parametros = models.JSONField(default=dict, blank=True)
+    clave = models.CharField(max_length=40, db_index=True, help_text="Hash de usuario + tipo + parámetros (deduplicación)")
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE', db_index=True)
+    mensaje = models.TextField(blank=True)
+
+    archivo = models.FileField(upload_to=ruta_reporte, blank=True)
+    nombre_archivo = models.CharField(max_length=255, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    tamanio = models.PositiveBigIntegerField(null=True, blank=True)
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    expira = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        db_table = 'reporte_job'
+        ordering = ['-fecha_creacion']
+
+    def __str__(self):
+        return f"Reporte {self.tipo} #{self.pk} ({self.estado})"
+
+
+class ReporteDataVersion(models.Model):
+    """
+    Versión de los datos de origen de los reportes (citas, pacientes, usuarios)
+    por clínica. La incrementan las señales de guardado/borrado; el cache de
+    reportes la incluye en la clave, así un cambio invalida lo generado antes.
+    """
+    grupo_id = models.IntegerField(unique=True, help_text="ID de la Clínica (Tenant)")
+    version = models.PositiveIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'reporte_data_version'
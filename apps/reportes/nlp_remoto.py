@@ -0,0 +1,94 @@
+# apps/reportes/nlp_remoto.py
+import json
+import os
+import socket
+import socketserver
+import threading
+import traceback
+
+# Protocolo (una línea JSON por mensaje, UTF-8, sobre un socket Unix local):
+#   -> {"textos": ["reporte de citas de hoy", ...]}
+#   <- {"interpretaciones": [["REPORTE_PDF_CITAS", "HOY"], null, ...]}
+#   <- {"error": "..."}
+# Una conexión puede enviar varios lotes seguidos.
+
+MAX_BYTES_MENSAJE = 1024 * 1024
+
+
+class ErrorServicioNLP(Exception):
+    pass
+
+
+def interpretar_remoto(ruta, textos, timeout):
+    """
+    Manda un lote de textos al nlp_worker y devuelve una interpretación por
+    texto ((intención, fecha_id) o None). ErrorServicioNLP si no hay respuesta
+    válida dentro de `timeout` segundos.
+    """
+    mensaje = (json.dumps({"textos": list(textos)}, ensure_ascii=False) + "\n").encode('utf-8')
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conexion:
+            conexion.settimeout(timeout)
+            conexion.connect(ruta)
+            conexion.sendall(mensaje)
+            with conexion.makefile('rb') as lector:
+                linea = lector.readline(MAX_BYTES_MENSAJE)
+    except OSError as e:  # incluye socket.timeout y ConnectionRefusedError
+        raise ErrorServicioNLP(str(e) or type(e).__name__) from e
+
+    try:
+        respuesta = json.loads(linea)
+    except ValueError as e:
+        raise ErrorServicioNLP("respuesta inválida") from e
+    if 'error' in respuesta:
+        raise ErrorServicioNLP(respuesta['error'])
+    interpretaciones = respuesta.get('interpretaciones')
+    if not isinstance(interpretaciones, list) or len(interpretaciones) != len(textos):
+        raise ErrorServicioNLP("respuesta incompleta")
+    return [tuple(i) if i else None for i in interpretaciones]
+
+
+class _Manejador(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            linea = self.rfile.readline(MAX_BYTES_MENSAJE)
+            if not linea:
+                break
+            self.wfile.write((json.dumps(self.server.responder(linea)) + "\n").encode('utf-8'))
+
+
+class ServidorNLP(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, ruta, interpretar):
+        # Un socket viejo (proceso anterior que no cerró bien) impediría el bind
+        if os.path.exists(ruta):
+            os.unlink(ruta)
+        self.interpretar = interpretar
+        # spaCy no garantiza que el Matcher sea seguro entre hilos: un lote a la vez
+        self._lock = threading.Lock()
+        super().__init__(ruta, _Manejador)
+        # Solo el mismo usuario/grupo (los workers web) puede conectarse
+        os.chmod(ruta, 0o660)
+
+    def responder(self, linea):
+        try:
+            textos = json.loads(linea).get('textos')
+        except (ValueError, AttributeError):
+            return {"error": "mensaje inválido"}
+        if not isinstance(textos, list) or not all(isinstance(t, str) for t in textos):
+            return {"error": "se esperaba 'textos': lista de textos"}
+        try:
+            with self._lock:
+                return {"interpretaciones": self.interpretar(textos)}
+        except RuntimeError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            traceback.print_exc()
+            return {"error": f"error interno: {e}"}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
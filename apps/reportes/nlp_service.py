@@ -1,13 +1,19 @@
-import spacy
-from spacy.matcher import Matcher
-from spacy.pipeline import EntityRuler
+import threading
+import time
 import traceback
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+from django.conf import settings
+
+from apps.cuentas.cache import LRUCacheTTL
+
 
 nlp = None
 matcher = None
+fechas_matcher = None
+_cargado = False
+_lock = threading.Lock()
 
 def _convertir_entidad_fecha(entidad_texto: str) -> dict:
     """
@@ -39,48 +45,125 @@ def _convertir_entidad_fecha(entidad_texto: str) -> dict:
     return {}
 
 
-try:
-    #cargar el modelode spacy en español
-    print("[NLP Service] Intentando cargar 'es_core_news_sm'...")
-    nlp = spacy.load("es_core_news_sm")
-    print("[NLP Service] ¡Éxito! Modelo cargado.")
+# Los patrones solo miran el texto en minúsculas (LOWER): basta el tokenizador.
+# Estos componentes del modelo no se cargan (menos memoria y arranque más rápido).
+COMPONENTES_NO_USADOS = ["tok2vec", "morphologizer", "parser", "senter", "attribute_ruler", "lemmatizer", "ner"]
+
+# Frases de fecha -> ID que entiende _convertir_entidad_fecha
+FECHAS_RELATIVAS = {
+    "HOY": ["hoy"],
+    "AYER": ["ayer"],
+    "ULTIMA_SEMANA": ["última semana"],
+    "ULTIMO_MES": ["último mes"],
+}
+
+VERBOS_REPORTE = ["reporte", "listado", "descargar"]
+
+# Intención -> acción para el front (los params se agregan en cada respuesta)
+ACCIONES = {
+    "REPORTE_PDF_PACIENTES": {
+        "accion": "descargar",
+        "reporte_id": "pacientes",
+        "url": "/reportes/pacientes/pdf/",
+        "fileName": "listado_pacientes.pdf",
+    },
+    "REPORTE_PDF_MEDICOS": {
+        "accion": "descargar",
+        "reporte_id": "medicos",
+        "url": "/reportes/medicos/pdf/",
+        "fileName": "listado_medicos.pdf",
+    },
+    "REPORTE_PDF_CITAS": {
+        "accion": "descargar",
+        "reporte_id": "citas",
+        "url": "/reportes/citas/pdf/",
+        "fileName": "reporte_citas.pdf",
+    },
+    "REPORTE_DASH_CITAS": {
+        "accion": "navegar",
+        "reporte_id": "citas",
+        "url": "/dashboard/reportes/personalizar/citas",
+    },
+    "REPORTE_DASH_PACIENTES": {
+        "accion": "navegar",
+        "reporte_id": "pacientes",
+        "url": "/dashboard/reportes/personalizar/pacientes",
+    },
+}
+
+
+def _comandos_frecuentes():
+    """
+    Tabla texto exacto -> (intención, fecha) con las frases que dicen los usuarios
+    ("reporte de citas de ayer", "dashboard de pacientes"...). Estos comandos se
+    resuelven con un dict, sin pasar por spaCy; cualquier otra frase va al Matcher.
+    """
+    objetos = [("pacientes", "REPORTE_PDF_PACIENTES"), ("médicos", "REPORTE_PDF_MEDICOS"), ("citas", "REPORTE_PDF_CITAS")]
+    intenciones = [(f"{verbo}{de} {objeto}", intent) for verbo in VERBOS_REPORTE for objeto, intent in objetos for de in ("", " de")]
+    intenciones += [(f"dashboard{de} {objeto}", intent) for objeto, intent in (("pacientes", "REPORTE_DASH_PACIENTES"), ("citas", "REPORTE_DASH_CITAS")) for de in ("", " de")]
+    fechas = [("", None), (" de hoy", "HOY"), (" de ayer", "AYER"), (" de la última semana", "ULTIMA_SEMANA"), (" del último mes", "ULTIMO_MES")]
+    return {frase + sufijo: (intent, fecha_id) for frase, intent in intenciones for sufijo, fecha_id in fechas}
+
+
+COMANDOS_FRECUENTES = _comandos_frecuentes()
+
+# Texto normalizado -> (intención, fecha_id) o None. Guarda la interpretación, no
+# la respuesta: las fechas relativas se calculan al responder. Sin expiración
+# (el resultado solo depende del texto); se descarta lo menos usado.
+_cache_intenciones = LRUCacheTTL(maxsize=getattr(settings, 'NLP_CACHE_MAXSIZE', 4096), ttl=0)
+_SIN_RESULTADO = object()
+
+TAMANIO_LOTE_PIPE = 64
+
+
+def _normalizar(texto):
+    return " ".join(texto.lower().split()).rstrip(".!?¡¿ ")
+
+
+def _cargar_modelo(nombre_modelo):
+    import spacy
 
-except IOError:
-    print("[NLP Service] Método 1 falló. Intentando Método 2 ...")
     try:
-        #si no funciona el metodo 1 importar directamente el paqueton
-        import es_core_news_sm
-        nlp = es_core_news_sm.load()
-        print("[NLP Service] ¡Éxito! Modelo cargado (Método 2).")
-    except Exception:
-        #solo depuracion
-        print("[NLP Service] ERROR CRÍTICO: No se pudo cargar el modelo spaCy.")
-        print("Asegúrate de haber ejecutado en tu .venv:")
-        print("1. pip install spacy python-dateutil")
-        print("2. python -m spacy download es_core_news_sm")
-        print("3. Reinicia este servidor de Django.")
-        traceback.print_exc()
-        nlp = None
-
-#definicion de patrones
-if nlp:
-    #definicion de fechas
-    ruler = nlp.add_pipe("entity_ruler", before="ner")
-    patterns = [
-        {"label": "FECHA_RELATIVA", "pattern": "hoy", "id": "HOY"},
-        {"label": "FECHA_RELATIVA", "pattern": "ayer", "id": "AYER"},
-        {"label": "FECHA_RELATIVA", "pattern": [{"LOWER": "última"}, {"LOWER": "semana"}], "id": "ULTIMA_SEMANA"},
-        {"label": "FECHA_RELATIVA", "pattern": [{"LOWER": "último"}, {"LOWER": "mes"}], "id": "ULTIMO_MES"},
-    ]
-    ruler.add_patterns(patterns)
+        #cargar el modelode spacy en español
+        print(f"[NLP Service] Intentando cargar '{nombre_modelo}'...")
+        nlp = spacy.load(nombre_modelo, exclude=COMPONENTES_NO_USADOS)
+        print("[NLP Service] ¡Éxito! Modelo cargado.")
+        return nlp
+
+    except IOError:
+        print("[NLP Service] Método 1 falló. Intentando Método 2 ...")
+        try:
+            #si no funciona el metodo 1 importar directamente el paqueton
+            import es_core_news_sm
+            nlp = es_core_news_sm.load(exclude=COMPONENTES_NO_USADOS)
+            print("[NLP Service] ¡Éxito! Modelo cargado (Método 2).")
+            return nlp
+        except Exception:
+            #solo depuracion
+            print("[NLP Service] ERROR CRÍTICO: No se pudo cargar el modelo spaCy.")
+            print("Asegúrate de haber ejecutado en tu .venv:")
+            print("1. pip install spacy python-dateutil")
+            print("2. python -m spacy download es_core_news_sm")
+            print("3. Reinicia este servidor de Django.")
+            traceback.print_exc()
+            return None
+
+
+def _configurar_patrones(nlp):
+    from spacy.matcher import Matcher, PhraseMatcher
+
+    #definicion de fechas (frases literales, comparadas en minúsculas)
+    fechas = PhraseMatcher(nlp.vocab, attr="LOWER")
+    for fecha_id, frases in FECHAS_RELATIVAS.items():
+        fechas.add(fecha_id, [nlp.make_doc(frase) for frase in frases])
     
     #definir lo que se quiere
     matcher = Matcher(nlp.vocab)
     
     #todos llevan a la desarga de un pdf o navegacion al dashboard
-    pattern_pdf_pacientes = [{"LOWER": {"IN": ["reporte", "listado", "descargar"]}}, {"LOWER": "de", "OP": "?"}, {"LOWER": "pacientes"}]
-    pattern_pdf_medicos = [{"LOWER": {"IN": ["reporte", "listado", "descargar"]}}, {"LOWER": "de", "OP": "?"}, {"LOWER": "médicos"}]
-    pattern_pdf_citas = [{"LOWER": {"IN": ["reporte", "listado", "descargar"]}}, {"LOWER": "de", "OP": "?"}, {"LOWER": "citas"}]
+    pattern_pdf_pacientes = [{"LOWER": {"IN": VERBOS_REPORTE}}, {"LOWER": "de", "OP": "?"}, {"LOWER": "pacientes"}]
+    pattern_pdf_medicos = [{"LOWER": {"IN": VERBOS_REPORTE}}, {"LOWER": "de", "OP": "?"}, {"LOWER": "médicos"}]
+    pattern_pdf_citas = [{"LOWER": {"IN": VERBOS_REPORTE}}, {"LOWER": "de", "OP": "?"}, {"LOWER": "citas"}]
 
     pattern_dash_pacientes = [{"LOWER": "dashboard"}, {"LOWER": "de", "OP": "?"}, {"LOWER": "pacientes"}]
     pattern_dash_citas = [{"LOWER": "dashboard"}, {"LOWER": "de", "OP": "?"}, {"LOWER": "citas"}]
@@ -92,80 +175,182 @@ if nlp:
     matcher.add("REPORTE_DASH_CITAS", [pattern_dash_citas])
     
     print("[NLP Service] Patrones de voz e intenciones cargados.")
-else:
-    print("[NLP Service] ADVERTENCIA: NLP deshabilitado (modelo no cargado).")
+    return matcher, fechas
 
 
+def obtener_nlp():
+    """
+    (nlp, matcher, fechas), cargados la primera vez que se piden. Importar este
+    módulo no carga spaCy: los comandos de manage.py y las migraciones no pagan
+    el modelo. El lock evita que dos hilos del mismo worker lo carguen a la vez.
+    """
+    global nlp, matcher, fechas_matcher, _cargado
+    if _cargado:
+        return nlp, matcher, fechas_matcher
+    with _lock:
+        if not _cargado:
+            inicio = time.perf_counter()
+            try:
+                modelo = _cargar_modelo(getattr(settings, 'NLP_MODELO', 'es_core_news_sm'))
+            except ImportError:
+                print("[NLP Service] ERROR: spaCy no está instalado.")
+                modelo = None
+            if modelo is not None:
+                matcher, fechas_matcher = _configurar_patrones(modelo)
+                nlp = modelo
+                print(f"[NLP Service] Listo en {time.perf_counter() - inicio:.2f}s.")
+            else:
+                print("[NLP Service] ADVERTENCIA: NLP deshabilitado (modelo no cargado).")
+            _cargado = True
+    return nlp, matcher, fechas_matcher
 
-def procesar_comando_voz(texto: str) -> dict:
-    if not nlp or not matcher:
-        return {"error": "Servicio NLP no inicializado."}
-        
-    doc = nlp(texto.lower())
-    
+
+def precargar():
+    """
+    Carga el modelo ya (gunicorn con preload_app lo llama en el master: los
+    workers heredan las páginas del modelo por copy-on-write). Retorna True si quedó disponible.
+    """
+    modelo, _, _ = obtener_nlp()
+    return modelo is not None
+
+
+def _respuesta(intent_string, fecha_id):
+    accion = ACCIONES.get(intent_string)
+    if accion is None:
+        return {"error": "Intención no mapeada."}
+    # Las fechas se calculan en cada respuesta (relativas a hoy)
+    params = _convertir_entidad_fecha(fecha_id) if fecha_id else {}
+    return {**accion, "params": params}
+
+
+def _interpretar_doc(nlp, matcher, fechas, doc):
     #encontrar la intencion
     matches = matcher(doc)
     if not matches:
-        return {"error": "Comando no reconocido. Intente 'reporte de pacientes de ayer'."}
+        return None
 
     matches.sort(key=lambda x: x[2] - x[1], reverse=True)
     match_id, start, end = matches[0]
     intent_string = nlp.vocab.strings[match_id]
-    print(f"[NLP DEBUG] Comando '{texto}' -> Intención: {intent_string}")
-    
-    #encontrar entidades como fechas
-    params = {}
-    for ent in doc.ents:
-        if ent.label_ == "FECHA_RELATIVA":
-            entidad_id = ent.ent_id_
-            print(f"[NLP DEBUG] Entidad encontrada: {ent.text} (ID: {entidad_id})")
-            params.update(_convertir_entidad_fecha(entidad_id))
-            break 
-
-    # mapeo con los reportes estaticos que ya estan
     
-    if intent_string == "REPORTE_PDF_PACIENTES":
-        return {
-            "accion": "descargar",
-            "reporte_id": "pacientes",
-            "url": "/reportes/pacientes/pdf/",
-            "fileName": "listado_pacientes.pdf",
-            "params": params 
-        }
-        
-    elif intent_string == "REPORTE_PDF_MEDICOS":
-        return {
-            "accion": "descargar",
-            "reporte_id": "medicos",
-            "url": "/reportes/medicos/pdf/",
-            "fileName": "listado_medicos.pdf",
-            "params": params
-        }
-
-    elif intent_string == "REPORTE_PDF_CITAS":
-        return {
-            "accion": "descargar",
-            "reporte_id": "citas",
-            "url": "/reportes/citas/pdf/",
-            "fileName": "reporte_citas.pdf",
-            "params": params
-        }
-
-    elif intent_string == "REPORTE_DASH_CITAS":
-        return {
-            "accion": "navegar",
-            "reporte_id": "citas",
-            "url": "/dashboard/reportes/personalizar/citas",
-            "params": params
-        }
-
-    elif intent_string == "REPORTE_DASH_PACIENTES":
-        return {
-            "accion": "navegar",
-            "reporte_id": "pacientes",
-            "url": "/dashboard/reportes/personalizar/pacientes",
-            "params": params
-        }
-
-    return {"error": "Intención no mapeada."}
+    #encontrar fechas (la primera que aparece en el texto)
+    fecha_id = None
+    coincidencias = sorted(fechas(doc), key=lambda m: m[1])
+    if coincidencias:
+        fecha_id = nlp.vocab.strings[coincidencias[0][0]]
+    return intent_string, fecha_id
+
+
+def _interpretar_conocido(normalizado):
+    """Tabla de comandos frecuentes o cache; _SIN_RESULTADO si hay que pasar por spaCy."""
+    conocido = COMANDOS_FRECUENTES.get(normalizado)
+    if conocido is not None:
+        return conocido
+    return _cache_intenciones.get(normalizado, _SIN_RESULTADO)
+
+
+def _interpretar_con_spacy(normalizados):
+    nlp, matcher, fechas = obtener_nlp()
+    if not nlp or not matcher:
+        raise RuntimeError("Servicio NLP no inicializado.")
+    # Solo el tokenizador (ni tagger, ni parser, ni NER), en un solo nlp.pipe
+    return [
+        _interpretar_doc(nlp, matcher, fechas, doc)
+        for doc in nlp.pipe(normalizados, batch_size=TAMANIO_LOTE_PIPE)
+    ]
+
+
+def _interpretar_pendientes(normalizados, remoto):
+    """
+    Con NLP_SOCKET, los textos van al proceso de nlp_worker (el modelo no se
+    carga en el worker web). Si no responde, se usa el modelo local salvo que
+    NLP_SOCKET_FALLBACK_LOCAL sea False.
+    """
+    ruta = getattr(settings, 'NLP_SOCKET', None)
+    if remoto and ruta:
+        from .nlp_remoto import ErrorServicioNLP, interpretar_remoto
+
+        try:
+            return interpretar_remoto(ruta, normalizados, getattr(settings, 'NLP_SOCKET_TIMEOUT', 2))
+        except ErrorServicioNLP as e:
+            print(f"[NLP Service] ADVERTENCIA: servicio NLP en '{ruta}' no disponible: {e}")
+            if not getattr(settings, 'NLP_SOCKET_FALLBACK_LOCAL', True):
+                raise RuntimeError("Servicio NLP no disponible.")
+    return _interpretar_con_spacy(normalizados)
+
+
+def _interpretar_todos(normalizados, remoto=True):
+    """
+    (dict normalizado -> interpretación, error). Los conocidos salen de la tabla
+    o del cache; el resto, sin repetidos, se interpreta de una vez. Si eso
+    falla, esos textos quedan fuera del dict y se devuelve el mensaje de error.
+    """
+    interpretados = {}
+    pendientes = []
+    for normalizado in dict.fromkeys(normalizados):
+        interpretado = _interpretar_conocido(normalizado)
+        if interpretado is _SIN_RESULTADO:
+            pendientes.append(normalizado)
+        else:
+            interpretados[normalizado] = interpretado
+
+    if pendientes:
+        try:
+            resultados = _interpretar_pendientes(pendientes, remoto)
+        except RuntimeError as e:
+            return interpretados, str(e)
+        for normalizado, interpretado in zip(pendientes, resultados):
+            _cache_intenciones.set(normalizado, interpretado)
+            interpretados[normalizado] = interpretado
+    return interpretados, None
+
+
+def interpretar_comandos(textos, remoto=True):
+    """
+    Una interpretación por texto: (intención, id de fecha o None), o None si no
+    se reconoce. Lanza RuntimeError si hace falta spaCy y no está disponible.
+    remoto=False fuerza el modelo local (lo usa el propio nlp_worker).
+    """
+    normalizados = [_normalizar(texto) for texto in textos]
+    interpretados, error = _interpretar_todos(normalizados, remoto)
+    if error:
+        raise RuntimeError(error)
+    return [interpretados[n] for n in normalizados]
+
+
+def interpretar_comando(texto: str):
+    return interpretar_comandos([texto])[0]
+
+
+def _resultado(texto, interpretado):
+    if interpretado is None:
+        return {"error": "Comando no reconocido. Intente 'reporte de pacientes de ayer'."}
+    intent_string, fecha_id = interpretado
+    return _respuesta(intent_string, fecha_id)
+
+
+def procesar_comando_voz(texto: str) -> dict:
+    try:
+        interpretado = interpretar_comando(texto)
+    except RuntimeError as e:
+        return {"error": str(e)}
+    return _resultado(texto, interpretado)
+
+
+def procesar_comandos_voz(textos) -> list:
+    """
+    Varios comandos de una vez (kioscos, reproducción de grabaciones). Devuelve
+    un resultado por texto, en orden; si el servicio NLP falla, solo los textos
+    que no estaban en la tabla ni en el cache llevan el error.
+    """
+    normalizados = [_normalizar(texto) for texto in textos]
+    interpretados, error = _interpretar_todos(normalizados)
+    # Las fechas relativas se resuelven aquí, no al guardar en cache
+    return [
+        _resultado(texto, interpretados[n]) if n in interpretados else {"error": error}
+        for texto, n in zip(textos, normalizados)
+    ]
+
 
+def estadisticas_cache():
+    return _cache_intenciones.stats()
@@ -0,0 +1,288 @@
+# apps/reportes/pdf.py
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import lru_cache
+from itertools import chain, islice
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    print("ADVERTENCIA: pypdf no está instalado; los PDF grandes se generan en un solo proceso.")
+    PdfReader = PdfWriter = None
+
+# Misma geometría que tenía la tabla de Platypus (SimpleDocTemplate + Table)
+MARGEN = 72
+PADDING_MARCO = 6  # padding del Frame de SimpleDocTemplate
+PADDING_H = 6
+PADDING_V = 3
+TAMANIO_FUENTE = 10
+INTERLINEADO = 12
+FUENTE = 'Helvetica'
+FUENTE_NEGRITA = 'Helvetica-Bold'
+COLOR_FILAS = colors.HexColor("#E6F7FF")
+
+# Renderizado en paralelo: por debajo de esto no compensa el costo del pool
+FILAS_MIN_PARALELO = 5000
+PAGINAS_MIN_TRAMO = 20
+
+
+@lru_cache(maxsize=None)
+def estilos_pdf(fuente=None):
+    """ParagraphStyle del encabezado del reporte; se crean una vez por proceso."""
+    styles = getSampleStyleSheet()
+    return {
+        'titulo': ParagraphStyle('title', parent=styles['Heading1'], alignment=TA_CENTER, fontName=(fuente or FUENTE_NEGRITA)),
+        'izquierda': ParagraphStyle('normal_left', parent=styles['Normal'], alignment=TA_LEFT, fontName=(fuente or FUENTE)),
+        'derecha': ParagraphStyle('normal_right', parent=styles['Normal'], alignment=TA_RIGHT, fontName=(fuente or FUENTE), fontSize=9),
+    }
+
+
+@lru_cache(maxsize=4096)
+def _lineas(texto, fuente, ancho):
+    # Fechas, estados, horas... se repiten mucho: el corte de línea se calcula una vez
+    if stringWidth(texto, fuente, TAMANIO_FUENTE) <= ancho:
+        return (texto,)
+    return tuple(simpleSplit(texto, fuente, TAMANIO_FUENTE, ancho)) or ('',)
+
+
+class _TablaCanvas:
+    """Dibuja filas de ancho fijo directo sobre el canvas, paginando a mano."""
+
+    def __init__(self, c, anchos, encabezados, color_encabezado, fuente):
+        self.c = c
+        self.anchos = anchos
+        self.encabezados = encabezados
+        self.color_encabezado = colors.HexColor(color_encabezado)
+        self.fuente = fuente or FUENTE
+        self.fuente_negrita = fuente or FUENTE_NEGRITA
+        ancho_pagina, self.alto_pagina = letter
+        self.x0 = (ancho_pagina - sum(anchos)) / 2
+        self.y = None
+
+    def medir(self, valores, fuente):
+        lineas = [_lineas(v, fuente, a - 2 * PADDING_H) for v, a in zip(valores, self.anchos)]
+        return lineas, max(len(l) for l in lineas) * INTERLINEADO + 2 * PADDING_V
+
+    def cortes_de_pagina(self, filas, y_inicial):
+        """
+        Índices de la primera fila de cada página siguiente a la primera, con la
+        misma lógica de salto que _fila (sin dibujar nada).
+        """
+        _, alto_encabezado = self.medir(self.encabezados, self.fuente_negrita)
+        tope = self.alto_pagina - MARGEN - PADDING_MARCO
+        y = y_inicial - alto_encabezado
+        cortes = []
+        for i, valores in enumerate(filas):
+            _, alto = self.medir(valores, self.fuente)
+            if y - alto < MARGEN + PADDING_MARCO:
+                cortes.append(i)
+                y = tope - alto_encabezado
+            y -= alto
+        return cortes
+
+    def _fila(self, valores, fuente, fondo, color_texto, es_encabezado=False):
+        lineas, alto = self.medir(valores, fuente)
+        if self.y - alto < MARGEN + PADDING_MARCO:
+            self.c.showPage()
+            self.c.setLineWidth(0.5)
+            self.y = self.alto_pagina - MARGEN - PADDING_MARCO
+            if not es_encabezado:
+                # repeatRows=1: el encabezado se repite en cada página
+                self.encabezado()
+
+        c = self.c
+        y_fila = self.y - alto
+        c.setFillColor(fondo)
+        c.rect(self.x0, y_fila, sum(self.anchos), alto, stroke=0, fill=1)
+
+        c.setFillColor(color_texto)
+        c.setFont(fuente, TAMANIO_FUENTE)
+        x = self.x0
+        for ancho, lineas_celda in zip(self.anchos, lineas):
+            # Centrado vertical y horizontal, como ALIGN/VALIGN de la tabla original
+            base = y_fila + (alto + len(lineas_celda) * INTERLINEADO) / 2 - TAMANIO_FUENTE
+            for i, linea in enumerate(lineas_celda):
+                c.drawCentredString(x + ancho / 2, base - i * INTERLINEADO, linea)
+            c.rect(x, y_fila, ancho, alto, stroke=1, fill=0)
+            x += ancho
+        self.y = y_fila
+
+    def encabezado(self):
+        self._fila(self.encabezados, self.fuente_negrita, self.color_encabezado, colors.black, es_encabezado=True)
+
+    def fila(self, valores):
+        self._fila(valores, self.fuente, COLOR_FILAS, colors.black)
+
+
+def _texto_fila(valores):
+    return tuple('' if v is None else str(v) for v in valores)
+
+
+def _parrafos_encabezado(doc):
+    estilos = estilos_pdf(doc['fuente'])
+    return [
+        (Paragraph(f"Generado el: {doc['fecha_gen']} por {doc['generado_por']}", estilos['derecha']), 12),
+        (Paragraph(doc['titulo'], estilos['titulo']), doc['espacio_titulo']),
+        (Paragraph(doc['intro'], estilos['izquierda']), doc['espacio_tabla']),
+    ]
+
+
+def _y_tabla(doc, c=None):
+    """Altura donde empieza la tabla en la primera página; con canvas además dibuja el encabezado."""
+    ancho_pagina, alto_pagina = letter
+    ancho_util = ancho_pagina - 2 * (MARGEN + PADDING_MARCO)
+    y = alto_pagina - MARGEN - PADDING_MARCO
+    for p, espacio in _parrafos_encabezado(doc):
+        _, alto = p.wrap(ancho_util, alto_pagina)
+        y -= alto + p.style.spaceBefore
+        if c is not None:
+            p.drawOn(c, MARGEN + PADDING_MARCO, y)
+        y -= p.style.spaceAfter + espacio
+    return y
+
+
+def _renderizar(destino, doc, filas, primera_parte=True):
+    """
+    Dibuja el documento (o un tramo de páginas). Los tramos que no son el primero
+    empiezan en una página nueva sin el encabezado del reporte.
+    """
+    c = canvas.Canvas(destino, pagesize=letter, pageCompression=1)
+    c.setTitle(doc['titulo'])
+    c.setLineWidth(0.5)
+    c.setStrokeColor(colors.black)
+
+    tabla = _TablaCanvas(c, [a for _, a in doc['columnas']], [t for t, _ in doc['columnas']], doc['color_encabezado'], doc['fuente'])
+    tabla.y = _y_tabla(doc, c) if primera_parte else tabla.alto_pagina - MARGEN - PADDING_MARCO
+    tabla.encabezado()
+    vacia = True
+    for valores in filas:
+        tabla.fila(_texto_fila(valores))
+        vacia = False
+    if vacia and primera_parte:
+        tabla.fila(_texto_fila([doc['mensaje_vacio']] + [''] * (len(doc['columnas']) - 1)))
+    c.save()
+
+
+def _renderizar_parte(doc, filas, primera_parte):
+    """Se ejecuta en el pool: recibe tuplas de texto y devuelve los bytes del tramo."""
+    destino = io.BytesIO()
+    _renderizar(destino, doc, filas, primera_parte)
+    return destino.getvalue()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obtener_pool(procesos):
+    """
+    Pool de procesos del worker, creado la primera vez que hace falta y reutilizado.
+    Cada worker de gunicorn tiene el suyo: en total pueden quedar vivos
+    workers x REPORTES_PDF_PROCESOS procesos (ver config/settings.py).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: el hijo solo importa este módulo (reportlab), no hereda conexiones ni hilos
+            _pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _renderizar_en_paralelo(destino, doc, filas, procesos):
+    """
+    Divide la tabla en tramos de páginas completas (los cortes se calculan antes
+    con cortes_de_pagina), los dibuja en el pool y concatena los PDF resultantes.
+    """
+    tabla = _TablaCanvas(None, [a for _, a in doc['columnas']], [t for t, _ in doc['columnas']], doc['color_encabezado'], doc['fuente'])
+    cortes = [0] + tabla.cortes_de_pagina(filas, _y_tabla(doc)) + [len(filas)]
+    paginas = len(cortes) - 1
+    tramos = min(procesos, max(1, paginas // PAGINAS_MIN_TRAMO))
+    if tramos < 2:
+        _renderizar(destino, doc, filas)
+        return
+
+    limites = [cortes[round(i * paginas / tramos)] for i in range(tramos)] + [len(filas)]
+    pool = _obtener_pool(procesos)
+    try:
+        futuros = [
+            pool.submit(_renderizar_parte, doc, filas[inicio:fin], i == 0)
+            for i, (inicio, fin) in enumerate(zip(limites, limites[1:]))
+        ]
+        partes = [f.result() for f in futuros]
+    except BrokenProcessPool:
+        # Un hijo murió (OOM, señal): se recrea el pool la próxima vez y se dibuja aquí
+        print("[PDF] El pool de renderizado se rompió; se genera en el proceso actual.")
+        _descartar_pool()
+        _renderizar(destino, doc, filas)
+        return
+
+    writer = PdfWriter()
+    for parte in partes:
+        writer.append(PdfReader(io.BytesIO(parte)))
+    writer.add_metadata({'/Title': doc['titulo']})
+    writer.write(destino)
+
+
+def renderizar_tabla_pdf(destino, titulo, generado_por, intro, columnas, filas,
+                         color_encabezado, mensaje_vacio, espacio_titulo=12, espacio_tabla=24,
+                         fuente=None, procesos=1):
+    """
+    Reporte tabular en PDF: encabezado (generado por, título, introducción) y una
+    tabla que se dibuja fila por fila sobre el canvas. El costo es lineal en la
+    cantidad de filas y `filas` puede ser un iterador (queryset por bloques).
+
+    Con procesos > 1 y al menos FILAS_MIN_PARALELO filas, las páginas se reparten
+    en tramos que se dibujan en un pool de procesos (requiere pypdf para unirlos).
+
+    columnas: lista de (encabezado, ancho_en_puntos).
+    """
+    doc = {
+        'titulo': titulo,
+        'generado_por': generado_por,
+        'intro': intro,
+        'columnas': list(columnas),
+        'color_encabezado': color_encabezado,
+        'mensaje_vacio': mensaje_vacio,
+        'espacio_titulo': espacio_titulo,
+        'espacio_tabla': espacio_tabla,
+        'fuente': fuente,
+        'fecha_gen': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    procesos = min(procesos or 1, os.cpu_count() or 1)
+    if procesos < 2 or PdfWriter is None:
+        _renderizar(destino, doc, filas)
+        return
+
+    # Solo se miran las primeras filas: un reporte chico se sigue dibujando
+    # desde el iterador, sin cargar todas las filas en memoria
+    filas = iter(filas)
+    primeras = list(islice(filas, FILAS_MIN_PARALELO))
+    if len(primeras) < FILAS_MIN_PARALELO:
+        _renderizar(destino, doc, primeras)
+        return
+
+    # Tuplas de texto: lo mínimo que hay que enviar a los procesos hijos
+    filas = [_texto_fila(valores) for valores in chain(primeras, filas)]
+    _renderizar_en_paralelo(destino, doc, filas, procesos)
@@ -0,0 +1,24 @@
+# apps/reportes/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.cuentas.models import Usuario
+from .cache import incrementar_version_reportes
+
+
+@receiver([post_save, post_delete], sender='citas_pagos.Cita_Medica')
+def cita_cambiada(sender, instance, **kwargs):
+    incrementar_version_reportes(instance.grupo_id)
+
+
+@receiver([post_save, post_delete], sender='historiasDiagnosticos.Paciente')
+def paciente_cambiado(sender, instance, **kwargs):
+    grupo_id = Usuario.objects.filter(pk=instance.usuario_id).values_list('grupo_id', flat=True).first()
+    incrementar_version_reportes(grupo_id)
+
+
+@receiver([post_save, post_delete])
+def usuario_cambiado(sender, instance, **kwargs):
+    # Incluye subclases de Usuario (Medico)
+    if issubclass(sender, Usuario):
+        incrementar_version_reportes(instance.grupo_id)
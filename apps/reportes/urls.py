@@ -34,7 +34,31 @@ urlpatterns = [
      path('comando_voz/',
          views.procesar_comando_voz_json,
          name='procesar_comando_voz'),
+
+     path('comando_voz/lote/',
+         views.procesar_comandos_voz_json,
+         name='procesar_comandos_voz'),
          
+     path('jobs/',
+         views.reporte_jobs,
+         name='reporte_jobs'),
+
+     path('jobs/<int:job_id>/',
+         views.reporte_job_detalle,
+         name='reporte_job_detalle'),
+
+     path('jobs/<int:job_id>/descargar/',
+         views.reporte_job_descargar,
+         name='reporte_job_descargar'),
+
+     path('exportar/<str:recurso>/<str:formato>/',
+         views.exportar_datos,
+         name='exportar_datos'),
+
+     path('cache/',
+         views.reportes_cache_estadisticas,
+         name='reportes_cache_estadisticas'),
+
      path("backup/json-zip", download_backup_json_zip, name="backup-json-zip"),
     
 
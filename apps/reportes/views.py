@@ -1,20 +1,17 @@
 import os
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone as django_timezone
 from io import BytesIO
 import io
 import json
 import zipfile
 import traceback
 from django.apps import apps
+from django.conf import settings
 from django.db import connection
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER,TA_LEFT, TA_RIGHT
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from datetime import date, datetime,time,timedelta,timezone
@@ -22,8 +19,6 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.db.models import Count
 from django.db.models.functions import TruncDate, TruncMonth
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side,PatternFill
 
 
 
@@ -48,185 +43,123 @@ except ImportError:
     class Cita_Medica: objects = type('obj', (object,), {'select_related': lambda *a, **k: Cita_Medica.objects, 'all': lambda *a, **k: [], 'filter': lambda *a, **k: [], 'none': lambda *a, **k: []})()
 
 
+from apps.cuentas.utils import get_usuario_perfil
+from .backup import generar_backup_sql_zip
+from . import cache as cache_reportes
+from .cache import cache_reporte
+from .consultas import (
+    RECURSOS, PerfilNoEncontrado, consulta_reporte, es_super_admin, filas_reporte, perfil_reporte, rango_fechas,
+)
+from .excel import respuesta_excel
+from .exportar import CONTENT_TYPES, respuesta_exportacion
+from .pdf import renderizar_tabla_pdf
+from .jobs import VISTAS_REPORTE, ParametrosInvalidos, encolar_reporte, normalizar_parametros
+from .models import ReporteJob
+
 try:
-    from .nlp_service import procesar_comando_voz
+    from .nlp_service import procesar_comando_voz, procesar_comandos_voz
 except ImportError:
     print("ADVERTENCIA: No se pudo importar 'nlp_service'.")
     def procesar_comando_voz(texto):
         return {"error": "Servicio NLP no cargado."}
+    def procesar_comandos_voz(textos):
+        return [{"error": "Servicio NLP no cargado."} for _ in textos]
 
 FONT_NAME = None 
 def _get_optional_date_range(request):
     """ayuda a poner un rango de fechas en los reportes si no se dan pone todos
     """
-    fecha_inicio = None
-    fecha_fin = None
     try:
-        fecha_inicio_str = request.query_params.get('fecha_inicio', None)
-        fecha_fin_str = request.query_params.get('fecha_fin', None)
-        
-
-        if fecha_inicio_str:
-            fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d').date()
-        if fecha_fin_str:
-            fecha_fin = datetime.strptime(fecha_fin_str, '%Y-%m-%d').date()
-            
+        fecha_inicio, fecha_fin = rango_fechas(request)
     except (ValueError, TypeError):
-        print(f"[WARN] Fechas inválidas recibidas para PDF: {fecha_inicio_str}, {fecha_fin_str}")
-        pass 
+        print(f"[WARN] Fechas inválidas recibidas para PDF: {request.query_params.get('fecha_inicio')}, {request.query_params.get('fecha_fin')}")
+        return None, None
+    # En los PDF el filtro se aplica solo con las dos fechas
+    if not (fecha_inicio and fecha_fin):
+        return None, None
     return fecha_inicio, fecha_fin
 
 
+def _titulo_reporte(usuario_perfil, general, por_clinica, sin_grupo):
+    if es_super_admin(usuario_perfil):
+        return general
+    if usuario_perfil.grupo:
+        return f"{por_clinica}{usuario_perfil.grupo.nombre}"
+    return sin_grupo
+
+
+def _respuesta_pdf(buffer, filename):
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+
+    if not pdf_bytes.startswith(b'%PDF-'):
+        print("[PDF] Error: El archivo no parece ser un PDF. Primeros bytes:", pdf_bytes[:10])
+        return HttpResponse("Error: El contenido generado no es un PDF válido. Revisa la consola.", status=500)
+
+    response = HttpResponse(pdf_bytes, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Content-Length'] = str(len(pdf_bytes))
+    return response
+
+
 
 @api_view(['GET']) 
 @permission_classes([IsAuthenticated])
+@cache_reporte('pacientes_pdf', por_usuario=True)
 def generar_reporte_pacientes_pdf(request):
     
     try:
-        auth_user = request.user 
-        usuario_perfil = Usuario.objects.select_related('rol', 'grupo').get(correo=auth_user.email)
-        
+        usuario_perfil = perfil_reporte(request)
         admin_grupo = usuario_perfil.grupo
-        admin_rol = usuario_perfil.rol
-
-    except Usuario.DoesNotExist:
-        return HttpResponse(f"Error: Perfil de usuario no encontrado para {auth_user.email}.", status=403)
+    except PerfilNoEncontrado as e:
+        return HttpResponse(f"Error: {e}", status=403)
     except Exception as e:
         traceback.print_exc()
         return HttpResponse(f"Error obteniendo perfil de usuario: {e}", status=500)
     fecha_inicio, fecha_fin = _get_optional_date_range(request)
 #filtrar pacientes por grupo
     try:
-        pacientes_qs = Paciente.objects.select_related('usuario', 'usuario__grupo').order_by('usuario__nombre')
-        
+        pacientes_filtrados = consulta_reporte(usuario_perfil, 'pacientes', fecha_inicio, fecha_fin)
         if fecha_inicio and fecha_fin:
-            
-            pacientes_qs = pacientes_qs.filter(usuario__fecha_registro__date__range=[fecha_inicio, fecha_fin])
             print(f"[DEBUG] Filtrando PDF de Pacientes por fechas: {fecha_inicio} a {fecha_fin}")
-        
-
-        if admin_rol and admin_rol.nombre == 'superAdmin':
-            pacientes_filtrados = pacientes_qs.all()
-            titulo_reporte = "Listado General de Pacientes (Todos los Grupos)"
-        elif admin_grupo:
-            pacientes_filtrados = pacientes_qs.filter(usuario__grupo=admin_grupo)
-            titulo_reporte = f"Listado de Pacientes - Clínica: {admin_grupo.nombre}"
-        else:
-            pacientes_filtrados = Paciente.objects.none()
-            titulo_reporte = "Listado de Pacientes (Sin Grupo Asignado)"
-
-        try:
-            total = pacientes_filtrados.count()
-        except Exception:
-            total = len(list(pacientes_filtrados)) # Fallback para queries complejas
+        titulo_reporte = _titulo_reporte(
+            usuario_perfil,
+            "Listado General de Pacientes (Todos los Grupos)",
+            "Listado de Pacientes - Clínica: ",
+            "Listado de Pacientes (Sin Grupo Asignado)",
+        )
+        total = pacientes_filtrados.count()
 
     except Exception as e:
         traceback.print_exc()
         return HttpResponse("Error al consultar la base de datos (ver consola).", status=500)
 
-    styles = getSampleStyleSheet()
-    
-    # Estilo para el Título
-    title_style = ParagraphStyle('title', parent=styles['Heading1'], alignment=TA_CENTER, fontName=(FONT_NAME or 'Helvetica-Bold'))
-    
-    # Estilo para celdas normales (centradas)
-    normal_center = ParagraphStyle('normal_center', parent=styles['Normal'], alignment=TA_CENTER, fontName=(FONT_NAME or 'Helvetica'))
-    
-    # Estilo para encabezados de tabla
-    header_style = ParagraphStyle('header', parent=normal_center, fontName=(FONT_NAME or 'Helvetica-Bold'))
-
-    normal_left = ParagraphStyle('normal_left', parent=styles['Normal'], 
-                                 alignment=TA_LEFT, fontName=(FONT_NAME or 'Helvetica'))
-    normal_right = ParagraphStyle('normal_right', parent=styles['Normal'], 
-                                  alignment=TA_RIGHT, fontName=(FONT_NAME or 'Helvetica'), fontSize=9)
-   
-
-    data = [
-        [
-            Paragraph("<b>N° Historia Clínica</b>", header_style),
-            Paragraph("<b>Nombre Completo</b>", header_style),
-            Paragraph("<b>Correo Electrónico</b>", header_style),
-            Paragraph("<b>ID Paciente</b>", header_style),
-        ]
-    ]
-
-    try:
-        for paciente in pacientes_filtrados: 
-            numero = getattr(paciente, 'numero_historia_clinica', '')
-            nombre = getattr(getattr(paciente, 'usuario', None), 'nombre', 'N/A')
-            correo = getattr(getattr(paciente, 'usuario', None), 'correo', 'N/A')
-            pid = getattr(paciente, 'id', 'N/A')
-            
-            data.append([
-                Paragraph(str(numero), normal_center),
-                Paragraph(str(nombre), normal_center),
-                Paragraph(str(correo), normal_center),
-                Paragraph(str(pid), normal_center),
-            ])
-    except Exception as e:
-        traceback.print_exc()
-        return HttpResponse("Error al preparar datos del PDF (ver consola).", status=500)
+    intro_texto = f"Este reporte detalla <b>{total} paciente(s)</b>"
+    if fecha_inicio and fecha_fin:
+        intro_texto += f" registrado(s) entre las fechas <b>{fecha_inicio}</b> y <b>{fecha_fin}</b>."
+    else:
+        intro_texto += " (histórico completo)."
 
+    #construye el pdf (filas directo al canvas, leídas por bloques)
     try:
-        if len(data) == 1: 
-            data.append([Paragraph("No se encontraron pacientes registrados para este grupo.", normal_center), "", "", ""])
-    except Exception:
-        pass 
+        filas = filas_reporte(
+            pacientes_filtrados, 'pacientes', ('numero_historia_clinica', 'nombre', 'correo', 'id'),
+            orden=('usuario__nombre',),
+        )
 
-    #construye el pdf
-    try:
         buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=72, bottomMargin=72,title=titulo_reporte)
-        elements = []
-        
-        fecha_gen=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        elements.append(Paragraph(f"Generado el: {fecha_gen} por {usuario_perfil.nombre}", normal_right))
-        elements.append(Spacer(1, 12))
-
-        elements.append(Paragraph(titulo_reporte, title_style))
-        elements.append(Spacer(1, 24))
-
-        total_registros = len(data) - 1 # Restamos la fila de encabezado
-        intro_texto = f"Este reporte detalla <b>{total_registros} paciente(s)</b>"
-        if fecha_inicio and fecha_fin:
-            intro_texto += f" registrado(s) entre las fechas <b>{fecha_inicio}</b> y <b>{fecha_fin}</b>."
-        else:
-            intro_texto += " (histórico completo)."
-        elements.append(Paragraph(intro_texto, normal_left))
-        elements.append(Spacer(1, 24))
-
-        table = Table(data, colWidths=[120, 150, 180, 80], repeatRows=1)
-        table_style = TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#839DB8")), 
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#E6F7FF")), 
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ])
-        table.setStyle(table_style)
-        elements.append(table)
-
-        doc.build(elements)
-        
-        buffer.seek(0)
-        pdf_bytes = buffer.read()
-        buffer.close()
-
-        if len(pdf_bytes) == 0:
-            return HttpResponse("Error: PDF generado está vacío. Revisa la consola.", status=500)
-        
-        head = pdf_bytes[:10]
-        if not head.startswith(b'%PDF-'):
-            print("[PDF] Error: El archivo no parece ser un PDF. Primeros bytes:", head)
-            return HttpResponse("Error: El contenido generado no es un PDF válido. Revisa la consola.", status=500)
-
-        
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="listado_pacientes_{admin_grupo.id if admin_grupo else "super"}.pdf"'
-        response['Content-Length'] = str(len(pdf_bytes))
-        return response
+        renderizar_tabla_pdf(
+            buffer, titulo_reporte, usuario_perfil.nombre, intro_texto,
+            columnas=[("N° Historia Clínica", 120), ("Nombre Completo", 150), ("Correo Electrónico", 180), ("ID Paciente", 80)],
+            filas=filas,
+            color_encabezado="#839DB8",
+            mensaje_vacio="No se encontraron pacientes registrados para este grupo.",
+            espacio_titulo=24,
+            fuente=FONT_NAME,
+            procesos=getattr(settings, 'REPORTES_PDF_PROCESOS', 1),
+        )
+        filename = f'listado_pacientes_{admin_grupo.id if admin_grupo else "super"}.pdf'
+        return _respuesta_pdf(buffer, filename)
 
     except Exception as e:
         traceback.print_exc()
@@ -234,148 +167,59 @@ def generar_reporte_pacientes_pdf(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_reporte('medicos_pdf', por_usuario=True)
 def generar_reporte_medicos_pdf(request):
     
     #obetenerl el grupo
     try:
-        auth_user = request.user
-        usuario_perfil = Usuario.objects.select_related('rol', 'grupo').get(correo=auth_user.email)
+        usuario_perfil = perfil_reporte(request)
         admin_grupo = usuario_perfil.grupo
-        admin_rol = usuario_perfil.rol
-    except Usuario.DoesNotExist:
-        return HttpResponse(f"Error: Perfil de usuario no encontrado para {auth_user.email}.", status=403)
+    except PerfilNoEncontrado as e:
+        return HttpResponse(f"Error: {e}", status=403)
     except Exception as e:
         traceback.print_exc()
         return HttpResponse(f"Error obteniendo perfil de usuario: {e}", status=500)
     fecha_inicio, fecha_fin = _get_optional_date_range(request)
     #filtrar por grupo
     try:
-        rol_medico = Rol.objects.get(nombre='medico')
-        medicos_qs = Usuario.objects.select_related('grupo', 'rol').filter(rol=rol_medico).order_by('nombre')
-
+        medicos_filtrados = consulta_reporte(usuario_perfil, 'medicos', fecha_inicio, fecha_fin)
         if fecha_inicio and fecha_fin:
-            # El campo de fecha está en el mismo modelo Usuario
-            medicos_qs = medicos_qs.filter(fecha_registro__date__range=[fecha_inicio, fecha_fin])
             print(f"[DEBUG] Filtrando PDF de Médicos por fechas: {fecha_inicio} a {fecha_fin}")
-        
-
-        if admin_rol and admin_rol.nombre == 'superAdmin':
-            medicos_filtrados = medicos_qs.all()
-            titulo_reporte = "Listado General de Médicos (Todos los Grupos)"
-        elif admin_grupo:
-            medicos_filtrados = medicos_qs.filter(grupo=admin_grupo)
-            titulo_reporte = f"Listado de Médicos - Clínica: {admin_grupo.nombre}"
-        else:
-            medicos_filtrados = Usuario.objects.none()
-            titulo_reporte = "Listado de Médicos (Sin Grupo Asignado)"
-
-        try:
-            total = medicos_filtrados.count()
-        except Exception:
-            total = len(list(medicos_filtrados))
+        titulo_reporte = _titulo_reporte(
+            usuario_perfil,
+            "Listado General de Médicos (Todos los Grupos)",
+            "Listado de Médicos - Clínica: ",
+            "Listado de Médicos (Sin Grupo Asignado)",
+        )
+        total = medicos_filtrados.count()
 
-    except Rol.DoesNotExist:
-        return HttpResponse("Error: El Rol 'medico' no existe en la base de datos.", status=500)
     except Exception as e:
         traceback.print_exc()
         return HttpResponse("Error al consultar la base de datos (ver consola).", status=500)
 
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('title', parent=styles['Heading1'], alignment=TA_CENTER, fontName=(FONT_NAME or 'Helvetica-Bold'))
-    normal_center = ParagraphStyle('normal_center', parent=styles['Normal'], alignment=TA_CENTER, fontName=(FONT_NAME or 'Helvetica'))
-    header_style = ParagraphStyle('header', parent=normal_center, fontName=(FONT_NAME or 'Helvetica-Bold'))
-    normal_left = ParagraphStyle('normal_left', parent=styles['Normal'], alignment=TA_LEFT, fontName=(FONT_NAME or 'Helvetica'))
-    normal_right = ParagraphStyle('normal_right', parent=styles['Normal'], alignment=TA_RIGHT, fontName=(FONT_NAME or 'Helvetica'), fontSize=9)
-    
-
-    data = [
-        [
-            Paragraph("<b>Nombre Completo</b>", header_style),
-            Paragraph("<b>Correo Electrónico</b>", header_style),
-            Paragraph("<b>Teléfono</b>", header_style),
-            Paragraph("<b>ID Médico</b>", header_style),
-        ]
-    ]
+    intro_texto = f"Este reporte detalla <b>{total} médico(s)</b>"
+    if fecha_inicio and fecha_fin:
+        intro_texto += f" registrado(s) entre las fechas <b>{fecha_inicio}</b> y <b>{fecha_fin}</b>."
+    else:
+        intro_texto += " (histórico completo)."
 
+    #construccion del documento solo pdf
     try:
-        for medico in medicos_filtrados: 
-            nombre = getattr(medico, 'nombre', 'N/A')
-            correo = getattr(medico, 'correo', 'N/A')
-            telefono = getattr(medico, 'telefono', '') 
-            mid = getattr(medico, 'id', 'N/A')
-            
-            data.append([
-                Paragraph(str(nombre), normal_center),
-                Paragraph(str(correo), normal_center),
-                Paragraph(str(telefono), normal_center),
-                Paragraph(str(mid), normal_center),
-            ])
-    except Exception as e:
-        traceback.print_exc()
-        return HttpResponse("Error al preparar datos del PDF (ver consola).", status=500)
+        filas = filas_reporte(medicos_filtrados, 'medicos', ('nombre', 'correo', 'telefono', 'id'), orden=('nombre',))
 
-    # Mensaje si no hay datos
-    try:
-        if len(data) == 1:
-            data.append([Paragraph("No se encontraron médicos registrados para este grupo.", normal_center), "", "", ""])
-    except Exception:
-        pass
-
-    #construccion del documento solo pdf 
-    try:
         buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=72, bottomMargin=72,title=titulo_reporte)
-        elements = []
-        
-        fecha_gen = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        elements.append(Paragraph(f"Generado el: {fecha_gen} por {usuario_perfil.nombre}", normal_right))
-        elements.append(Spacer(1, 12))
-        elements.append(Paragraph(titulo_reporte, title_style))
-        elements.append(Spacer(1, 12))
-
-        total_registros = len(data) - 1 # Restamos la fila de encabezado
-        intro_texto = f"Este reporte detalla <b>{total_registros} médico(s)</b>"
-        if fecha_inicio and fecha_fin:
-            intro_texto += f" registrado(s) entre las fechas <b>{fecha_inicio}</b> y <b>{fecha_fin}</b>."
-        else:
-            intro_texto += " (histórico completo)."
-        elements.append(Paragraph(intro_texto, normal_left))
-        elements.append(Spacer(1, 24))
-
-        elements.append(Spacer(1, 24))
-
-        table = Table(data, colWidths=[180, 180, 80, 80], repeatRows=1)
-        table_style = TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#318666")), 
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#E6F7FF")),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ])
-        table.setStyle(table_style)
-        elements.append(table)
-
-        doc.build(elements)
-        
-        buffer.seek(0)
-        pdf_bytes = buffer.read()
-        buffer.close()
-
-        if len(pdf_bytes) == 0:
-            return HttpResponse("Error: PDF generado está vacío. Revisa la consola.", status=500)
-        
-        head = pdf_bytes[:10]
-        if not head.startswith(b'%PDF-'):
-            print("[PDF] Error: El archivo no parece ser un PDF. Primeros bytes:", head)
-            return HttpResponse("Error: El contenido generado no es un PDF válido. Revisa la consola.", status=500)
-
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
+        renderizar_tabla_pdf(
+            buffer, titulo_reporte, usuario_perfil.nombre, intro_texto,
+            columnas=[("Nombre Completo", 180), ("Correo Electrónico", 180), ("Teléfono", 80), ("ID Médico", 80)],
+            filas=filas,
+            color_encabezado="#318666",
+            mensaje_vacio="No se encontraron médicos registrados para este grupo.",
+            espacio_tabla=48,
+            fuente=FONT_NAME,
+            procesos=getattr(settings, 'REPORTES_PDF_PROCESOS', 1),
+        )
         filename = f'listado_medicos_{admin_grupo.id if admin_grupo else "super"}.pdf'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response['Content-Length'] = str(len(pdf_bytes))
-        return response
+        return _respuesta_pdf(buffer, filename)
 
     except Exception as e:
         traceback.print_exc()
@@ -384,164 +228,70 @@ def generar_reporte_medicos_pdf(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_reporte('citas_pdf', por_usuario=True)
 def generar_reporte_citas_pdf(request):
     
     #obtener el grupo
     try:
-        auth_user = request.user
-        usuario_perfil = Usuario.objects.select_related('rol', 'grupo').get(correo=auth_user.email)
+        usuario_perfil = perfil_reporte(request)
         admin_grupo = usuario_perfil.grupo
-        admin_rol = usuario_perfil.rol
-    except Usuario.DoesNotExist:
-        return HttpResponse(f"Error: Perfil de usuario no encontrado para {auth_user.email}.", status=403)
+    except PerfilNoEncontrado as e:
+        return HttpResponse(f"Error: {e}", status=403)
     except Exception as e:
         traceback.print_exc()
         return HttpResponse(f"Error obteniendo perfil de usuario: {e}", status=500)
     fecha_inicio, fecha_fin = _get_optional_date_range(request)
     try:
-        citas_qs = Cita_Medica.objects.select_related(
-            'paciente__usuario',
-            'grupo'
-        ).order_by('-fecha', '-hora_inicio')
-
+        citas_filtradas = consulta_reporte(usuario_perfil, 'citas', fecha_inicio, fecha_fin)
         if fecha_inicio and fecha_fin:
-            # El campo de fecha está en el mismo modelo Cita_Medica
-            citas_qs = citas_qs.filter(fecha__range=[fecha_inicio, fecha_fin])
             print(f"[DEBUG] Filtrando PDF de Citas por fechas: {fecha_inicio} a {fecha_fin}")
-        
-
-        if admin_rol and admin_rol.nombre == 'superAdmin':
-            citas_filtradas = citas_qs.all()
-            titulo_reporte = "Reporte General de Citas (Todos los Grupos)"
-        elif admin_grupo:
-            citas_filtradas = citas_qs.filter(grupo=admin_grupo)
-            titulo_reporte = f"Reporte de Citas - Clínica: {admin_grupo.nombre}"
-        else:
-            citas_filtradas = Cita_Medica.objects.none()
-            titulo_reporte = "Reporte de Citas (Sin Grupo Asignado)"
-
-        try:
-            total = citas_filtradas.count()
-        except Exception:
-            total = len(list(citas_filtradas))
+        titulo_reporte = _titulo_reporte(
+            usuario_perfil,
+            "Reporte General de Citas (Todos los Grupos)",
+            "Reporte de Citas - Clínica: ",
+            "Reporte de Citas (Sin Grupo Asignado)",
+        )
+        total = citas_filtradas.count()
 
     except Exception as e:
         traceback.print_exc()
         return HttpResponse("Error al consultar la base de datos (ver consola).", status=500)
 
 
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('title', parent=styles['Heading1'], alignment=TA_CENTER, fontName=(FONT_NAME or 'Helvetica-Bold'))
-    normal_center = ParagraphStyle('normal_center', parent=styles['Normal'], alignment=TA_CENTER, fontName=(FONT_NAME or 'Helvetica'))
-    header_style = ParagraphStyle('header', parent=normal_center, fontName=(FONT_NAME or 'Helvetica-Bold'))
-    normal_left = ParagraphStyle('normal_left', parent=styles['Normal'], alignment=TA_LEFT, fontName=(FONT_NAME or 'Helvetica'))
-    normal_right = ParagraphStyle('normal_right', parent=styles['Normal'], alignment=TA_RIGHT, fontName=(FONT_NAME or 'Helvetica'), fontSize=9)
-    
-    data = [
-        [
-            Paragraph("<b>Fecha</b>", header_style),
-            Paragraph("<b>Hora</b>", header_style),
-            Paragraph("<b>Paciente</b>", header_style),
-            Paragraph("<b>Estado</b>", header_style),
-            Paragraph("<b>ID Cita</b>", header_style),
-        ]
-    ]
-
-    try:
-        for cita in citas_filtradas:
-            fecha = getattr(cita, 'fecha', 'N/A')
-            hora_inicio = getattr(cita, 'hora_inicio', time(0,0))
-        
-            paciente_nombre = getattr(getattr(getattr(cita, 'paciente', None), 'usuario', None), 'nombre', 'N/A')
-            
-            estado = cita.get_estado_cita_display() if hasattr(cita, 'get_estado_cita_display') else getattr(cita, 'estado_cita', 'N/A')
-            
-            cid = getattr(cita, 'id', 'N/A')
-            
-            data.append([
-                Paragraph(str(fecha), normal_center),
-                Paragraph(str(hora_inicio)[:5], normal_center), 
-                Paragraph(str(paciente_nombre), normal_center),
-                Paragraph(str(estado), normal_center),
-                Paragraph(str(cid), normal_center),
-            ])
-    except Exception as e:
-        traceback.print_exc()
-        return HttpResponse("Error al preparar datos del PDF (ver consola).", status=500)
+    intro_texto = f"Este reporte detalla <b>{total} cita(s)</b>"
+    if fecha_inicio and fecha_fin:
+        intro_texto += f" agendada(s) entre las fechas <b>{fecha_inicio}</b> y <b>{fecha_fin}</b>."
+    else:
+        intro_texto += " (histórico completo)."
 
-    
     try:
-        if len(data) == 1:
-            data.append([Paragraph("No se encontraron citas registradas para este grupo.", normal_center), "", "", "", ""])
-    except Exception:
-        pass
+        estados = dict(Cita_Medica.ESTADOS_CITA)
+        filas = (
+            (c.fecha, str(c.hora_inicio)[:5], c.paciente or 'N/A', estados.get(c.estado, c.estado), c.id)
+            for c in filas_reporte(
+                citas_filtradas, 'citas', ('fecha', 'hora_inicio', 'paciente', 'estado', 'id'),
+                orden=('-fecha', '-hora_inicio'),
+            )
+        )
 
-    
-    try:
         buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=72, bottomMargin=72,title=titulo_reporte)
-        elements = []
-
-        fecha_gen = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        elements.append(Paragraph(f"Generado el: {fecha_gen} por {usuario_perfil.nombre}", normal_right))
-        elements.append(Spacer(1, 12))
-        
-        elements.append(Paragraph(titulo_reporte, title_style))
-        elements.append(Spacer(1, 12))
-
-        total_registros = len(data) - 1 # Restamos la fila de encabezado
-        intro_texto = f"Este reporte detalla <b>{total_registros} cita(s)</b>"
-        if fecha_inicio and fecha_fin:
-            intro_texto += f" agendada(s) entre las fechas <b>{fecha_inicio}</b> y <b>{fecha_fin}</b>."
-        else:
-            intro_texto += " (histórico completo)."
-        elements.append(Paragraph(intro_texto, normal_left))
-        elements.append(Spacer(1, 24))
-
-        elements.append(Spacer(1, 24))
-
-    
-        table = Table(data, colWidths=[80, 60, 200, 100, 50], repeatRows=1)
-        table_style = TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#8AD0E8")), 
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#E6F7FF")), 
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ])
-        table.setStyle(table_style)
-        elements.append(table)
-
-        doc.build(elements)
-        
-        buffer.seek(0)
-        pdf_bytes = buffer.read()
-        buffer.close()
-
-        if len(pdf_bytes) == 0:
-            return HttpResponse("Error: PDF generado está vacío. Revisa la consola.", status=500)
-        
-        head = pdf_bytes[:10]
-        if not head.startswith(b'%PDF-'):
-            print("[PDF] Error: El archivo no parece ser un PDF. Primeros bytes:", head)
-            return HttpResponse("Error: El contenido generado no es un PDF válido. Revisa la consola.", status=500)
-
-        
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
+        renderizar_tabla_pdf(
+            buffer, titulo_reporte, usuario_perfil.nombre, intro_texto,
+            columnas=[("Fecha", 80), ("Hora", 60), ("Paciente", 200), ("Estado", 100), ("ID Cita", 50)],
+            filas=filas,
+            color_encabezado="#8AD0E8",
+            mensaje_vacio="No se encontraron citas registradas para este grupo.",
+            espacio_tabla=48,
+            fuente=FONT_NAME,
+            procesos=getattr(settings, 'REPORTES_PDF_PROCESOS', 1),
+        )
         filename = f'reporte_citas_{admin_grupo.id if admin_grupo else "super"}.pdf'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response['Content-Length'] = str(len(pdf_bytes))
-        return response
+        return _respuesta_pdf(buffer, filename)
 
     except Exception as e:
         traceback.print_exc()
         return HttpResponse("Error interno generando el PDF. Revisa la consola.", status=500)
-
-
-
-
+    
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -549,15 +299,9 @@ def reporte_citas_por_dia(request):
     
     #usuario 
     try:
-        auth_user = request.user
-        usuario_perfil = Usuario.objects.select_related('rol', 'grupo').get(correo=auth_user.email)
-        admin_grupo = usuario_perfil.grupo
-        admin_rol = usuario_perfil.rol
-    except Usuario.DoesNotExist:
-        return Response(
-            {"error": f"Perfil de usuario no encontrado para {auth_user.email}."}, 
-            status=status.HTTP_403_FORBIDDEN
-        )
+        usuario_perfil = perfil_reporte(request)
+    except PerfilNoEncontrado as e:
+        return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
     except Exception as e:
         traceback.print_exc()
         return Response(
@@ -565,20 +309,9 @@ def reporte_citas_por_dia(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-    #obtener filtr por fechas
+    #obtener filtr por fechas (ultimos 30 dias si no se pone nada)
     try:
-        #ultimos 30 dias si no se pone nada
-        fecha_fin_dt = datetime.now().date()
-        fecha_inicio_dt = fecha_fin_dt - timedelta(days=29)
-
-        fecha_inicio_str = request.query_params.get('fecha_inicio', None)
-        fecha_fin_str = request.query_params.get('fecha_fin', None)
-
-        if fecha_inicio_str:
-            fecha_inicio_dt = datetime.strptime(fecha_inicio_str, '%Y-%m-%d').date()
-        if fecha_fin_str:
-            fecha_fin_dt = datetime.strptime(fecha_fin_str, '%Y-%m-%d').date()
-    
+        fecha_inicio_dt, fecha_fin_dt = rango_fechas(request, dias_por_defecto=30)
     except ValueError:
         return Response(
             {"error": "Formato de fecha inválido. Use AAAA-MM-DD."},
@@ -589,17 +322,7 @@ def reporte_citas_por_dia(request):
 
     #filtrar datos por grupos
     try:
-        citas_qs_base = Cita_Medica.objects.filter(
-            fecha__range=[fecha_inicio_dt, fecha_fin_dt]
-        )
-
-        
-        if admin_rol and admin_rol.nombre == 'superAdmin':
-            citas_qs_filtradas = citas_qs_base
-        elif admin_grupo:
-            citas_qs_filtradas = citas_qs_base.filter(grupo=admin_grupo)
-        else:
-            citas_qs_filtradas = Cita_Medica.objects.none()
+        citas_qs_filtradas = consulta_reporte(usuario_perfil, 'citas', fecha_inicio_dt, fecha_fin_dt)
 
         data_agrupada = citas_qs_filtradas.annotate(
             dia=TruncDate('fecha')
@@ -620,22 +343,20 @@ def reporte_citas_por_dia(request):
         ]
 
         #generrar los datos
-        lista_citas_qs = citas_qs_filtradas.select_related(
-            'paciente__usuario'
-        ).order_by('-fecha', '-hora_inicio')[:25] # <--- LÍMITE DE 25
-
-        lista_citas = []
-        for cita in lista_citas_qs:
-            paciente_nombre = getattr(getattr(getattr(cita, 'paciente', None), 'usuario', None), 'nombre', 'N/A')
-            estado = cita.get_estado_cita_display() if hasattr(cita, 'get_estado_cita_display') else getattr(cita, 'estado_cita', 'N/A')
-            
-            lista_citas.append({
-                "id": cita.id,
-                "fecha": cita.fecha.isoformat(),
-                "hora_inicio": cita.hora_inicio.strftime('%H:%M'), 
-                "paciente": paciente_nombre,
-                "estado": estado
-            })
+        estados = dict(Cita_Medica.ESTADOS_CITA)
+        lista_citas = [
+            {
+                "id": c.id,
+                "fecha": c.fecha.isoformat(),
+                "hora_inicio": c.hora_inicio.strftime('%H:%M'), 
+                "paciente": c.paciente or 'N/A',
+                "estado": estados.get(c.estado, c.estado),
+            }
+            for c in filas_reporte(
+                citas_qs_filtradas, 'citas', ('id', 'fecha', 'hora_inicio', 'paciente', 'estado'),
+                orden=('-fecha', '-hora_inicio'), limite=25,  # <--- LÍMITE DE 25
+            )
+        ]
         
         
         response_data = {
@@ -656,32 +377,21 @@ def reporte_citas_por_dia(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_reporte('citas_excel')
 def generar_reporte_citas_excel(request):
     
     #obtener el grupo por el usuario
     try:
-        auth_user = request.user
-        usuario_perfil = Usuario.objects.select_related('rol', 'grupo').get(correo=auth_user.email)
+        usuario_perfil = perfil_reporte(request)
         admin_grupo = usuario_perfil.grupo
-        admin_rol = usuario_perfil.rol
-    except Usuario.DoesNotExist:
+    except PerfilNoEncontrado:
         return HttpResponse(f"Error: Perfil de usuario no encontrado.", status=403)
     except Exception as e:
         return HttpResponse(f"Error obteniendo perfil de usuario: {e}", status=500)
 
     #obtener filtros de fechas
     try:
-        fecha_fin_dt = datetime.now().date()
-        fecha_inicio_dt = fecha_fin_dt - timedelta(days=29)
-        
-        fecha_inicio_str = request.query_params.get('fecha_inicio', None)
-        fecha_fin_str = request.query_params.get('fecha_fin', None)
-
-        if fecha_inicio_str:
-            fecha_inicio_dt = datetime.strptime(fecha_inicio_str, '%Y-%m-%d').date()
-        if fecha_fin_str:
-            fecha_fin_dt = datetime.strptime(fecha_fin_str, '%Y-%m-%d').date()
-            
+        fecha_inicio_dt, fecha_fin_dt = rango_fechas(request, dias_por_defecto=30)
     except ValueError:
         return HttpResponse("Formato de fecha inválido. Use AAAA-MM-DD.", status=400)
     except Exception as e:
@@ -689,22 +399,12 @@ def generar_reporte_citas_excel(request):
 
     #filtrar datos
     try:
-        citas_qs_base = Cita_Medica.objects.filter(
-            fecha__range=[fecha_inicio_dt, fecha_fin_dt]
-        )
-
-        if admin_rol and admin_rol.nombre == 'superAdmin':
-            citas_filtrados = citas_qs_base.select_related(
-                'paciente__usuario', 'grupo'
-            ).order_by('-fecha', '-hora_inicio')
+        citas_filtrados = consulta_reporte(usuario_perfil, 'citas', fecha_inicio_dt, fecha_fin_dt)
+        if es_super_admin(usuario_perfil):
             titulo_reporte = f"Reporte Citas {fecha_inicio_dt} a {fecha_fin_dt} (Todos)"
         elif admin_grupo:
-            citas_filtrados = citas_qs_base.filter(grupo=admin_grupo).select_related(
-                'paciente__usuario'
-            ).order_by('-fecha', '-hora_inicio')
             titulo_reporte = f"Reporte Citas {fecha_inicio_dt} a {fecha_fin_dt} ({admin_grupo.nombre})"
         else:
-            citas_filtrados = Cita_Medica.objects.none()
             titulo_reporte = "Reporte Citas (Sin Grupo)"
 
     except Exception as e:
@@ -713,69 +413,25 @@ def generar_reporte_citas_excel(request):
 
     #generar el archivo excel
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Reporte de Citas"
-
-        #estilos del archivo(es solo una tabla gaaaaaaaa)
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="004A99", end_color="004A99", fill_type="solid")  
-        center_align = Alignment(horizontal="center", vertical="center")
-        thin_border = Border(left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin'))
-        #encabezados
-        headers = ["ID Cita", "Fecha", "Hora Inicio", "Hora Fin", "Paciente", "Estado", "Notas"]
-        ws.append(headers)
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = center_align
-
-        # datos
-        row_num = 2
-        for cita in citas_filtrados:
-            paciente_nombre = getattr(getattr(getattr(cita, 'paciente', None), 'usuario', None), 'nombre', 'N/A')
-            estado = cita.get_estado_cita_display() if hasattr(cita, 'get_estado_cita_display') else getattr(cita, 'estado_cita', 'N/A')
-            
-            ws.append([
-                cita.id,
-                cita.fecha,
-                cita.hora_inicio,
-                cita.hora_fin,
-                paciente_nombre,
-                estado,
-                getattr(cita, 'notas', '')
-            ])
-            
-            #formatos
-            ws[f'B{row_num}'].number_format = 'YYYY-MM-DD'
-            ws[f'C{row_num}'].number_format = 'hh:mm'
-            ws[f'D{row_num}'].number_format = 'hh:mm'
-            row_num += 1
-            
-        
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter 
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            ws.column_dimensions[column].width = adjusted_width
-
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        estados = dict(Cita_Medica.ESTADOS_CITA)
+        filas = (
+            (c.id, c.fecha, c.hora_inicio, c.hora_fin, c.paciente or 'N/A', estados.get(c.estado, c.estado), c.notas)
+            for c in filas_reporte(
+                citas_filtrados, 'citas', ('id', 'fecha', 'hora_inicio', 'hora_fin', 'paciente', 'estado', 'notas'),
+                orden=('-fecha', '-hora_inicio'),
+            )
         )
+        columnas = [
+            ("ID Cita", None),
+            ("Fecha", 'fecha'),
+            ("Hora Inicio", 'hora'),
+            ("Hora Fin", 'hora'),
+            ("Paciente", None),
+            ("Estado", None),
+            ("Notas", None),
+        ]
         filename = f'reporte_citas_{admin_grupo.id if admin_grupo else "super"}_{fecha_inicio_dt}_a_{fecha_fin_dt}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        wb.save(response)
-        return response
+        return respuesta_excel(filename, "Reporte de Citas", columnas, filas)
 
     except Exception as e:
         traceback.print_exc()
@@ -789,42 +445,21 @@ def reporte_pacientes_por_mes_json(request):
     
     #obtener grupo
     try:
-        auth_user = request.user 
-        usuario_perfil = Usuario.objects.select_related('rol', 'grupo').get(correo=auth_user.email)
-        admin_grupo = usuario_perfil.grupo
-        admin_rol = usuario_perfil.rol
-    except Usuario.DoesNotExist:
+        usuario_perfil = perfil_reporte(request)
+    except PerfilNoEncontrado:
         return Response({"error": "Perfil de usuario no encontrado."}, status=status.HTTP_403_FORBIDDEN)
     except Exception as e:
         return Response({"error": f"Error obteniendo perfil: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     #obtener fechas
     try:
-        fecha_fin = datetime.now().date()
-        fecha_inicio = fecha_fin - timedelta(days=29)
-
-        fecha_inicio_str = request.query_params.get('fecha_inicio', None)
-        fecha_fin_str = request.query_params.get('fecha_fin', None)
-
-        if fecha_inicio_str:
-            fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d').date()
-        if fecha_fin_str:
-            fecha_fin = datetime.strptime(fecha_fin_str, '%Y-%m-%d').date()
+        fecha_inicio, fecha_fin = rango_fechas(request, dias_por_defecto=30)
     except Exception as e:
         return Response({"error": f"Formato de fecha inválido: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
     #Filtrar Pacientes
     try:
-        pacientes_qs = Paciente.objects.filter(
-            usuario__fecha_registro__date__range=[fecha_inicio, fecha_fin]
-        )
-
-        if admin_rol and admin_rol.nombre == 'superAdmin':
-            pacientes_filtrados = pacientes_qs
-        elif admin_grupo:
-            pacientes_filtrados = pacientes_qs.filter(usuario__grupo=admin_grupo)
-        else:
-            pacientes_filtrados = Paciente.objects.none() 
+        pacientes_filtrados = consulta_reporte(usuario_perfil, 'pacientes', fecha_inicio, fecha_fin)
 
         datos_grafico = (
             pacientes_filtrados
@@ -839,21 +474,18 @@ def reporte_pacientes_por_mes_json(request):
             for item in datos_grafico
         ]
 
-        lista_pacientes_detalle = (
-            pacientes_filtrados
-            .select_related('usuario')
-            .order_by('-usuario__fecha_registro')[:25] 
-        )
-        
         lista_pacientes_formato = [
             {
                 "id": p.id,
-                "fecha_registro": p.usuario.fecha_registro.strftime('%Y-%m-%d'),
-                "nombre": p.usuario.nombre,
-                "correo": p.usuario.correo,
+                "fecha_registro": p.fecha_registro.strftime('%Y-%m-%d'),
+                "nombre": p.nombre,
+                "correo": p.correo,
                 "historia_clinica": p.numero_historia_clinica,
             }
-            for p in lista_pacientes_detalle
+            for p in filas_reporte(
+                pacientes_filtrados, 'pacientes', ('id', 'fecha_registro', 'nombre', 'correo', 'numero_historia_clinica'),
+                orden=('-usuario__fecha_registro',), limite=25,
+            )
         ]
         
         return Response({
@@ -868,86 +500,192 @@ def reporte_pacientes_por_mes_json(request):
 #view para la construccion del excel
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_reporte('pacientes_excel')
 def generar_reporte_pacientes_excel(request):
     
     try:
-        auth_user = request.user 
-        usuario_perfil = Usuario.objects.select_related('rol', 'grupo').get(correo=auth_user.email)
-        admin_grupo = usuario_perfil.grupo
-        admin_rol = usuario_perfil.rol
-    except Usuario.DoesNotExist:
+        usuario_perfil = perfil_reporte(request)
+    except PerfilNoEncontrado:
         return HttpResponse("Error: Perfil de usuario no encontrado.", status=403)
     except Exception as e:
         return HttpResponse(f"Error obteniendo perfil: {e}", status=500)
 
     try:
-        today = datetime.now().date()
-        default_start = today.replace(month=1, day=1).isoformat()
-        
-        fecha_fin_str = request.query_params.get('fecha_fin', today.isoformat())
-        fecha_inicio_str = request.query_params.get('fecha_inicio', default_start)
-        
-        fecha_inicio = datetime.fromisoformat(fecha_inicio_str).date()
-        fecha_fin = datetime.fromisoformat(fecha_fin_str).date()
+        # Por defecto: desde el 1 de enero del año en curso hasta hoy
+        fecha_inicio, fecha_fin = rango_fechas(request, inicio_por_defecto=datetime.now().date().replace(month=1, day=1))
     except Exception as e:
         return HttpResponse(f"Formato de fecha inválido: {e}", status=400)
 
     
     try:
-        pacientes_qs = Paciente.objects.filter(
-            usuario__fecha_registro__date__range=[fecha_inicio, fecha_fin]
+        pacientes_filtrados = consulta_reporte(usuario_perfil, 'pacientes', fecha_inicio, fecha_fin)
+        titulo_reporte = _titulo_reporte(
+            usuario_perfil,
+            "Reporte de Pacientes Nuevos (Todos los Grupos)",
+            "Reporte de Pacientes Nuevos - Clínica: ",
+            "Reporte de Pacientes Nuevos (Sin Grupo Asignado)",
         )
 
-        if admin_rol and admin_rol.nombre == 'superAdmin':
-            pacientes_filtrados = pacientes_qs.select_related('usuario').order_by('-usuario__fecha_registro')
-            titulo_reporte = "Reporte de Pacientes Nuevos (Todos los Grupos)"
-        elif admin_grupo:
-            pacientes_filtrados = pacientes_qs.filter(usuario__grupo=admin_grupo).select_related('usuario').order_by('-usuario__fecha_registro')
-            titulo_reporte = f"Reporte de Pacientes Nuevos - Clínica: {admin_grupo.nombre}"
-        else:
-            pacientes_filtrados = Paciente.objects.none() 
-            titulo_reporte = "Reporte de Pacientes Nuevos (Sin Grupo Asignado)"
-
     except Exception as e:
         traceback.print_exc()
         return HttpResponse("Error al consultar la BD (ver consola).", status=500)
 
     try:
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = "Pacientes Nuevos"
-        #encabezado
-        sheet.append(["ID Paciente", "N° Historia Clínica", "Nombre Completo", "Correo", "Teléfono", "Fecha Registro"])
-
-        #datos
-        for paciente in pacientes_filtrados:
-            sheet.append([
-                paciente.id,
-                paciente.numero_historia_clinica,
-                paciente.usuario.nombre,
-                paciente.usuario.correo,
-                paciente.usuario.telefono or '',
-                paciente.usuario.fecha_registro.strftime('%Y-%m-%d %H:%M')
-            ])
-        
-        buffer = BytesIO()
-        workbook.save(buffer)
-        buffer.seek(0)
-        excel_bytes = buffer.read()
-        buffer.close()
-
-        response = HttpResponse(
-            excel_bytes, 
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        filas = (
+            (p.id, p.numero_historia_clinica, p.nombre, p.correo, p.telefono or '', p.fecha_registro.strftime('%Y-%m-%d %H:%M'))
+            for p in filas_reporte(
+                pacientes_filtrados, 'pacientes',
+                ('id', 'numero_historia_clinica', 'nombre', 'correo', 'telefono', 'fecha_registro'),
+                orden=('-usuario__fecha_registro',),
+            )
         )
-        response['Content-Disposition'] = f'attachment; filename="reporte_pacientes_nuevos_{fecha_inicio_str}_a_{fecha_fin_str}.xlsx"'
-        return response
+        columnas = [
+            ("ID Paciente", None),
+            ("N° Historia Clínica", None),
+            ("Nombre Completo", None),
+            ("Correo", None),
+            ("Teléfono", None),
+            ("Fecha Registro", None),
+        ]
+        filename = f'reporte_pacientes_nuevos_{fecha_inicio}_a_{fecha_fin}.xlsx'
+        return respuesta_excel(filename, "Pacientes Nuevos", columnas, filas)
 
     except Exception as e:
         traceback.print_exc()
         return HttpResponse("Error interno generando el Excel. Revisa la consola.", status=500)
     
 
+def _reporte_job_a_dict(request, job):
+    datos = {
+        "job_id": job.id,
+        "tipo": job.tipo,
+        "parametros": job.parametros,
+        "estado": job.estado,
+        "mensaje": job.mensaje,
+        "fecha_creacion": job.fecha_creacion.isoformat(),
+        "fecha_fin": job.fecha_fin.isoformat() if job.fecha_fin else None,
+        "expira": job.expira.isoformat() if job.expira else None,
+        "status_url": request.build_absolute_uri(reverse('reporte_job_detalle', args=[job.id])),
+    }
+    if job.estado == 'COMPLETADO':
+        datos["download_url"] = request.build_absolute_uri(reverse('reporte_job_descargar', args=[job.id]))
+        datos["nombre_archivo"] = job.nombre_archivo
+        datos["tamanio"] = job.tamanio
+    return datos
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def reporte_jobs(request):
+    """
+    POST {tipo, fecha_inicio?, fecha_fin?}: encola el reporte para reportes_worker
+    (202). Un pedido idéntico que todavía no terminó devuelve el mismo job.
+    GET: últimos reportes del usuario.
+    """
+    if request.method == 'GET':
+        jobs = ReporteJob.objects.filter(usuario=request.user)[:20]
+        return Response([_reporte_job_a_dict(request, job) for job in jobs], status=status.HTTP_200_OK)
+
+    tipo = request.data.get('tipo')
+    if tipo not in VISTAS_REPORTE:
+        return Response(
+            {"error": f"Tipo de reporte inválido. Opciones: {', '.join(VISTAS_REPORTE)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if get_usuario_perfil(request) is None:
+        return Response({"error": "Perfil de usuario no encontrado."}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        parametros = normalizar_parametros(request.data)
+    except ParametrosInvalidos as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    job, creado = encolar_reporte(request.user, tipo, parametros)
+    datos = _reporte_job_a_dict(request, job)
+    datos["reutilizado"] = not creado
+    return Response(datos, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reporte_job_detalle(request, job_id):
+    job = ReporteJob.objects.filter(pk=job_id, usuario=request.user).first()
+    if job is None:
+        return Response({"error": "Reporte no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(_reporte_job_a_dict(request, job), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reporte_job_descargar(request, job_id):
+    job = ReporteJob.objects.filter(pk=job_id, usuario=request.user).first()
+    if job is None:
+        return Response({"error": "Reporte no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+    if job.estado == 'EXPIRADO' or (job.expira and job.expira < django_timezone.now()):
+        return Response({"error": "El reporte expiró. Solicítelo nuevamente."}, status=status.HTTP_410_GONE)
+    if job.estado != 'COMPLETADO':
+        return Response({"error": f"El reporte aún no está listo ({job.estado})."}, status=status.HTTP_409_CONFLICT)
+
+    return FileResponse(
+        job.archivo.open('rb'),
+        as_attachment=True,
+        filename=job.nombre_archivo,
+        content_type=job.content_type,
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reportes_cache_estadisticas(request):
+    """Métricas del cache de reportes generados (de este worker)."""
+    usuario_perfil = get_usuario_perfil(request)
+    if not (usuario_perfil and usuario_perfil.rol and usuario_perfil.rol.nombre in ['superAdmin', 'administrador']):
+        return Response({"error": "No tienes permisos."}, status=status.HTTP_403_FORBIDDEN)
+    return Response(cache_reportes.estadisticas(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def exportar_datos(request, recurso, formato):
+    """
+    Exportación completa en CSV o NDJSON, enviada por partes mientras se lee la
+    base (cursor del servidor). Filtros opcionales: fecha_inicio, fecha_fin
+    (AAAA-MM-DD, cada uno por separado) y gzip=1 para comprimir la descarga.
+    """
+    if recurso not in RECURSOS or formato not in CONTENT_TYPES:
+        return Response(
+            {"error": f"Exportación no disponible. Recursos: {', '.join(RECURSOS)}; formatos: {', '.join(CONTENT_TYPES)}."},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    try:
+        usuario_perfil = perfil_reporte(request)
+    except PerfilNoEncontrado:
+        return Response({"error": "Perfil de usuario no encontrado."}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        parametros = normalizar_parametros(request.query_params)
+    except ParametrosInvalidos as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if es_super_admin(usuario_perfil):
+        alcance = "todos"
+    elif usuario_perfil.grupo_id:
+        alcance = str(usuario_perfil.grupo_id)
+    else:
+        alcance = "sin_grupo"
+
+    qs = consulta_reporte(usuario_perfil, recurso, parametros.get('fecha_inicio'), parametros.get('fecha_fin'))
+    # Orden por PK: recorre el índice primario sin ordenar en memoria y el primer bloque sale enseguida
+    nombres = list(RECURSOS[recurso]['columnas'])
+    filas = filas_reporte(qs, recurso, nombres, orden=('id',))
+
+    nombre_archivo = f"{recurso}_{alcance}"
+    if parametros:
+        nombre_archivo += f"_{parametros.get('fecha_inicio', 'inicio')}_a_{parametros.get('fecha_fin', 'hoy')}"
+    comprimir = request.query_params.get('gzip', '').lower() in ('1', 'true', 'si')
+    return respuesta_exportacion(nombre_archivo, formato, nombres, filas, comprimir=comprimir)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def procesar_comando_voz_json(request):
@@ -978,6 +716,36 @@ def procesar_comando_voz_json(request):
         )
     
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def procesar_comandos_voz_json(request):
+    """
+    Versión por lotes de comando_voz: recibe {"textos": [...]} y devuelve
+    {"resultados": [...]} en el mismo orden (cada uno con acción o error).
+    """
+    textos = request.data.get('textos', None)
+    if not isinstance(textos, list) or not textos or not all(isinstance(t, str) for t in textos):
+        return Response(
+            {"error": "Se esperaba 'textos': una lista de textos no vacía."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    maximo = getattr(settings, 'NLP_LOTE_MAXIMO', 200)
+    if len(textos) > maximo:
+        return Response(
+            {"error": f"Demasiados textos ({len(textos)}). Máximo por lote: {maximo}."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        return Response({"resultados": procesar_comandos_voz(textos)}, status=status.HTTP_200_OK)
+    except Exception as e:
+        traceback.print_exc()
+        return Response(
+            {"error": f"Error interno en el servidor NLP: {e}"}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    
+
 # def download_backup_json_zip(request):
 #     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
 #     buf = io.BytesIO()
@@ -1028,95 +796,7 @@ def procesar_comando_voz_json(request):
 
 def download_backup_json_zip(request):
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    buf = io.BytesIO()
-
-    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        # 1) Datos de cada modelo en SQL (1 archivo por modelo)
-        for model in apps.get_models():
-            label = model._meta.label  # p.ej. "app.Modelo"
-            table_name = model._meta.db_table
-            
-            sql_buf = io.StringIO()
-            sql_buf.write(f"-- Backup de {label}\n")
-            sql_buf.write(f"-- Tabla: {table_name}\n\n")
-            
-            # Obtener nombres de columnas
-            fields = [f.column for f in model._meta.fields]
-            columns_str = ", ".join(fields)
-            
-            # Generar INSERTs
-            for row in model.objects.all().values().iterator(chunk_size=1000):
-                values = []
-                for field_name in fields:
-                    value = row.get(field_name)
-                    
-                    # Formatear el valor según su tipo
-                    if value is None:
-                        values.append("NULL")
-                    elif isinstance(value, bool):
-                        values.append("TRUE" if value else "FALSE")
-                    elif isinstance(value, (int, float)):
-                        values.append(str(value))
-                    elif isinstance(value, datetime):
-                        values.append(f"'{value.isoformat()}'")
-                    elif isinstance(value, date):
-                        values.append(f"'{value.isoformat()}'")
-                    else:
-                        # Escapar comillas simples
-                        escaped = str(value).replace("'", "''")
-                        values.append(f"'{escaped}'")
-                
-                values_str = ", ".join(values)
-                sql_buf.write(f"INSERT INTO {table_name} ({columns_str}) VALUES ({values_str});\n")
-            
-            sql_buf.write("\n")
-            zf.writestr(f"{label}.sql", sql_buf.getvalue())
-
-        # 2) Esquema completo (CREATE TABLE statements)
-        with connection.cursor() as cur:
-            cur.execute("""
-                SELECT table_name
-                FROM information_schema.tables
-                WHERE table_schema='public' AND table_type='BASE TABLE'
-                ORDER BY table_name
-            """)
-            tables = [row[0] for row in cur.fetchall()]
-            
-            schema_sql = io.StringIO()
-            schema_sql.write("-- Esquema de la base de datos\n\n")
-            
-            for table in tables:
-                cur.execute(f"""
-                    SELECT column_name, data_type, character_maximum_length, 
-                    is_nullable, column_default
-                    FROM information_schema.columns
-                    WHERE table_name = %s AND table_schema='public'
-                    ORDER BY ordinal_position
-                """, [table])
-                
-                schema_sql.write(f"-- Tabla: {table}\n")
-                for col_name, dtype, max_len, nullable, default in cur.fetchall():
-                    len_str = f"({max_len})" if max_len else ""
-                    null_str = "NULL" if nullable == "YES" else "NOT NULL"
-                    def_str = f" DEFAULT {default}" if default else ""
-                    schema_sql.write(f"--   {col_name}: {dtype}{len_str} {null_str}{def_str}\n")
-                schema_sql.write("\n")
-            
-            zf.writestr("schema.sql", schema_sql.getvalue())
-
-        # 3) Metadatos
-        meta = {
-            "generated_at": ts,
-            "db_name": os.getenv("DB_NAME"),
-            "db_user": os.getenv("DB_USER"),
-            "db_host": os.getenv("DB_HOST"),
-            "db_port": os.getenv("DB_PORT"),
-            "engine": "postgresql (via Django ORM)",
-            "format": "SQL INSERT statements"
-        }
-        zf.writestr("metadata.json", json.dumps(meta, indent=2))
-
-    buf.seek(0)
-    resp = HttpResponse(buf.getvalue(), content_type="application/zip")
+    # El ZIP se arma y se envía por pedazos: la memoria no crece con la base de datos
+    resp = StreamingHttpResponse(generar_backup_sql_zip(ts), content_type="application/zip")
     resp["Content-Disposition"] = f'attachment; filename="backup_sql_{ts}.zip"'
-    return resp
\ No newline at end of file
+    return resp
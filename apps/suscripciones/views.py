@@ -4,7 +4,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated,AllowAny
 from .models import Plan, Suscripcion
 from .serializers import PlanSerializer, SuscripcionSerializer
-from apps.cuentas.models import Usuario
+from apps.cuentas.utils import get_usuario_perfil
 from django.utils import timezone
 from datetime import timedelta
 
@@ -20,22 +20,18 @@ class SuscripcionViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        try:
-            usuario = Usuario.objects.get(correo=self.request.user.email)
-            if usuario.grupo:
-                return Suscripcion.objects.filter(grupo=usuario.grupo)
-        except Usuario.DoesNotExist:
-            pass
+        usuario = get_usuario_perfil(self.request)
+        if usuario and usuario.grupo:
+            return Suscripcion.objects.filter(grupo=usuario.grupo)
         return Suscripcion.objects.none()
     
     def create(self, request, *args, **kwargs):
-        try:
-            usuario = Usuario.objects.get(correo=request.user.email)
-            grupo = usuario.grupo
-            if not grupo:
-                return Response({"detail": "El usuario no pertenece a ninguna clínica."}, status=400)
-        except Usuario.DoesNotExist:
+        usuario = get_usuario_perfil(request)
+        if usuario is None:
             return Response({"detail": "Usuario no encontrado."}, status=400)
+        grupo = usuario.grupo
+        if not grupo:
+            return Response({"detail": "El usuario no pertenece a ninguna clínica."}, status=400)
 
         suscripcion_existente = Suscripcion.objects.filter(grupo=grupo).first()
 
@@ -58,8 +54,8 @@ class SuscripcionViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         
-        usuario = Usuario.objects.get(correo=self.request.user.email)
-        if usuario.grupo:
+        usuario = get_usuario_perfil(self.request)
+        if usuario and usuario.grupo:
             serializer.save(
                 grupo=usuario.grupo,
                 estado='ACTIVA',  
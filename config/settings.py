@@ -128,15 +128,90 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'apps.cuentas.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
 }
 
+# Cache de autenticación por token: compartida (AUTH_TOKEN_CACHE_ALIAS) o, si no hay, LRU por worker.
+# Sin cache compartida, un logout o una suspensión tarda hasta AUTH_TOKEN_CACHE_TTL en
+# llegar a los demás workers (0 = sin cache local)
+AUTH_TOKEN_CACHE_MAXSIZE = int(os.getenv("AUTH_TOKEN_CACHE_MAXSIZE", "2048"))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv("AUTH_TOKEN_CACHE_TTL", "2"))  # segundos
+AUTH_TOKEN_CACHE_ALIAS = os.getenv("AUTH_TOKEN_CACHE_ALIAS")  # alias de CACHES, ej. "default"
+AUTH_TOKEN_CACHE_SHARED_TTL = int(os.getenv("AUTH_TOKEN_CACHE_SHARED_TTL", "300"))
+
+# Business Intelligence: el dashboard lee de los agregados del ETL (False = directo de fact_citas)
+BI_DASHBOARD_USAR_AGREGADOS = os.getenv("BI_DASHBOARD_USAR_AGREGADOS", "True") == "True"
+# Cache de respuestas del dashboard (por clínica + filtros + versión del DataMart)
+BI_DASHBOARD_CACHE_MAXSIZE = int(os.getenv("BI_DASHBOARD_CACHE_MAXSIZE", "256"))
+BI_DASHBOARD_CACHE_TTL = int(os.getenv("BI_DASHBOARD_CACHE_TTL", "900"))  # segundos
+# ETL incremental: margen al leer las marcas de agua (transacciones que confirman tarde)
+BI_ETL_MARGEN_WATERMARK = int(os.getenv("BI_ETL_MARGEN_WATERMARK", "300"))  # segundos
+# Clínicas procesadas en paralelo por el ETL (solo PostgreSQL)
+BI_ETL_PROCESOS = int(os.getenv("BI_ETL_PROCESOS", "4"))
+
+# Reportes en segundo plano (reportes_worker): tiempo que se conserva cada archivo generado
+REPORTES_ARTEFACTO_TTL = int(os.getenv("REPORTES_ARTEFACTO_TTL", "86400"))  # segundos
+# Cache de reportes ya generados (por clínica + fechas + versión de los datos)
+REPORTES_CACHE_MAXSIZE = int(os.getenv("REPORTES_CACHE_MAXSIZE", "64"))
+REPORTES_CACHE_MAX_BYTES = int(os.getenv("REPORTES_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+REPORTES_CACHE_MAX_ARTEFACTO = int(os.getenv("REPORTES_CACHE_MAX_ARTEFACTO", str(16 * 1024 * 1024)))
+REPORTES_CACHE_TTL = int(os.getenv("REPORTES_CACHE_TTL", "3600"))  # segundos
+# Procesos para dibujar PDF grandes en paralelo (1 = todo en el proceso actual). Cada
+# worker de gunicorn mantiene su propio pool: por defecto se reparten los CPU del host
+# entre los workers (WEB_CONCURRENCY), así el total no pasa de la cantidad de CPU
+REPORTES_PDF_PROCESOS = int(os.getenv(
+    "REPORTES_PDF_PROCESOS",
+    str(max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", "1")))),
+))
+
+# Comandos de voz: modelo spaCy (se carga en el primer uso o en el master de gunicorn, ver gunicorn.conf.py)
+NLP_MODELO = os.getenv("NLP_MODELO", "es_core_news_sm")
+# Cache de interpretaciones (texto normalizado -> intención) y tamaño máximo de comando_voz/lote/
+NLP_CACHE_MAXSIZE = int(os.getenv("NLP_CACHE_MAXSIZE", "4096"))
+NLP_LOTE_MAXIMO = int(os.getenv("NLP_LOTE_MAXIMO", "200"))
+# Servicio NLP compartido (manage.py nlp_worker): socket Unix; vacío = modelo en cada worker web
+NLP_SOCKET = os.getenv("NLP_SOCKET") or None
+NLP_SOCKET_TIMEOUT = float(os.getenv("NLP_SOCKET_TIMEOUT", "2"))  # segundos
+# Si el servicio no responde: True = usar el modelo local, False = responder error
+NLP_SOCKET_FALLBACK_LOCAL = os.getenv("NLP_SOCKET_FALLBACK_LOCAL", "True") == "True"
+
 # API Keys
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Cliente de la API de IA (apps/citas_pagos/llm_client.py); en pruebas: GROQ_API_URL=http://127.0.0.1:8765/... (manage.py llm_simulado)
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+LLM_TIMEOUT_CONEXION = float(os.getenv("LLM_TIMEOUT_CONEXION", "5"))  # segundos
+LLM_TIMEOUT_LECTURA = float(os.getenv("LLM_TIMEOUT_LECTURA", "20"))  # segundos
+LLM_POOL_MAXSIZE = int(os.getenv("LLM_POOL_MAXSIZE", "10"))  # conexiones keep-alive por proceso
+# Reintentos ante 429/5xx/errores de red: backoff exponencial con jitter (o Retry-After)
+LLM_REINTENTOS = int(os.getenv("LLM_REINTENTOS", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))  # segundos
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))  # segundos
+# Tope de cada llamada con todos sus reintentos (por debajo del timeout de 30s de los workers de gunicorn)
+LLM_TIEMPO_MAXIMO = float(os.getenv("LLM_TIEMPO_MAXIMO", "25"))  # segundos
+# Circuit breaker: tras N llamadas fallidas seguidas, fallar de inmediato durante X segundos
+LLM_CIRCUITO_UMBRAL = int(os.getenv("LLM_CIRCUITO_UMBRAL", "5"))
+LLM_CIRCUITO_ENFRIAMIENTO = float(os.getenv("LLM_CIRCUITO_ENFRIAMIENTO", "30"))
+# Cache de borradores de informe IA (por clínica + notas + versión del prompt/modelo)
+IA_CACHE_MAXSIZE = int(os.getenv("IA_CACHE_MAXSIZE", "512"))
+IA_CACHE_TTL = int(os.getenv("IA_CACHE_TTL", "3600"))  # segundos
+# Cache compartida de borradores (alias de CACHES, ej. "default"): sin ella cada worker
+# web tiene su propia cache y no ve los borradores que generó ia_worker ni los de otros
+IA_CACHE_ALIAS = os.getenv("IA_CACHE_ALIAS")
+IA_CACHE_LOCAL_TTL = int(os.getenv("IA_CACHE_LOCAL_TTL", "60"))  # segundos en la LRU del proceso, con IA_CACHE_ALIAS
+# Borradores IA en segundo plano (ia_worker): llamadas simultáneas (total y por clínica) y por minuto
+IA_JOBS_CONCURRENCIA = int(os.getenv("IA_JOBS_CONCURRENCIA", "4"))
+IA_JOBS_POR_CLINICA = int(os.getenv("IA_JOBS_POR_CLINICA", "2"))
+IA_JOBS_POR_MINUTO = int(os.getenv("IA_JOBS_POR_MINUTO", "30"))  # cuota del proveedor
+# IA_JOBS_POR_MINUTO solo ritma a ia_worker: generar-reporte-ia y generar-reporte-ia-stream
+# llaman al proveedor desde cada worker web sin esa cuota. Lo que sí las limita es este tope de
+# llamadas simultáneas por worker (las de más reciben 429); en total, hasta
+# WEB_CONCURRENCY x IA_WEB_SIMULTANEAS. Dejar margen en la cuota del proveedor para ellas
+IA_WEB_SIMULTANEAS = int(os.getenv("IA_WEB_SIMULTANEAS", "2"))
+IA_JOBS_RETENCION_HORAS = int(os.getenv("IA_JOBS_RETENCION_HORAS", "24"))
 
 
 # Email
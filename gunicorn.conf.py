@@ -0,0 +1,22 @@
+# gunicorn.conf.py (gunicorn lo lee solo desde el directorio de trabajo)
+import gc
+import os
+
+# La app (y el modelo de spaCy) se carga una vez en el master; los workers se
+# crean con fork y comparten esas páginas de memoria (copy-on-write).
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+# NLP_PRECARGAR=0 deja la carga del modelo para el primer comando de voz de cada worker
+# Con NLP_SOCKET el modelo vive en el proceso de nlp_worker: el master no lo carga
+_precargar_nlp = os.getenv("NLP_PRECARGAR", "1") == "1" and not os.getenv("NLP_SOCKET")
+
+
+def when_ready(server):
+    if not (preload_app and _precargar_nlp):
+        return
+    from apps.reportes.nlp_service import precargar
+
+    if precargar():
+        server.log.info("Modelo NLP precargado en el master.")
+    # Los objetos ya cargados pasan a la generación permanente: el GC de los
+    # workers no los recorre y no ensucia (copia) sus páginas
+    gc.freeze()